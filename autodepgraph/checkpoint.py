@@ -0,0 +1,88 @@
+"""
+Checkpoints of maintenance runs, used to resume a run that was
+interrupted (see AutoDepGraph_DAG.resume).
+
+A checkpoint is a small JSON file with the node maintained in the run, the
+checks and calibrations that were completed with the resulting states and
+the required nodes that were still pending when the checkpoint was written.
+"""
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, Optional
+
+checkpoint_version = 1
+
+
+def new_checkpoint(node: str,
+                   priorities: Optional[Dict[str, float]] = None) -> dict:
+    """
+    Return the checkpoint of a maintenance run that did not start yet.
+
+    Keys:
+        version: version of the checkpoint format
+        node: node maintained in the run
+        priorities: priorities of the run, see maintain_node
+        started, updated: time the run started and the checkpoint was
+            written (ISO format)
+        finished: whether the run finished
+        completed: dicts with the node, action, resulting state, last
+            update of the state and time of every completed check and
+            calibration
+        pending: required nodes that were not known to be good when the
+            checkpoint was written
+    """
+    now = datetime.now().isoformat()
+    return {'version': checkpoint_version, 'node': node,
+            'priorities': dict(priorities or {}), 'started': now,
+            'updated': now, 'finished': False, 'completed': [],
+            'pending': []}
+
+
+def write_checkpoint(filename: str, checkpoint: dict):
+    """
+    Write a checkpoint. The file is replaced atomically, so an interrupted
+    write leaves the previous checkpoint intact.
+    """
+    checkpoint['updated'] = datetime.now().isoformat()
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_name, filename)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def read_checkpoint(filename: str) -> dict:
+    with open(filename) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('version') != checkpoint_version:
+        raise ValueError('Unsupported checkpoint version {}'.format(
+            checkpoint.get('version')))
+    return checkpoint
+
+
+def completed_states(checkpoint: dict, max_age: Optional[float] = None,
+                     timeouts: Optional[Dict[str, float]] = None
+                     ) -> Dict[str, dict]:
+    """
+    Return the last completed action of every node whose result is still
+    valid, i.e. younger than max_age seconds and the timeout of the node.
+    """
+    now = datetime.now()
+    timeouts = timeouts or {}
+    results: Dict[str, dict] = {}
+    for entry in checkpoint['completed']:
+        age = (now - datetime.fromisoformat(entry['time'])).total_seconds()
+        limit = min(timeouts.get(entry['node'], float('inf')),
+                    float('inf') if max_age is None else max_age)
+        if age < limit:
+            results[entry['node']] = entry
+        else:
+            results.pop(entry['node'], None)
+    return results
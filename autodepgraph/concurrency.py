@@ -0,0 +1,138 @@
+"""
+Synchronization primitives that allow several threads to maintain nodes
+of the same graph.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterable, Optional
+
+
+class _NodeLock:
+    """ Reentrant lock that counts the node locks held by each thread """
+    __slots__ = ('_lock', '_owner')
+
+    def __init__(self, owner: 'NodeLocks'):
+        self._lock = threading.RLock()
+        self._owner = owner
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        held = self._owner._held
+        held.count = getattr(held, 'count', 0) + 1
+        return True
+
+    def release(self):
+        self._lock.release()
+        held = self._owner._held
+        held.count -= 1
+        if not held.count and self._owner.on_released is not None:
+            self._owner.on_released()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class NodeLocks:
+    """
+    Lazily created reentrant lock per node.
+
+    Locks on several nodes are acquired in a fixed (topological) order so
+    that threads locking overlapping sets of nodes cannot deadlock.
+
+    Args:
+        on_released: called by a thread when it released the last node
+            lock it held
+    """
+
+    def __init__(self, on_released: Optional[Callable[[], None]] = None):
+        self._lock = threading.Lock()
+        self._locks: Dict[Hashable, _NodeLock] = {}
+        # number of node locks held by each thread
+        self._held = threading.local()
+        self.on_released = on_released
+
+    def __getitem__(self, node) -> _NodeLock:
+        lock = self._locks.get(node, None)
+        if lock is None:
+            with self._lock:
+                lock = self._locks.setdefault(node, _NodeLock(self))
+        return lock
+
+    def held(self) -> int:
+        """ Number of node locks held by the current thread """
+        return getattr(self._held, 'count', 0)
+
+    @contextmanager
+    def acquire(self, nodes: Iterable[Hashable]):
+        """
+        Context manager holding the locks of the nodes. The nodes should
+        be given in topological order.
+        """
+        locks = []
+        try:
+            for node in nodes:
+                lock = self[node]
+                lock.acquire()
+                locks.append(lock)
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+class _Call:
+    def __init__(self):
+        self.owner = threading.get_ident()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls with the same key.
+
+    A thread calling do while another thread executes a call with the same
+    key waits for that call to finish and shares its result (or
+    exception) instead of executing the function itself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def in_flight(self, key) -> bool:
+        return key in self._calls
+
+    def do(self, key, func: Callable):
+        with self._lock:
+            call = self._calls.get(key, None)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            if call.owner == threading.get_ident():
+                # reentrant call from the thread executing the call
+                return func()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
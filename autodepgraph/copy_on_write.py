@@ -0,0 +1,351 @@
+"""
+Copy-on-write mappings used to copy graphs in constant time.
+
+A graph stores its nodes, edges and attributes in VersionedDicts. Taking a
+Snapshot takes constant time, afterwards a VersionedDict saves its contents
+before it is first changed, as long as the snapshot is in use. A
+CopyOnWriteDict reads through to a mapping as it was when the snapshot was
+taken and copies a value when it is first accessed, so changes made to the
+mapping and to the CopyOnWriteDict are not visible in the other. The
+mapping that is copied is not replaced and reading it takes no extra time.
+
+Example:
+    nodes = VersionedDict(A=VersionedDict(state='good'))
+    copy = copy_on_write(nodes, Snapshot(), VersionedDict)
+    nodes['A']['state'] = 'bad'
+    copy['A']['state']  # 'good'
+"""
+import threading
+import weakref
+from collections.abc import MutableMapping
+from typing import Any, Callable, Hashable, Optional
+
+# number of nested copy-on-write layers after which copy_on_write flattens
+# them
+max_depth = 8
+
+
+class _Clock:
+    """ Numbers the snapshots and tracks the ones in use """
+
+    def __init__(self):
+        # changes of versioned mappings and taking snapshots are exclusive
+        self.lock = threading.RLock()
+        self.epoch = 0
+        self.live = set()
+        # weak references to the mappings that saved their contents for a
+        # snapshot by id, mappings are not hashable
+        self.saving = {}
+        # snapshots and mappings that were garbage collected. The garbage
+        # collector can run while the sets above are iterated, so these are
+        # only updated by collect.
+        self.released = []
+        self.dead = []
+
+    def in_use(self, start: int, stop: int) -> bool:
+        """ Whether a snapshot taken after start and up to stop is in use """
+        return any(start < epoch <= stop for epoch in self.live)
+
+    def collect(self):
+        """
+        Forget the snapshots and mappings that were garbage collected,
+        called holding the lock
+        """
+        if self.dead:
+            dead, self.dead = self.dead, []
+            for key in dead:
+                ref = self.saving.get(key)
+                if ref is not None and ref() is None:
+                    del self.saving[key]
+        if self.released:
+            released, self.released = self.released, []
+            self.live.difference_update(released)
+            for key, ref in list(self.saving.items()):
+                mapping = ref()
+                if mapping is not None:
+                    mapping._prune()
+                if mapping is None or mapping._saved is None:
+                    del self.saving[key]
+
+
+_clock = _Clock()
+
+
+class Snapshot:
+    """
+    A point in time, see the module documentation. Versioned mappings save
+    their contents for the snapshot until it is garbage collected.
+    """
+    __slots__ = ('epoch', '__weakref__')
+
+    def __init__(self):
+        with _clock.lock:
+            _clock.collect()
+            _clock.epoch += 1
+            self.epoch = _clock.epoch
+            _clock.live.add(self.epoch)
+        weakref.finalize(self, _clock.released.append, self.epoch)
+
+
+class _Versioned:
+    """
+    Mixin for mappings that save their contents for snapshots taken before
+    they are changed, changes call _before_change first.
+    """
+    __slots__ = ()
+
+    def _init_version(self):
+        # number of the last snapshot taken before the last change
+        self._epoch = _clock.epoch
+        # (start, stop, contents) of the mapping for the snapshots taken
+        # after start and up to stop
+        self._saved = None
+
+    def _before_change(self):
+        if self._epoch != _clock.epoch:
+            self._save()
+
+    def _save(self):
+        with _clock.lock:
+            _clock.collect()
+            epoch = _clock.epoch
+            start = self._epoch
+            if start == epoch:
+                return
+            if _clock.in_use(start, epoch):
+                saved = [s for s in self._saved or ()
+                         if _clock.in_use(*s[:2])]
+                saved.append((start, epoch, self._contents()))
+                self._saved = saved
+                key = id(self)
+                if key not in _clock.saving:
+                    _clock.saving[key] = weakref.ref(
+                        self, lambda ref: _clock.dead.append(key))
+            self._epoch = epoch
+
+    def _prune(self):
+        """ Forget the contents saved for snapshots that are not in use """
+        if self._saved is not None:
+            saved = [s for s in self._saved if _clock.in_use(*s[:2])]
+            self._saved = saved or None
+
+    def _contents(self):
+        """ Return a copy of the mapping that is not changed anymore """
+        raise NotImplementedError
+
+
+def as_of(value: Any, snapshot: Snapshot) -> Any:
+    """
+    Return a versioned mapping as it was when the snapshot was taken,
+    other values are returned as they are
+    """
+    saved = getattr(value, '_saved', None)
+    if saved:
+        epoch = snapshot.epoch
+        for start, stop, contents in saved:
+            if start < epoch <= stop:
+                return contents
+    return value
+
+
+class VersionedDict(_Versioned, dict):
+    """
+    Dict that saves its contents for snapshots before it is changed, see
+    the module documentation. Reading takes no extra time.
+    """
+    __slots__ = ('_epoch', '_saved', '__weakref__')
+
+    def __init__(self, *args, **kwargs):
+        self._init_version()
+        dict.__init__(self, *args, **kwargs)
+
+    def _contents(self):
+        contents = self.__class__.__new__(self.__class__)
+        contents._init_version()
+        dict.update(contents, dict.items(self))
+        return contents
+
+    def __setitem__(self, key, value):
+        if self._epoch != _clock.epoch:
+            self._save()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._before_change()
+        dict.__delitem__(self, key)
+
+    def pop(self, *args):
+        self._before_change()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._before_change()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if not dict.__contains__(self, key):
+            self._before_change()
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self._before_change()
+        dict.update(self, *args, **kwargs)
+
+    def clear(self):
+        self._before_change()
+        dict.clear(self)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def copy(self):
+        return self.__class__(dict.items(self))
+
+    def __reduce__(self):
+        # the saved contents are not pickled
+        return self.__class__, (dict(dict.items(self)), )
+
+
+class CopyOnWriteDict(_Versioned, MutableMapping):
+    """
+    Mapping reading through to a base mapping as it was when a snapshot
+    was taken.
+
+    A value of the base mapping is copied using copy_value when it is
+    first accessed, values that are set or deleted only affect this
+    mapping. The base mapping can still be changed if it is versioned,
+    see the module documentation.
+
+    Args:
+        base: mapping to read through to
+        snapshot: the snapshot taken before
+        copy_value: function copying a value, None if values are immutable
+    """
+    __slots__ = ('_base', '_snapshot', '_copy_value', '_own', '_deleted',
+                 '_added', 'depth', '_epoch', '_saved', '__weakref__')
+
+    def __init__(self, base, snapshot: Snapshot,
+                 copy_value: Optional[Callable[[Any], Any]] = None):
+        self._base = base
+        self._snapshot = snapshot
+        self._copy_value = copy_value
+        self._own: dict = {}
+        self._deleted: set = set()
+        # number of keys in _own that are not in the base
+        self._added = 0
+        self.depth = (base.depth + 1 if isinstance(base, CopyOnWriteDict)
+                      else 1)
+        self._init_version()
+
+    def _contents(self):
+        contents = CopyOnWriteDict(self._base, self._snapshot,
+                                   self._copy_value)
+        contents._own = dict(self._own)
+        contents._deleted = set(self._deleted)
+        contents._added = self._added
+        return contents
+
+    def _base_as_of(self):
+        # called holding _clock.lock, so the base is not saved meanwhile
+        return as_of(self._base, self._snapshot)
+
+    def _lookup(self, key):
+        """ Return a value without copying it """
+        if key in self._own:
+            return self._own[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        with _clock.lock:
+            base = self._base_as_of()
+            if isinstance(base, CopyOnWriteDict):
+                value = base._lookup(key)
+            else:
+                value = base[key]
+            return as_of(value, self._snapshot)
+
+    def __getitem__(self, key):
+        if key in self._own:
+            return self._own[key]
+        value = self._lookup(key)
+        if self._copy_value is not None:
+            value = self._copy_value(value)
+            self._before_change()
+            self._own[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        with _clock.lock:
+            self._before_change()
+            if key not in self._own and key not in self._base_as_of():
+                self._added += 1
+            self._own[key] = value
+            self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        with _clock.lock:
+            if key not in self:
+                raise KeyError(key)
+            self._before_change()
+            if key in self._base_as_of():
+                self._deleted.add(key)
+            else:
+                self._added -= 1
+            self._own.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        if key in self._own:
+            return True
+        if key in self._deleted:
+            return False
+        with _clock.lock:
+            return key in self._base_as_of()
+
+    def __iter__(self):
+        with _clock.lock:
+            base = self._base_as_of()
+            keys = [key for key in base if key not in self._deleted]
+            keys.extend(key for key in self._own if key not in base)
+        return iter(keys)
+
+    def __len__(self) -> int:
+        with _clock.lock:
+            return (len(self._base_as_of()) - len(self._deleted) +
+                    self._added)
+
+    def __repr__(self) -> str:
+        return '{}({!r})'.format(type(self).__name__, self._flatten())
+
+    def _flatten(self) -> dict:
+        with _clock.lock:
+            return {key: self._lookup(key) for key in self}
+
+    def __reduce__(self):
+        # pickled and copied as VersionedDicts
+        return VersionedDict, (self._flatten(), )
+
+
+def copy_on_write(mapping, snapshot: Snapshot,
+                  copy_value: Optional[Callable[[Any], Any]] = None
+                  ) -> CopyOnWriteDict:
+    """
+    Return a copy-on-write copy of a mapping as it was when the snapshot
+    was taken. Takes constant time, except when more than max_depth layers
+    are nested, in which case the layers are flattened.
+
+    Args:
+        mapping: mapping to copy, changes made to it after the snapshot
+            are only isolated from the copy if it is versioned
+        snapshot: the snapshot taken before
+        copy_value: function copying a value, None if values are immutable
+    """
+    if isinstance(mapping, CopyOnWriteDict) and mapping.depth >= max_depth:
+        with _clock.lock:
+            mapping = as_of(mapping, snapshot)._flatten()
+    return CopyOnWriteDict(mapping, snapshot, copy_value)
+
+
+def is_shared(mapping: Any, key: Hashable) -> bool:
+    """ Whether the value of key is still read through to the base """
+    return (isinstance(mapping, CopyOnWriteDict) and key in mapping and
+            key not in mapping._own)
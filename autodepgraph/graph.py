@@ -1,7 +1,7 @@
 import logging
 import numpy as np
 import types
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from datetime import datetime
 import matplotlib.pyplot as plt
 from os.path import join, split
@@ -9,11 +9,26 @@ import os
 import tempfile
 import webbrowser
 import warnings
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 
 import networkx as nx
 import autodepgraph
 from autodepgraph.visualization import state_cmap
 from autodepgraph import visualization as vis
+from autodepgraph.history import GraphHistory
+from autodepgraph.indexing import (NodeIndex, function_instrument,
+                                   node_instruments, timestamp)
+from autodepgraph.concurrency import NodeLocks, SingleFlight
+from autodepgraph.live_viewer import LiveViewer
+from autodepgraph.node_attributes import NodeAttributes
+from autodepgraph.copy_on_write import (Snapshot, VersionedDict, as_of,
+                                        copy_on_write)
+from autodepgraph.hashing import hashed_attributes, merkle_hash
+from autodepgraph.checkpoint import (completed_states, new_checkpoint,
+                                     read_checkpoint, write_checkpoint)
 
 # Used to find functions in modules
 from importlib import import_module
@@ -34,14 +49,102 @@ class AutoDepGraph_DAG(nx.DiGraph):
             Properties passed to networkx plotting of edges
         matplotlib_label_properties:
             Properties passed to networkx plotting of labels
+        default_retry_policy:
+            Retry policy used for nodes that do not specify a
+            'retry_policy' attribute, see set_retry_policy
+        cfg_fault_localisation:
+            Strategy used to find broken dependencies of a "bad" node,
+            either 'exhaustive' or 'bisect', see maintain_node
+        cfg_check_order:
+            Order in which required nodes are visited, either 'insertion'
+            or 'fail_fast', see _ordered_dependencies
+        cfg_stats_smoothing:
+            Weight of the latest duration in the moving average of durations
+        cfg_default_duration:
+            Duration in seconds assumed for nodes without statistics
+        cfg_history_length:
+            Number of checks and calibrations remembered per node in the
+            history, see autodepgraph.history.GraphHistory
+        cfg_adaptive_timeouts:
+            If True the timeout of nodes is estimated from the drift of
+            their check values, see estimate_timeout. The estimate is
+            stored in the 'adaptive_timeout_value' attribute and used
+            instead of the 'timeout' attribute. Can be overridden per node
+            using the 'adaptive_timeout' attribute.
+        cfg_timeout_min, cfg_timeout_max:
+            Bounds in seconds on adaptive timeouts for nodes that do not
+            specify 'timeout_min' and 'timeout_max' attributes
+        cfg_timeout_safety:
+            Fraction of the expected time until a node drifts out of
+            tolerance used as adaptive timeout
+        cfg_drift_window:
+            Number of checks used to estimate the drift of a node
+        cfg_drift_sigma:
+            Number of standard errors added to the estimated drift, making
+            adaptive timeouts robust against noisy check values
+        node_function_backend:
+            If not None, check and calibration functions are called through
+            this object, see autodepgraph.replay
+        cfg_speculation_threshold:
+            Failure probability above which nodes are calibrated while they
+            are checked, None disables speculative calibration. Lower
+            values are more aggressive, see maintain_node.
+        cfg_speculation_workers:
+            Number of speculative calibrations that can run at once
+        last_run_report:
+            Report of the last maintenance run, see new_run_report
+        cfg_checkpoint_file:
+            If not None, maintenance runs write checkpoints to this file
+            that are used to resume interrupted runs, see resume. Runs in
+            different threads write to the same file.
+        cfg_checkpoint_interval:
+            Minimum time in seconds between writing checkpoints
+        cfg_group_by_setup:
+            If True required nodes that share an instrument configuration
+            are visited one after the other, see node_setup and
+            _ordered_dependencies
 
     """
     node_states: List[str] = ['good', 'needs calibration',
                               'bad', 'unknown', 'active']
+    # node attribute dicts provide default attributes without storing them
+    node_attr_dict_factory = NodeAttributes
+    # the dicts holding the nodes and edges save their contents before they
+    # are changed while copies of the graph refer to them, see copy
+    node_dict_factory = VersionedDict
+    adjlist_outer_dict_factory = VersionedDict
+    adjlist_inner_dict_factory = VersionedDict
+    edge_attr_dict_factory = VersionedDict
     matplotlib_edge_properties: Dict[str, Any] = {'edge_color': 'k', 'alpha': .8}
     matplotlib_label_properties: Dict[str, Any] = {'font_color': 'k'}
-
-    def __init__(self, name, cfg_plot_mode='svg',
+    default_retry_policy: Dict[str, Optional[float]] = {
+        'max_attempts': None, 'backoff': 0, 'backoff_factor': 2,
+        'failure_threshold': np.inf, 'failure_window': 3600, 'cooldown': 600}
+    cfg_fault_localisation: str = 'exhaustive'
+    cfg_check_order: str = 'fail_fast'
+    cfg_stats_smoothing: float = .2
+    cfg_default_duration: float = 1.0
+    cfg_history_length: int = 100
+    cfg_adaptive_timeouts: bool = False
+    cfg_timeout_min: float = 60
+    cfg_timeout_max: float = 24*3600
+    cfg_timeout_safety: float = .8
+    cfg_drift_window: int = 10
+    cfg_drift_sigma: float = 2
+    history: Optional[GraphHistory] = None
+    node_function_backend = None
+    cfg_speculation_threshold: Optional[float] = None
+    cfg_speculation_workers: int = 2
+    last_run_report: Optional[dict] = None
+    cfg_checkpoint_file: Optional[str] = None
+    cfg_checkpoint_interval: float = 10.
+    cfg_group_by_setup: bool = True
+    _indexes: Optional[Dict[str, NodeIndex]] = None
+    # cached node hashes without and with node names, see node_hash
+    _hashes: Optional[Dict[bool, dict]] = None
+    _state_listeners: Optional[List[Callable]] = None
+
+    def __init__(self, name='', cfg_plot_mode='svg',
                  incoming_graph_data=None, **attr):
         """
         Directed Acyclic Graph used for calibrations.
@@ -54,6 +157,8 @@ class AutoDepGraph_DAG(nx.DiGraph):
         attr['name'] = name
         self.cfg_plot_mode = cfg_plot_mode
         self.cfg_plot_mode_args = {'fig': None}
+        # synchronization between threads using the graph
+        self._init_locks()
 
         super().__init__(incoming_graph_data, **attr)
 
@@ -66,6 +171,90 @@ class AutoDepGraph_DAG(nx.DiGraph):
         self._exec_cnt = 0
         self._calib_cnt = 0
         self._check_cnt = 0
+        self._batch_check_cnt = 0
+
+        # results of checks and calibrations
+        self.history = GraphHistory(self.cfg_history_length, self.node_states)
+
+    def _init_locks(self):
+        # the monitor is updated once a thread holds no node locks
+        self._node_locks = NodeLocks(on_released=self._update_pending_monitor)
+        # deduplicates concurrent maintain_node calls for the same node
+        self._maintenance_calls = SingleFlight()
+        # guards the indexes and hashes, and changes of the node states
+        # while the graph is copied
+        self._index_lock = threading.RLock()
+        self._monitor_lock = threading.RLock()
+        # holds the transaction of each thread
+        self._local = threading.local()
+        # runs speculative calibrations, created when needed
+        self._speculation_pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in ['_node_locks', '_maintenance_calls', '_index_lock',
+                     '_monitor_lock', '_state_listeners', '_local',
+                     'node_function_backend', '_speculation_pool',
+                     '_live_viewer']:
+            state.pop(attr, None)
+        # locks and the maintenance methods are recreated when loading
+        for attr, value in self.__dict__.items():
+            if (attr.startswith('maintain_') and
+                    getattr(value, '__qualname__', '').endswith(
+                        '<locals>._construct_maintenance_method')):
+                del state[attr]
+        return state
+
+    def _copy_state(self) -> Tuple[type, dict]:
+        """ Return the type of a copy of the graph and its state """
+        return self.__class__, self.__getstate__()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_locks()
+        # maintenance methods are provided by __getattr__
+        for attr, value in state.items():
+            if (attr.startswith('maintain_') and
+                    value is _construct_maintenance_method):
+                del self.__dict__[attr]
+
+    def __getattr__(self, name):
+        # provides maintain_<node> helper methods for quick access, spaces
+        # and dashes in node names are replaced by underscores
+        if name.startswith('maintain_'):
+            node = self._maintenance_method_node(name[len('maintain_'):])
+            if node is not None:
+                return lambda: self.maintain_node(node)
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+            type(self).__name__, name))
+
+    def __dir__(self):
+        return list(super().__dir__()) + [
+            'maintain_{}'.format(_method_suffix(n)) for n in self._node
+            if isinstance(n, str)]
+
+    def _maintenance_method_node(self, suffix):
+        nodes = self._node
+        if suffix in nodes:
+            return suffix
+        for node in nodes:
+            if isinstance(node, str) and _method_suffix(node) == suffix:
+                return node
+        return None
+
+    def locked(self, nodes):
+        """
+        Context manager holding the locks of the specified nodes. Locks are
+        acquired in topological order to avoid deadlocks between threads.
+
+        Example:
+            with dag.locked(['A', 'B']):
+                dag.set_node_state('A', 'good')
+                dag.set_node_state('B', 'good')
+        """
+        nodes = set(nodes)
+        return self._node_locks.acquire(
+            [n for n in nx.topological_sort(self) if n in nodes])
 
     @property
     def cfg_svg_filename(self):
@@ -79,6 +268,147 @@ class AutoDepGraph_DAG(nx.DiGraph):
         return AutoDepGraph_DAG(name=self.name,
                                 cfg_plot_mode=self.cfg_plot_mode)
 
+    def copy(self, as_view=False):
+        """
+        Return a copy of the graph, or a read-only view if as_view is True
+        (see subgraph).
+
+        The copy is made in constant time without calling add_node, so
+        states and timestamps are preserved. The copy reads the node
+        attribute and adjacency dicts of the graph as they were when it was
+        made and copies a dict when it is first accessed, see
+        autodepgraph.copy_on_write. The graph keeps its dicts, a dict of
+        the graph is copied before it is first changed after copying.
+        Attribute values themselves are shared, so mutable values should be
+        replaced instead of modified in place, as the methods of the graph
+        do.
+
+        The copy gets copies of the history, indexes and cached hashes,
+        but no state listeners or node function backend. Copying a view
+        copies the nodes of the view, which takes time proportional to the
+        size of the view.
+        """
+        if as_view:
+            return self._view()
+        graph_type, state = self._copy_state()
+        is_view = self._root_graph() is not self
+        if is_view:
+            # views replace the methods changing the graph by frozen
+            for attr, value in list(state.items()):
+                if (attr in ['_graph', 'frozen'] or
+                        value is nx.classes.function.frozen):
+                    del state[attr]
+            copy_edges = _EdgeDataCopier()
+            state['_node'] = VersionedDict(
+                (n, _copy_node_attrs(node_attrs))
+                for n, node_attrs in self._node.items())
+            state['_succ'] = VersionedDict(
+                (n, copy_edges(nbrs)) for n, nbrs in self._succ.items())
+            state['_pred'] = VersionedDict(
+                (n, copy_edges(nbrs)) for n, nbrs in self._pred.items())
+            state['_hashes'] = None
+            if self._indexes:
+                state['_indexes'] = {
+                    name: NodeIndex(index.name, index.key, index.attributes)
+                    for name, index in self._indexes.items()}
+        else:
+            # the methods changing the node attributes hold the index lock,
+            # so the copy does not see partial changes
+            with self._index_lock:
+                snapshot = Snapshot()
+                # edge data dicts are in the rows of _succ and _pred, they
+                # are copied once so they stay shared between the rows
+                copy_edges = _EdgeDataCopier(snapshot)
+                state['_node'] = copy_on_write(self._node, snapshot,
+                                               _copy_node_attrs)
+                state['_succ'] = copy_on_write(self._succ, snapshot,
+                                               copy_edges)
+                state['_pred'] = copy_on_write(self._pred, snapshot,
+                                               copy_edges)
+                if self._indexes:
+                    state['_indexes'] = {name: index.copy() for name, index
+                                         in self._indexes.items()}
+                if self._hashes:
+                    state['_hashes'] = {names: dict(hashes) for
+                                        names, hashes in self._hashes.items()}
+        state['_adj'] = state['_succ']
+        for attr in list(state):
+            if _cached_view(type(self), attr):
+                del state[attr]
+        state['__networkx_cache__'] = {}
+        state['graph'] = dict(self.graph)
+        state['cfg_plot_mode_args'] = dict(self.cfg_plot_mode_args)
+        state['_DiGraphWindow'] = None
+        if self.history is not None:
+            state['history'] = self.history.copy()
+
+        graph = graph_type.__new__(graph_type)
+        graph.__setstate__(state)
+        if is_view and graph._indexes:
+            for index in graph._indexes.values():
+                index.rebuild(graph)
+        return graph
+
+    def subgraph(self, nodes):
+        """
+        Return a read-only view of the subgraph induced by nodes.
+
+        Nothing is copied: the view refers to the node attributes of the
+        graph and shares its locks, history, indexes, hashes and state
+        listeners, so maintain_node and the drawing methods can be used on
+        the view and state changes are visible in the graph. Nodes and
+        edges can not be added to or removed from a view. Node hashes of a
+        view include dependencies hidden by the view.
+        """
+        return self._view(nx.filters.show_nodes(self.nbunch_iter(nodes)))
+
+    def dependency_view(self, node):
+        """
+        Return a read-only view of a node and its (transitive)
+        dependencies, see subgraph.
+
+        Example:
+            view = dag.dependency_view('CZ q0-q1')
+            view.draw_svg()
+            view.maintain_node('CZ q0-q1')
+        """
+        nodes = nx.descendants(self, node)
+        nodes.add(node)
+        return self.subgraph(nodes)
+
+    def _view(self, filter_node=nx.filters.no_filter):
+        # lazily created containers are created now so they are shared
+        if self._indexes is None:
+            self._indexes = {}
+        if self._hashes is None:
+            self._hashes = {False: {}, True: {}}
+        if self._state_listeners is None:
+            self._state_listeners = []
+
+        view = self.__class__.__new__(self.__class__)
+        view.__dict__.update(
+            (attr, value) for attr, value in self.__dict__.items()
+            if attr not in _graph_structure and
+            not _cached_view(type(self), attr))
+        view.__networkx_cache__ = {}
+        view._graph = self
+        view.graph = self.graph
+        view._node = nx.coreviews.FilterAtlas(self._node, filter_node)
+        view._succ = nx.coreviews.FilterAdjacency(
+            self._succ, filter_node, nx.filters.no_filter)
+        view._pred = nx.coreviews.FilterAdjacency(
+            self._pred, filter_node, nx.filters.no_filter)
+        view._adj = view._succ
+        nx.freeze(view)
+        return view
+
+    def _root_graph(self) -> 'AutoDepGraph_DAG':
+        """ Return the graph a view refers to, or the graph itself """
+        graph = self
+        while '_graph' in graph.__dict__:
+            graph = graph._graph
+        return graph
+
     def add_node(self, node_for_adding, **attr):
         """
         Adds a node to the graph, including starting attributes.
@@ -92,37 +422,33 @@ class AutoDepGraph_DAG(nx.DiGraph):
             timeout     (float) = np.inf
             state       (str)   = 'unknown'
 
+        Nodes with a 'batch_check_function' attribute are checked in
+        batches, see check_node.
         """
-        # there are set here to ensure these node attributes exist.
-        # setting in this way will most likely interfere
-        # with joining multiple graphs
-        attr['timeout'] = attr.get('timeout',
-                                   np.inf)
-        attr['calibrate_function'] = attr.get(
-            'calibrate_function',
-            'autodepgraph.node_functions.calibration_functions' +
-            '.NotImplementedCalibration')
-
-        attr['check_function'] = attr.get(
-            'check_function',
-            'autodepgraph.node_functions.check_functions' +
-            '.return_fixed_value')
-
-        # zero default tolerance -> always recalibrate
-        attr['tolerance'] = attr.get('tolerance', 0)
+        self._check_no_transaction('add_node')
+        # Default attributes are not stored per node, they are provided by
+        # the node attribute dict (see autodepgraph.node_attributes)
+        defaults = self.node_attr_dict_factory.defaults
+        for key in ['calibrate_function', 'check_function', 'tolerance',
+                    'timeout']:
+            if key in attr and _equals_default(attr[key], defaults[key]):
+                del attr[key]
+                if node_for_adding in self._node:
+                    # an existing node returns to the default
+                    self._node[node_for_adding].pop(key, None)
         super().add_node(node_for_adding, **attr)
 
         self.set_node_state(node_for_adding,
                             state=attr.get('state', 'unknown'))
-        # this adds a helper method to the attributes for quick access
-        self._construct_maintenance_methods(nodes=[node_for_adding])
+        self._update_indexes(node_for_adding)
+        self._invalidate_hashes(node_for_adding)
 
     def _construct_maintenance_methods(self, nodes):
         for n in nodes:
             self._construct_maintenance_method(node_name=n)
 
     def _construct_maintenance_method(self, node_name):
-        node_name_no_space = node_name.replace(' ', '_').replace('-', '_')
+        node_name_no_space = _method_suffix(node_name)
 
         # This name exists so that text based storing falls back
         # on the right placeholder function
@@ -138,27 +464,398 @@ class AutoDepGraph_DAG(nx.DiGraph):
         u_of_edge -> v_of_edge denotes that u depends on v.
         """
 
+        self._check_no_transaction('add_edge')
         # Nodes must already exist to ensure they have the right properties
         if u_of_edge not in self.nodes():
             raise KeyError('{} not in nodes'.format(u_of_edge))
         if v_of_edge not in self.nodes():
             raise KeyError('{} not in nodes'.format(v_of_edge))
         super().add_edge(u_of_edge, v_of_edge, **attr)
-
-    def get_node_state(self, node_name):
+        self._invalidate_hashes(u_of_edge)
+
+    def remove_edge(self, u, v):
+        self._check_no_transaction('remove_edge')
+        super().remove_edge(u, v)
+        self._invalidate_hashes(u)
+
+    def remove_node(self, n):
+        self._check_no_transaction('remove_node')
+        if n in self._node:
+            self._invalidate_hashes(n)
+        super().remove_node(n)
+        if self._indexes:
+            for index in self._indexes.values():
+                index.remove(n)
+
+    def remove_nodes_from(self, nodes):
+        self._check_no_transaction('remove_nodes_from')
+        nodes = list(nodes)
+        for n in nodes:
+            if n in self._node:
+                self._invalidate_hashes(n)
+        super().remove_nodes_from(nodes)
+        if self._indexes:
+            for index in self._indexes.values():
+                for n in nodes:
+                    index.remove(n)
+
+    def node_timeout(self, node_name) -> float:
+        """
+        Time in seconds after which the state of a node expires: its
+        adaptive timeout if it uses adaptive timeouts (see
+        cfg_adaptive_timeouts) and it was estimated, otherwise its
+        'timeout' attribute.
+        """
+        node_attrs = self.nodes[node_name]
+        if self._uses_adaptive_timeout(node_name):
+            timeout = node_attrs.get('adaptive_timeout_value', None)
+            if timeout is not None:
+                return timeout
+        return node_attrs['timeout']
+
+    def _state_expired(self, node_name):
         Delta_T = (datetime.now() -
                    self.nodes[node_name]['last_update']).total_seconds()
-        if (Delta_T > self.nodes[node_name]['timeout']):
-            self.nodes[node_name]['state'] = 'unknown'
+        return (Delta_T > self.node_timeout(node_name) and
+                self.nodes[node_name]['state'] != 'unknown')
+
+    def _current_state(self, node_name) -> str:
+        """
+        State of a node taking its timeout into account, without expiring
+        the state. Used when drawing, which should not wait for node locks.
+        """
+        if self._state_expired(node_name):
+            return 'unknown'
+        return self.nodes[node_name]['state']
+
+    def get_node_state(self, node_name):
+        changes = self._transaction_changes(node_name)
+        if 'state' in changes:
+            return changes['state']
+        # reading does not require a lock, only expiring the state does
+        if self._state_expired(node_name):
+            with self._node_locks[node_name]:
+                if self._state_expired(node_name):
+                    with self._index_lock:
+                        self.nodes[node_name]['state'] = 'unknown'
+                        self._update_indexes(node_name, 'state')
+                    self._notify_state_listeners(node_name)
         return self.nodes[node_name]['state']
 
     def set_node_state(self, node_name, state, update_monitor=True):
         if state not in self.node_states:
             raise IndexError(f'state {state} not in {self.node_states}')
-        self.nodes[node_name]['state'] = state
-        self.nodes[node_name]['last_update'] = datetime.now()
+        transaction = self._active_transaction()
+        if transaction is not None:
+            if node_name not in self.nodes:
+                raise KeyError(node_name)
+            transaction.setdefault(node_name, {}).update(
+                state=state, last_update=datetime.now())
+            return
+        with self._node_locks[node_name]:
+            with self._index_lock:
+                node_attrs = self.nodes[node_name]
+                node_attrs['state'] = state
+                node_attrs['last_update'] = datetime.now()
+                self._update_indexes(node_name, 'state')
+            self._notify_state_listeners(node_name)
         if update_monitor:
-            self.update_monitor()
+            self._request_monitor_update()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager that buffers the changes made by set_node_state,
+        set_node_attribute and set_node_description in the current thread.
+
+        The changes are applied at once when the context exits, holding the
+        locks of all changed nodes and updating the monitor a single time.
+        If an exception occurs the changes are discarded. Within the
+        transaction get_node_state and get_node_attribute return the
+        buffered values. Nested transactions are part of the outermost
+        transaction. Nodes and edges can not be added or removed within a
+        transaction.
+
+        Example:
+            with dag.transaction():
+                for node in nodes:
+                    dag.set_node_state(node, 'needs calibration')
+        """
+        transaction = self._active_transaction()
+        if transaction is not None:
+            yield
+            return
+        self._local.transaction = {}
+        try:
+            yield
+            changes = self._local.transaction
+        finally:
+            self._local.transaction = None
+        self._apply_changes(changes)
+
+    def _active_transaction(self) -> Optional[Dict[str, dict]]:
+        return getattr(self._local, 'transaction', None)
+
+    def _transaction_changes(self, node_name) -> dict:
+        transaction = self._active_transaction()
+        if transaction is None:
+            return {}
+        return transaction.get(node_name, {})
+
+    def _apply_changes(self, changes: Dict[str, dict]):
+        """ Apply the changes of a transaction """
+        if not changes:
+            return
+        missing = object()
+        with self.locked(changes):
+            with self._index_lock:
+                previous = {node: {attr: self.nodes[node].get(attr, missing)
+                                   for attr in attrs}
+                            for node, attrs in changes.items()}
+                try:
+                    for node, attrs in changes.items():
+                        self.nodes[node].update(attrs)
+                except BaseException:
+                    for node, attrs in previous.items():
+                        for attr, value in attrs.items():
+                            if value is missing:
+                                self.nodes[node].pop(attr, None)
+                            else:
+                                self.nodes[node][attr] = value
+                    raise
+                for node, attrs in changes.items():
+                    self._update_indexes(node)
+                    if not set(attrs).isdisjoint(hashed_attributes):
+                        self._invalidate_hashes(node)
+            for node, attrs in changes.items():
+                if 'state' in attrs:
+                    self._notify_state_listeners(node)
+        self._request_monitor_update()
+
+    def add_state_listener(self, callback: Callable):
+        """
+        Register a function that is called as callback(node, state,
+        last_update) whenever the state of a node changes. Callbacks are
+        called while holding the lock of the node and should return
+        quickly.
+        """
+        if self._state_listeners is None:
+            self._state_listeners = []
+        self._state_listeners.append(callback)
+
+    def remove_state_listener(self, callback: Callable):
+        """ Remove a callback added using add_state_listener """
+        self._state_listeners.remove(callback)
+
+    def _notify_state_listeners(self, node_name):
+        if self._state_listeners:
+            node_attrs = self.nodes[node_name]
+            for callback in list(self._state_listeners):
+                try:
+                    callback(node_name, node_attrs['state'],
+                             node_attrs['last_update'])
+                except Exception as e:
+                    logging.warning('State listener failed: {}'.format(e))
+
+    def add_index(self, name: str, attribute: Optional[str] = None,
+                  key=None):
+        """
+        Add a secondary index used by query. Indexes are kept up to date by
+        add_node, set_node_state, set_node_attribute and
+        set_node_description.
+
+        Args:
+            name: name of the index, used as keyword in query
+            attribute: node attribute to index, defaults to name. The
+                name 'instrument' without attribute or key indexes the
+                instruments used by the calibrate and check functions.
+            key: optional function returning the keys of a node given its
+                attribute dict, overrides attribute
+        """
+        if key is not None:
+            index = NodeIndex(name, key)
+        elif name == 'instrument' and attribute is None:
+            index = NodeIndex.for_instruments()
+        elif (name if attribute is None else attribute) == 'state':
+            index = NodeIndex.for_state()
+            index.name = name
+        else:
+            index = NodeIndex.for_attribute(
+                name if attribute is None else attribute)
+            index.name = name
+        index.rebuild(self)
+        if self._indexes is None:
+            self._indexes = {}
+        self._indexes[name] = index
+
+    def remove_index(self, name: str):
+        """ Remove the index added using add_index """
+        del self._indexes[name]
+
+    def _update_indexes(self, node_name, attribute: Optional[str] = None):
+        if self._indexes:
+            node_attrs = self.nodes[node_name]
+            with self._index_lock:
+                for index in self._indexes.values():
+                    if index.depends_on(attribute):
+                        index.update(node_name, node_attrs)
+
+    def query(self, **criteria) -> set:
+        """
+        Return the nodes matching all criteria.
+
+        Criteria with an index (see add_index) are resolved by
+        intersecting the indexes, starting with the smallest. Other
+        criteria are compared against the node attributes of the remaining
+        candidates. Nodes whose state timed out are set to 'unknown'
+        before an index on the states is used, the index keeps the
+        deadlines of the states so only these nodes are visited. Like the
+        indexes, the deadlines are not updated by changes made directly to
+        the node attribute dicts.
+
+        Example:
+            dag.add_index('state')
+            dag.add_index('qubit')
+            dag.query(qubit='Q2', state='needs calibration')
+        """
+        indexes = self._indexes or {}
+        for name in criteria:
+            if name in indexes:
+                self._expire_states(indexes[name])
+        indexed = sorted(
+            (indexes[name].lookup(value) for name, value in criteria.items()
+             if name in indexes), key=len)
+        if indexed:
+            result = set(indexed[0])
+            for nodes in indexed[1:]:
+                result.intersection_update(nodes)
+                if not result:
+                    return result
+            if self._root_graph() is not self:
+                # indexes are shared with the graph a view refers to
+                result = {n for n in result if n in self._node}
+        else:
+            result = set(self.nodes())
+
+        for name, value in criteria.items():
+            if name in indexes:
+                continue
+            if name == 'state':
+                result = {n for n in result if self.get_node_state(n) == value}
+            else:
+                result = {n for n in result if
+                          self.nodes[n].get(name, None) == value}
+        return result
+
+    def _expire_states(self, index: NodeIndex):
+        """
+        Expire the states of the nodes whose deadline in a state index
+        passed, so that they are indexed as 'unknown'
+        """
+        with self._index_lock:
+            nodes = index.expired(timestamp(datetime.now()))
+        if not nodes:
+            return
+        # indexes are shared with the graph a view refers to
+        graph = self._root_graph()
+        for n in nodes:
+            if n in graph._node:
+                graph.get_node_state(n)
+        with self._index_lock:
+            for n in nodes:
+                if n not in graph._node:
+                    continue
+                node_attrs = graph._node[n]
+                if node_attrs['state'] != 'unknown':
+                    # the shorter of the timeouts does not apply
+                    timeout = graph.node_timeout(n)
+                    index.postpone(n, None if timeout == np.inf else
+                                   timestamp(node_attrs['last_update']) +
+                                   timeout)
+
+    def node_hash(self, node, names: bool = False) -> str:
+        """
+        Merkle hash of a node and its (transitive) dependencies, based on
+        the functions, tolerance and timeout of the nodes (see
+        autodepgraph.hashing). Nodes with the same hash have identical
+        sub-DAGs, which can be detected by comparing the hashes.
+
+        Hashes are cached and invalidated for the node and the nodes that
+        depend on it by add_node, add_edge, remove_edge, remove_node and
+        set_node_attribute. Changes made directly to the node attribute
+        dicts are not tracked.
+
+        Args:
+            node: name of the node
+            names: if True the names of the nodes are part of the hash
+        """
+        with self._index_lock:
+            hashes = self._node_hashes(names)
+            if node not in hashes:
+                self._compute_hashes(node, hashes, names)
+            return hashes[node]
+
+    def graph_hash(self, names: bool = False) -> str:
+        """ Hash of the whole graph, see node_hash """
+        with self._index_lock:
+            hashes = self._node_hashes(names)
+            # the graph hash is cached as the hash of node None, the hashes
+            # of views are not cached
+            is_view = self._root_graph() is not self
+            if None in hashes and not is_view:
+                return hashes[None]
+            roots = [n for n in self if self.in_degree(n) == 0]
+            for root in roots:
+                if root not in hashes:
+                    self._compute_hashes(root, hashes, names)
+            graph_hash = merkle_hash({}, [hashes[r] for r in roots])
+            if not is_view:
+                hashes[None] = graph_hash
+            return graph_hash
+
+    def _node_hashes(self, names: bool) -> dict:
+        if self._hashes is None:
+            self._hashes = {False: {}, True: {}}
+        return self._hashes[names]
+
+    def _compute_hashes(self, node, hashes: dict, names: bool):
+        """ Compute the hashes of a node and its dependencies """
+        # views share the hashes of the graph they refer to
+        graph = self._root_graph()
+        stack = [node]
+        while stack:
+            n = stack[-1]
+            if n in hashes:
+                stack.pop()
+                continue
+            missing = [d for d in graph.adj[n] if d not in hashes]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            hashes[n] = merkle_hash(graph.nodes[n],
+                                    [hashes[d] for d in graph.adj[n]],
+                                    n if names else None)
+
+    def _invalidate_hashes(self, node):
+        """
+        Remove the cached hashes of a node and the nodes depending on it.
+        If the hash of a node is not cached, neither are the hashes of the
+        nodes depending on it.
+        """
+        if not self._hashes:
+            return
+        graph = self._root_graph()
+        with self._index_lock:
+            for hashes in self._hashes.values():
+                if not hashes:
+                    continue
+                hashes.pop(None, None)
+                stack = [node]
+                while stack:
+                    n = stack.pop()
+                    if hashes.pop(n, None) is not None:
+                        stack.extend(graph.pred[n])
 
     def is_manual_node(self, node_name):
         if isinstance(self.nodes[node_name]['calibrate_function'], (types.MethodType, types.FunctionType)):
@@ -170,7 +867,8 @@ class AutoDepGraph_DAG(nx.DiGraph):
         else:
             return False
 
-    def maintain_node(self, node: str, verbose=True) -> str:
+    def maintain_node(self, node: str, verbose=True, deadline=None,
+                      priorities: Optional[Dict[str, float]] = None):
         """
         Maintaining a node attempts to go from any state to a good state.
             any_state -> good
@@ -183,81 +881,690 @@ class AutoDepGraph_DAG(nx.DiGraph):
             2. perform the "check" experiment on the node itself. This quick
                check
             3. Perform calibration and second round of maintaining dependencies
+               retrying the calibration according to the retry policy of
+               the node (see set_retry_policy)
+
+        If cfg_fault_localisation is 'bisect', a "bad" node does not maintain
+        all its required nodes but only recalibrates the path to the lowest
+        failing dependency found by locate_fault.
+
+        If the circuit breaker of the node is open (see get_breaker_state)
+        maintenance is skipped and "bad" is returned immediately.
+
+        The graph can be maintained from several threads. A thread calling
+        maintain_node for a node that is being maintained by another thread
+        waits for and returns the result of that call.
+
+        Nodes with a batch check function (see check_node) that are
+        required by the node are checked together, so that the batch check
+        function is called once for all nodes of its batch.
+
+        If cfg_speculation_threshold is set, nodes whose check failed with
+        at least that probability in the past are calibrated while they are
+        checked. The calibration is used if the check shows the node needs
+        calibration and discarded otherwise, or if the calibration is
+        deferred (see below). The time saved and wasted is reported in
+        last_run_report.
+
+        If a deadline is given, checks and calibrations are only performed
+        if they are expected to finish before the deadline, based on the
+        durations of earlier checks and calibrations of the nodes. The time
+        expected for maintaining the node itself is reserved, so that it is
+        not spent on its dependencies. Required nodes with a higher
+        priority are maintained first, so lower priority work is deferred
+        when time runs out. Nodes whose dependencies were deferred are not
+        calibrated.
 
+        Args:
+            node: name of the node
+            verbose: Verbosity level
+            deadline: datetime or time in seconds from now before which the
+                run should finish
+            priorities: priority of the required nodes, default 0
         Returns:
-            State of the node after maintaining the node
+            State of the node after maintaining the node. The report of
+            the run is stored in last_run_report.
         Raises:
             Exception if the node could not be calibrated
         """
+        self._check_no_transaction('maintain_node')
+        with self._maintenance_run(node, deadline, priorities):
+            state = self._maintenance_calls.do(
+                node, lambda: self._maintain_node(node, verbose=verbose))
+        return state
+
+    @contextmanager
+    def _maintenance_run(self, node: str, deadline=None,
+                         priorities: Optional[Dict[str, float]] = None,
+                         checkpoint: Optional[dict] = None,
+                         checkpoint_file: Optional[str] = None):
+        """
+        Context of the outermost maintain_node call of the current thread.
+        Holds the nodes that can be visited in the run, the results of
+        batch checks that were not yet applied, the time budget, the
+        report and the checkpoint of the run. A checkpoint is given when an
+        interrupted run is resumed.
+        """
+        if getattr(self._local, 'run', None) is not None:
+            yield self._local.run
+            return
+        t0 = time.perf_counter()
+        if isinstance(deadline, datetime):
+            deadline = (deadline - datetime.now()).total_seconds()
+        run = self._local.run = {
+            'scope': nx.descendants(self, node) | {node},
+            'batch_results': {},
+            'report': new_run_report(node),
+            'deadline': None if deadline is None else t0 + deadline,
+            'priorities': priorities or {},
+            # nodes whose maintenance was not completed
+            'deferred': set(),
+            # states of nodes checked before the run was resumed
+            'resumed': {},
+            'checkpoint': None,
+            'checkpoint_file': checkpoint_file or self.cfg_checkpoint_file,
+            'last_checkpoint': t0,
+            # instrument configuration of the last check or calibration
+            'setup': None,
+            # (node, configuration) of the checks and calibrations
+            'setups': [],
+            # position of the nodes in the order they would be visited
+            # without grouping by configuration, see _ordered_dependencies
+            'visit_order': {}}
+        # time reserved for maintaining the node itself
+        run['reserved'] = self._expected_duration(node, 'maintain')
+        if checkpoint is not None:
+            run['checkpoint'] = checkpoint
+            run['resumed'] = {entry['node']: entry['state'] for entry in
+                              checkpoint['completed']}
+        elif run['checkpoint_file'] is not None:
+            run['checkpoint'] = new_checkpoint(node, priorities)
+        if run['checkpoint'] is not None:
+            self._write_checkpoint(run)
+        finished = False
+        try:
+            yield run
+            finished = True
+        finally:
+            if run['checkpoint'] is not None:
+                run['checkpoint']['finished'] = finished
+                self._write_checkpoint(run)
+            report = run['report']
+            report['duration'] = time.perf_counter() - t0
+            report['state'] = self.nodes[node]['state']
+            report['setup_switches_saved'] = self._setup_switches_saved(run)
+            done = {n for n, action in report['done']}
+            report['confidence'] = {n: self._confidence(n, n in done)
+                                    for n in run['scope']}
+            self.last_run_report = report
+            self._local.run = None
+
+    def _write_checkpoint(self, run: dict):
+        checkpoint = run['checkpoint']
+        completed = {entry['node'] for entry in checkpoint['completed']}
+        checkpoint['pending'] = sorted(
+            (n for n in run['scope'] if n not in completed and
+             self.nodes[n]['state'] != 'good'), key=str)
+        write_checkpoint(run['checkpoint_file'], checkpoint)
+        run['last_checkpoint'] = time.perf_counter()
+
+    def _record_action(self, node: str, action: str):
+        """
+        Add a completed check or calibration to the report and checkpoint
+        of the maintenance run.
+        """
+        run = getattr(self._local, 'run', None)
+        if run is None:
+            return
+        run['report']['done'].append((node, action))
+        checkpoint = run['checkpoint']
+        if checkpoint is not None:
+            node_attrs = self.nodes[node]
+            checkpoint['completed'].append({
+                'node': node, 'action': action, 'state': node_attrs['state'],
+                'last_update': node_attrs['last_update'].isoformat(),
+                'time': datetime.now().isoformat()})
+            if (time.perf_counter() - run['last_checkpoint'] >=
+                    self.cfg_checkpoint_interval):
+                self._write_checkpoint(run)
+
+    def resume(self, filename: Optional[str] = None, verbose=True,
+               max_age: Optional[float] = None):
+        """
+        Resume a maintenance run that was interrupted, using the checkpoint
+        it wrote (see cfg_checkpoint_file).
+
+        The states resulting from the checks and calibrations completed
+        before the interruption are restored, unless the node was updated
+        later. These nodes are not checked again if the result is still
+        valid: younger than max_age seconds and the timeout of the node.
+        The deadline of the interrupted run is not resumed.
+
+        Args:
+            filename: checkpoint file, defaults to cfg_checkpoint_file
+            verbose: Verbosity level
+            max_age: maximum age in seconds of results that are reused
+        Returns:
+            the result of maintain_node for the node of the interrupted run
+        """
+        filename = self.cfg_checkpoint_file if filename is None else filename
+        checkpoint = read_checkpoint(filename)
+        node = checkpoint['node']
+        priorities = checkpoint['priorities'] or None
+        if checkpoint['finished']:
+            if verbose:
+                print('Maintenance of node "{}" already finished.'.format(
+                    node))
+            return self.maintain_node(node, verbose=verbose,
+                                      priorities=priorities)
+
+        results = completed_states(checkpoint, max_age, {
+            entry['node']: self.node_timeout(entry['node'])
+            for entry in checkpoint['completed']
+            if entry['node'] in self.nodes})
+        for name, entry in results.items():
+            last_update = datetime.fromisoformat(entry['last_update'])
+            with self._node_locks[name]:
+                node_attrs = self.nodes[name]
+                if (node_attrs['state'] == 'active' or
+                        node_attrs['last_update'] <= last_update):
+                    with self._index_lock:
+                        node_attrs['state'] = entry['state']
+                        node_attrs['last_update'] = last_update
+                        self._update_indexes(name, 'state')
+                    self._notify_state_listeners(name)
+        checkpoint['completed'] = [e for e in checkpoint['completed'] if
+                                   results.get(e['node']) is e]
+        if verbose:
+            print('Resuming maintenance of node "{}", {} results '
+                  'reused.'.format(node, len(results)))
+        with self._maintenance_run(node, priorities=priorities,
+                                   checkpoint=checkpoint,
+                                   checkpoint_file=filename):
+            return self.maintain_node(node, verbose=verbose,
+                                      priorities=priorities)
+
+    def _expected_duration(self, node: str, action: str) -> float:
+        """
+        Expected duration in seconds of an action ('check', 'calibrate' or
+        'maintain') on a node. Maintaining a node is expected to take a
+        check, unless the node is known to need calibration, and a
+        calibration weighted by the probability that it is needed. The
+        setup cost of the node is added if its instrument configuration
+        differs from the current one, see node_setup.
+        """
+        setup_cost = self._setup_cost(node)
+        if action == 'check':
+            return self.expected_check_duration(node) + setup_cost
+        if action == 'calibrate':
+            return self.expected_calibration_duration(node) + setup_cost
+        state = self.nodes[node]['state']
+        duration = self.expected_calibration_duration(node)
+        if state not in ['needs calibration', 'bad']:
+            duration *= self.failure_probability(node)
+        if state != 'needs calibration':
+            duration += self.expected_check_duration(node)
+        return duration + setup_cost
+
+    def _fits_budget(self, node: str, action: str) -> bool:
+        """ Whether an action is expected to finish before the deadline """
+        run = getattr(self._local, 'run', None)
+        if run is None or run['deadline'] is None:
+            return True
+        remaining = run['deadline'] - time.perf_counter()
+        if node != run['report']['node']:
+            remaining -= run['reserved']
+        return self._expected_duration(node, action) <= remaining
+
+    def _defer(self, node: str, action: str, reason: str,
+               verbose: bool = False):
+        """ Skip an action on a node in the current maintenance run """
+        if verbose:
+            print('\tSkipping {} of node {} ({}).'.format(
+                action, node, reason))
+        run = getattr(self._local, 'run', None)
+        if run is not None:
+            run['report']['skipped'].append((node, action, reason))
+            run['deferred'].add(node)
+
+    def _is_deferred(self, node: str) -> bool:
+        run = getattr(self._local, 'run', None)
+        return run is not None and node in run['deferred']
+
+    def _confidence(self, node: str, verified: bool) -> float:
+        """
+        Estimated probability that a node is good: 1 for good nodes that
+        were checked or calibrated in the run, 0 for nodes that are known
+        not to be good and based on the check statistics otherwise.
+        """
+        state = self.get_node_state(node)
+        if state not in ['good', 'unknown']:
+            return 0.
+        if state == 'good' and verified:
+            return 1.
+        return 1 - self.failure_probability(node)
+
+    def _check_no_transaction(self, method):
+        if self._active_transaction() is not None:
+            raise RuntimeError('{} can not be used inside a '
+                               'transaction'.format(method))
+
+    def _maintain_node(self, node: str, verbose=True) -> str:
+        """ Implementation of maintain_node for a single thread """
         self._exec_cnt += 1
         if verbose:
             print('Maintaining node "{}".'.format(node))
 
+        # 0. A node that failed repeatedly is not retried until the cooldown
+        # of its circuit breaker has passed.
+        if self.get_breaker_state(node) == 'open':
+            if verbose:
+                print('Circuit breaker of node "{}" is open, skipping '
+                      'maintenance.'.format(node))
+            return 'bad'
+
         # 1. Going over the states of all the required nodes and ensure
         # these are all in a 'Good' state.
-        for req_node_name in self.adj[node]:
+        dependencies_deferred = False
+        for req_node_name in self._ordered_dependencies(node):
             req_node_state = self.nodes[req_node_name]['state']
             if req_node_state in ['good', 'unknown']:
                 continue  # assume req_node is in a good state
+            elif not self._fits_budget(req_node_name, 'maintain'):
+                self._defer(req_node_name, 'maintain', 'deadline', verbose)
+                dependencies_deferred = True
             else:  # maintaining the node to ensure it is in a good state
                 req_node_state = self.maintain_node(req_node_name,
                                                     verbose=verbose)
-                if req_node_state == 'bad':
+                if self._is_deferred(req_node_name):
+                    dependencies_deferred = True
+                elif req_node_state == 'bad':
                     raise ValueError('Could not calibrate "{}"'.format(
                         req_node_name))
 
         # 2. Once all required nodes are OK, determine action to be taken
         state = self.nodes[node]['state']
+        speculation = None
+        run = getattr(self._local, 'run', None)
+        resumed_state = (run['resumed'].pop(node, None) if run is not None
+                         else None)
         if state == 'needs calibration':
             # action is clear, no check required
             pass
+        elif resumed_state in ['good', 'needs calibration']:
+            # checked before the run was interrupted
+            state = resumed_state
+            self.set_node_state(node, state)
+        elif not self._fits_budget(node, 'check'):
+            self._defer(node, 'check', 'deadline', verbose)
+            return state
         else:
+            # a node that is likely to need calibration can be calibrated
+            # while it is checked, if the calibration would not be deferred
+            if (not dependencies_deferred and
+                    self._fits_budget(node, 'calibrate')):
+                speculation = self._start_speculation(node, verbose=verbose)
             # determine latest status of node
+            t0 = time.perf_counter()
             state = self.check_node(node, verbose=verbose)
+            check_duration = time.perf_counter() - t0
 
         # 3. Take action based on the stae of the node
+        failed_attempts = 0
+        if state in ['needs calibration', 'bad']:
+            # calibrations that can not be completed are deferred and
+            # speculative calibrations of these are discarded
+            reason = None
+            if dependencies_deferred:
+                reason = 'dependencies deferred'
+            elif not self._fits_budget(node, 'calibrate'):
+                reason = 'deadline'
+            if reason is not None:
+                if speculation is not None:
+                    self._finish_speculation(node, speculation,
+                                             check_duration, commit=False,
+                                             verbose=verbose)
+                self._defer(node, 'calibrate', reason, verbose)
+                return state
+        if speculation is not None:
+            cal_succes = self._finish_speculation(
+                node, speculation, check_duration,
+                commit=state == 'needs calibration', verbose=verbose)
         if state == 'needs calibration':
-            cal_succes = self.calibrate_node(node, verbose=verbose)
+            if speculation is None:
+                cal_succes = self.calibrate_node(node, verbose=verbose)
             # the calibration can still fail if dependencies that were good
             # or unknown were bad. In that case all dependencies will
             # explicitly be executed and calibration will be retried
             if not cal_succes:
                 state = 'bad'
+                failed_attempts = 1
+                max_attempts = self.get_retry_policy(node)['max_attempts']
+                if max_attempts is not None and max_attempts <= 1:
+                    self._record_failure(node)
+                    raise ValueError(
+                        'Calibration of "{}" failed.'.format(node))
                 if verbose:
                     print('Initial calibration of "{}" failed, '
                           'retrying.'.format(node))
         if state == 'bad':
-            # if the state is bad it will execute *all* dependencies. Even
-            # the ones that were updated before.
-            if verbose:
-                print('State of node "{}" is bad, maintaining all required'
-                      ' nodes.'.format(node))
-            for req_node_name in self.adj[node]:
-                req_node_state = self.maintain_node(req_node_name,
-                                                    verbose=verbose)
-            cal_succes = self.calibrate_node(node, verbose=verbose)
+            if self.cfg_fault_localisation == 'bisect':
+                # only recalibrate the path to the lowest failing dependency
+                if verbose:
+                    print('State of node "{}" is bad, locating broken '
+                          'required nodes.'.format(node))
+                fault = self.locate_fault(node, verbose=verbose)
+                if fault is not None:
+                    self._recalibrate_path(fault, node, verbose=verbose)
+            else:
+                # if the state is bad it will execute *all* dependencies.
+                # Even the ones that were updated before.
+                if verbose:
+                    print('State of node "{}" is bad, maintaining all '
+                          'required nodes.'.format(node))
+                for req_node_name in self._ordered_dependencies(node):
+                    req_node_state = self.maintain_node(req_node_name,
+                                                        verbose=verbose)
+                    if req_node_state == 'bad':
+                        raise ValueError('Could not calibrate "{}"'.format(
+                            req_node_name))
+            cal_succes = self._calibrate_with_retries(
+                node, failed_attempts=failed_attempts, verbose=verbose)
             if not cal_succes:
+                self._record_failure(node)
                 raise ValueError(
                     'Calibration of "{}" failed.'.format(node))
 
         state = self.nodes[node]['state']
+        if state == 'good':
+            self._record_success(node)
         return state
 
+    def _start_speculation(self, node: str,
+                           verbose: bool = False) -> Optional[Future]:
+        """
+        Start calibrating a node in the background if speculative
+        calibration is enabled (cfg_speculation_threshold), the check of
+        the node failed with at least that probability in the past and the
+        check and calibration functions do not use the same instrument.
+        Functions that are not instrument methods are assumed to use
+        different resources. Manual nodes are never calibrated
+        speculatively.
+
+        Returns:
+            future resolving to the success and duration of the
+            calibration, or None if the node is not calibrated speculatively
+        """
+        threshold = self.cfg_speculation_threshold
+        if threshold is None or self.is_manual_node(node):
+            return None
+        if self.failure_probability(node) < threshold:
+            return None
+        node_attrs = self.nodes[node]
+        check_instrument = function_instrument(node_attrs.get(
+            'batch_check_function') or node_attrs['check_function'])
+        calibration_instrument = function_instrument(
+            node_attrs['calibrate_function'])
+        if (calibration_instrument is not None and
+                calibration_instrument == check_instrument):
+            return None
+
+        if verbose:
+            print('\tSpeculatively calibrating node {}.'.format(node))
+        with self._monitor_lock:
+            if self._speculation_pool is None:
+                self._speculation_pool = ThreadPoolExecutor(
+                    self.cfg_speculation_workers,
+                    thread_name_prefix='speculative-calibration')
+        self._calib_cnt += 1
+        return self._speculation_pool.submit(self._run_calibration, node)
+
+    def _finish_speculation(self, node: str, speculation: Future,
+                            check_duration: float, commit: bool,
+                            verbose: bool = False) -> Optional[bool]:
+        """
+        Wait for a speculative calibration and apply its result if commit
+        is True, i.e. the check showed the node needs calibration.
+        Otherwise the result is discarded. The time saved or wasted is
+        added to the report of the maintenance run.
+
+        Returns:
+            the success of the calibration if it was committed, else None
+        """
+        if not commit and speculation.cancel():
+            # the calibration had not started yet, nothing was wasted
+            success, duration = None, 0.
+        else:
+            success, duration = speculation.result()
+        report = self._run_report()
+        report['speculative_calibrations'] += 1
+        if commit:
+            # the check and calibration ran at the same time
+            report['committed'] += 1
+            report['time_saved'] += min(check_duration, duration)
+            if verbose:
+                print('\tUsing speculative calibration of node '
+                      '{}.'.format(node))
+            with self._node_locks[node]:
+                return self._apply_calibration(node, success, duration,
+                                               verbose=verbose)
+        report['discarded'] += 1
+        report['time_wasted'] += duration
+        if verbose:
+            print('\tDiscarding speculative calibration of node '
+                  '{}.'.format(node))
+        return None
+
+    def _run_report(self) -> dict:
+        run = getattr(self._local, 'run', None)
+        return run['report'] if run is not None else new_run_report()
+
+    def locate_fault(self, node: str, verbose: bool = False) -> Optional[str]:
+        """
+        Locate the lowest failing dependency of a node by bisection.
+
+        Assumes that a check fails whenever one of the (transitive)
+        dependencies of a node is broken. Every check then either clears a
+        node and all of its dependencies or restricts the search to the
+        dependencies of the checked node. The node that splits the remaining
+        candidates most evenly is checked first. Nodes that are known to be
+        broken ("needs calibration" or "bad") are not checked again.
+
+        Args:
+            node: node whose dependencies to search
+            verbose: Verbosity level
+        Returns:
+            Name of the lowest failing dependency or None if all
+            dependencies are good.
+        """
+        dependencies = {n: nx.descendants(self, n) for n in
+                        nx.descendants(self, node)}
+        candidates = set(dependencies)
+        fault = None
+        while candidates:
+            half = (len(candidates)+1)/2
+            # sorting makes the choice between equal splits reproducible
+            split = min(sorted(candidates, key=str), key=lambda n: abs(
+                len(dependencies[n] & candidates) + 1 - half))
+            state = self.get_node_state(split)
+            if state not in ['needs calibration', 'bad']:
+                state = self.check_node(split, verbose=verbose)
+            if state == 'good':
+                candidates -= dependencies[split] | {split}
+            else:
+                fault = split
+                candidates &= dependencies[split]
+        if verbose and fault is not None:
+            print('\tLocated fault of node "{}" at "{}".'.format(node, fault))
+        return fault
+
+    def _recalibrate_path(self, fault: str, node: str, verbose: bool = False):
+        """
+        Calibrate all nodes on the paths from fault up to (excluding) node,
+        starting at fault.
+        """
+        path = (nx.ancestors(self, fault) & nx.descendants(self, node))
+        path.add(fault)
+        order = [n for n in nx.topological_sort(self) if n in path]
+        for path_node in reversed(order):
+            if not self._calibrate_with_retries(path_node, verbose=verbose):
+                self._record_failure(path_node)
+                raise ValueError('Could not calibrate "{}"'.format(
+                    path_node))
+            self._record_success(path_node)
+
+    def _calibrate_with_retries(self, node: str, failed_attempts: int = 0,
+                                verbose: bool = False) -> bool:
+        """
+        Calibrate a node according to its retry policy.
+
+        Args:
+            node: Node to calibrate
+            failed_attempts: number of calibration attempts that already
+                failed, these count towards max_attempts and determine the
+                backoff before the first try
+            verbose: Verbosity level
+        Returns:
+            True if one of the attempts was successful, otherwise False
+        """
+        policy = self.get_retry_policy(node)
+        if policy['max_attempts'] is None:
+            attempts = 1
+        else:
+            attempts = max(1, int(policy['max_attempts'])) - failed_attempts
+        for attempt in range(attempts):
+            if failed_attempts > 0:
+                delay = (policy['backoff'] *
+                         policy['backoff_factor']**(failed_attempts-1))
+                if delay > 0:
+                    if verbose:
+                        print('\tWaiting {:.1f} s before retrying '
+                              '"{}".'.format(delay, node))
+                    time.sleep(delay)
+            if self.calibrate_node(node, verbose=verbose):
+                return True
+            failed_attempts += 1
+        return False
+
+    def get_retry_policy(self, node: str) -> Dict[str, Optional[float]]:
+        """ Return the retry policy of the specified node
+
+        Args:
+            node: name of the node
+        Returns:
+            policy: default_retry_policy updated with the 'retry_policy'
+                attribute of the node
+        """
+        policy = dict(self.default_retry_policy)
+        policy.update(self.nodes[node].get('retry_policy', {}))
+        return policy
+
+    def set_retry_policy(self, node: str, **policy):
+        """ Set the retry policy of the specified node
+
+        Args:
+            node: name of the node
+            max_attempts (int): total number of calibrations attempted
+                during one maintenance of the node, including a failed
+                calibration before the required nodes were maintained.
+                None (the default) calibrates a "bad" node once after
+                maintaining the required nodes, also if a calibration
+                failed before.
+            backoff (float): time in seconds to wait before retrying a failed
+                calibration
+            backoff_factor (float): factor by which the backoff increases
+                for every subsequent failure
+            failure_threshold (int): number of failed maintenance runs within
+                failure_window after which the circuit breaker opens
+            failure_window (float): time in seconds in which failures are
+                counted
+            cooldown (float): time in seconds during which maintenance of a
+                node with an open circuit breaker is skipped
+        """
+        unknown = set(policy) - set(self.default_retry_policy)
+        if unknown:
+            raise KeyError('{} not in {}'.format(
+                sorted(unknown), list(self.default_retry_policy)))
+        retry_policy = dict(self.nodes[node].get('retry_policy', {}))
+        retry_policy.update(policy)
+        self.nodes[node]['retry_policy'] = retry_policy
+
+    def get_breaker_state(self, node: str) -> str:
+        """ Return the state of the circuit breaker of a node
+
+        The breaker is "open" when maintenance of the node failed
+        failure_threshold times within the failure_window. It is "half-open"
+        once the cooldown has passed, allowing a single trial, and "closed"
+        otherwise.
+
+        Args:
+            node: name of the node
+        Returns:
+            state: "closed", "open" or "half-open"
+        """
+        opened = self.nodes[node].get('breaker_opened', None)
+        if opened is None:
+            return 'closed'
+        cooldown = self.get_retry_policy(node)['cooldown']
+        if (datetime.now() - opened).total_seconds() < cooldown:
+            return 'open'
+        return 'half-open'
+
+    def reset_breaker(self, node: str):
+        """ Close the circuit breaker and forget past failures of a node """
+        self.nodes[node]['breaker_failures'] = []
+        self.nodes[node]['breaker_opened'] = None
+
+    def _record_failure(self, node: str):
+        policy = self.get_retry_policy(node)
+        now = datetime.now()
+        failures = [t for t in self.nodes[node].get('breaker_failures', [])
+                    if (now - t).total_seconds() < policy['failure_window']]
+        failures.append(now)
+        self.nodes[node]['breaker_failures'] = failures
+        if len(failures) >= policy['failure_threshold']:
+            self.nodes[node]['breaker_opened'] = now
+            logging.warning('Opened circuit breaker of node "{}" after {} '
+                            'failures.'.format(node, len(failures)))
+
+    def _record_success(self, node: str):
+        if (self.nodes[node].get('breaker_failures') or
+                self.nodes[node].get('breaker_opened') is not None):
+            self.reset_breaker(node)
+
     def check_node(self, node, verbose=False):
         """ Perform check method on specified node
 
+        Nodes with a 'batch_check_function' attribute are checked using
+        that function instead of their check_function. A batch check
+        function is called with a list of nodes and returns a dict with
+        the check result (float or False) of every node, e.g. a single
+        multiplexed readout measuring the frequency of several qubits.
+        During maintain_node all nodes with the same batch check function
+        that can still be checked in the run are checked in a single call,
+        the results are applied when the nodes are checked.
+
         Args:
             node: Node to check
             verbose: Verbosity level
         Returns:
             Returns node state after the check
         """
+        self._check_no_transaction('check_node')
+        with self._node_locks[node]:
+            return self._check_node(node, verbose=verbose)
+
+    def _check_node(self, node, verbose=False):
         if verbose:
             print('\tChecking node {}.'.format(node))
+        self._check_cnt += 1
         self.set_node_state(node, 'active')
 
-        func = _get_function(self.nodes[node]['check_function'])
-        result = func()
+        if self.nodes[node].get('batch_check_function') is not None:
+            result, duration = self._batch_check_result(node)
+        else:
+            result, duration = self._call_node_function(
+                node, 'check', self.nodes[node]['check_function'])
         if isinstance(result, float):
             if result < self.nodes[node]['tolerance']:
                 self.set_node_state(node, 'good')
@@ -277,7 +1584,278 @@ class AutoDepGraph_DAG(nx.DiGraph):
             raise ValueError('Expected float or "False", '
                              'result is: {}'.format(result))
 
-        return self.nodes[node]['state']
+        state = self.nodes[node]['state']
+        self._update_check_stats(node, duration, failed=state != 'good')
+        self._record_action(node, 'check')
+        if self.history is not None:
+            self.history.record_check(node, result, state, duration)
+        if self._uses_adaptive_timeout(node) and result is not False:
+            self._set_adaptive_timeout(node, self.estimate_timeout(
+                node, result))
+        return state
+
+    def _batch_check_result(self, node: str):
+        """
+        Return the result of the batch check of a node and its share of
+        the duration of the batch check.
+
+        Results of an earlier batch check in the current maintenance run are
+        used once. Otherwise the node is checked together with the nodes
+        with the same batch check function that are pending in the run.
+        Nodes locked by other threads are left out of the batch.
+        """
+        run = getattr(self._local, 'run', None)
+        results = run['batch_results'] if run is not None else {}
+        if node in results:
+            return results.pop(node)
+
+        batch_function = self.nodes[node]['batch_check_function']
+        batch = [node]
+        if run is not None:
+            batch += [n for n in self.query(
+                      batch_check_function=batch_function)
+                      if n != node and n in run['scope'] and
+                      n not in results and self.nodes[n]['state'] not in
+                      ['needs calibration', 'active']]
+        locks = []
+        try:
+            for member in batch[1:]:
+                lock = self._node_locks[member]
+                if lock.acquire(blocking=False):
+                    locks.append(lock)
+                else:
+                    batch.remove(member)
+            self._batch_check_cnt += 1
+            batch_result, duration = self._call_node_function(
+                node, 'batch_check', batch_function, list(batch))
+            duration /= len(batch)
+        finally:
+            for lock in locks:
+                lock.release()
+
+        if node not in batch_result:
+            raise ValueError('Batch check function {} returned no result for '
+                             'node {}'.format(batch_function, node))
+        for member in batch[1:]:
+            if member in batch_result:
+                results[member] = (batch_result[member], duration)
+        return batch_result[node], duration
+
+    def _call_node_function(self, node: str, kind: str, function, *args):
+        """
+        Call a check or calibration function of a node.
+
+        Args:
+            node: name of the node
+            kind: 'check', 'batch_check' or 'calibrate'
+            function: function string or callable
+            args: arguments passed to the function
+        Returns:
+            the result of the function and its duration in seconds
+        """
+        def run():
+            func = _get_function(function)
+            t0 = time.perf_counter()
+            result = func(*args)
+            return result, time.perf_counter() - t0
+
+        self._switch_setup(node)
+        if self.node_function_backend is not None:
+            return self.node_function_backend.call(node, kind, function,
+                                                   args, run)
+        return run()
+
+    def _uses_adaptive_timeout(self, node: str) -> bool:
+        return (self.history is not None and self.nodes[node].get(
+            'adaptive_timeout', self.cfg_adaptive_timeouts))
+
+    def _set_adaptive_timeout(self, node: str, timeout: float):
+        # the 'timeout' attribute set by the user is kept
+        self.nodes[node]['adaptive_timeout_value'] = timeout
+        self._update_indexes(node, 'adaptive_timeout_value')
+
+    def estimate_timeout(self, node: str,
+                         value: Optional[float] = None) -> float:
+        """
+        Estimate the time after which a node should be checked again.
+
+        The drift of the check value is estimated from the history of the
+        node (see GraphHistory.drift_rate). The timeout is the
+        cfg_timeout_safety fraction of the expected time until the value
+        crosses the tolerance of the node, bounded by the 'timeout_min' and
+        'timeout_max' attributes of the node (default cfg_timeout_min and
+        cfg_timeout_max).
+
+        Args:
+            node: name of the node
+            value: latest check value of the node, if None the lowest
+                value in the history of the node is assumed, corresponding
+                to a freshly calibrated node.
+        Returns:
+            timeout in seconds
+        """
+        node_attrs = self.nodes[node]
+        timeout_min = node_attrs.get('timeout_min', self.cfg_timeout_min)
+        timeout_max = node_attrs.get('timeout_max', self.cfg_timeout_max)
+
+        rate = self.history.drift_rate(node, self.cfg_drift_window,
+                                       self.cfg_drift_sigma)
+        if np.isnan(rate):
+            # fall back on the drift observed before the last calibration
+            rate = node_attrs.get('drift_rate', np.nan)
+        else:
+            node_attrs['drift_rate'] = rate
+        if np.isnan(rate):
+            return timeout_min
+        if rate <= 0:
+            return timeout_max
+
+        if value is None:
+            values = self.history.node_checks(
+                node, self.cfg_drift_window)['value']
+            value = np.nanmin(values) if np.isfinite(values).any() else 0
+        margin = node_attrs['tolerance'] - value
+        timeout = self.cfg_timeout_safety * margin / rate
+        return float(np.clip(timeout, timeout_min, timeout_max))
+
+    def _update_check_stats(self, node: str, duration: float, failed: bool,
+                            attribute: str = 'check_stats'):
+        """
+        Update the check (or calibration) statistics stored in the node
+        attributes. The duration is an exponential moving average over
+        recent checks.
+        """
+        stats = dict(self.nodes[node].get(
+            attribute, {'count': 0, 'failures': 0, 'duration': duration}))
+        stats['count'] += 1
+        stats['failures'] += int(failed)
+        stats['duration'] += self.cfg_stats_smoothing * (
+            duration - stats['duration'])
+        self.nodes[node][attribute] = stats
+
+    def failure_probability(self, node: str) -> float:
+        """
+        Estimated probability that the check of a node fails, based on the
+        check statistics of the node (Laplace rule of succession).
+        """
+        stats = self.nodes[node].get('check_stats', {})
+        return (stats.get('failures', 0) + 1) / (stats.get('count', 0) + 2)
+
+    def expected_check_duration(self, node: str) -> float:
+        """
+        Expected duration in seconds of the check of a node, based on the
+        check statistics of the node.
+        """
+        stats = self.nodes[node].get('check_stats', {})
+        return stats.get('duration', self.cfg_default_duration)
+
+    def expected_calibration_duration(self, node: str) -> float:
+        """
+        Expected duration in seconds of the calibration of a node, based on
+        the calibration statistics of the node.
+        """
+        stats = self.nodes[node].get('calibration_stats', {})
+        return stats.get('duration', self.cfg_default_duration)
+
+    def _ordered_dependencies(self, node: str) -> List[str]:
+        """
+        Return the required nodes of a node in the order they are visited.
+
+        If cfg_check_order is 'fail_fast', dependencies with the highest
+        failure probability per second of checking come first. Nodes
+        without statistics keep their insertion order. Within a
+        maintenance run with priorities, nodes with a higher priority come
+        first. If cfg_group_by_setup is True, nodes with the same priority
+        are grouped by their instrument configuration, see _group_by_setup.
+        """
+        dependencies = list(self.adj[node])
+        if self.cfg_check_order == 'fail_fast':
+            dependencies.sort(key=lambda n: -self.failure_probability(n) /
+                              max(self.expected_check_duration(n), 1e-6))
+        run = getattr(self._local, 'run', None)
+        priorities = run['priorities'] if run is not None else {}
+        if priorities:
+            dependencies.sort(key=lambda n: -priorities.get(n, 0))
+        if run is not None:
+            # required nodes are visited before the node itself
+            visit_order = run['visit_order']
+            position = visit_order.setdefault(node, (np.inf, ))[:-1]
+            for i, n in enumerate(dependencies):
+                visit_order.setdefault(n, position + (i, np.inf))
+        if self.cfg_group_by_setup and len(dependencies) > 1:
+            dependencies = self._group_by_setup(dependencies, priorities, run)
+        return dependencies
+
+    def _group_by_setup(self, nodes: List[str], priorities: Dict[str, float],
+                        run: Optional[dict]) -> List[str]:
+        """
+        Reorder nodes with the same priority so that nodes sharing an
+        instrument configuration (see node_setup) are visited one after the
+        other. Nodes using the current configuration of the run come first,
+        other groups keep the order of their first node.
+        """
+        current = run['setup'] if run is not None else None
+        setups = {n: self.node_setup(n) for n in nodes}
+        ranks = {current: -1}
+        for n in nodes:
+            ranks.setdefault(setups[n], len(ranks))
+        return sorted(nodes, key=lambda n: (-priorities.get(n, 0),
+                                            ranks[setups[n]]))
+
+    @staticmethod
+    def _setup_switches_saved(run: dict) -> int:
+        """
+        Number of configuration switches saved in a run by grouping nodes
+        by their configuration: the switches needed for the checks and
+        calibrations of the run in the order the nodes would have been
+        visited without grouping, minus the switches that were made
+        """
+        visit_order = run['visit_order']
+        setups = [setup for _, setup in run['setups']]
+        ungrouped = [setup for _, setup in sorted(
+            run['setups'], key=lambda e: visit_order.get(e[0], (np.inf, )))]
+        return _setup_switches(ungrouped) - _setup_switches(setups)
+
+    def node_setup(self, node: str) -> Optional[tuple]:
+        """
+        Return the instrument configuration a node needs: the instruments
+        used by its check and calibrate functions (functions of the form
+        "instrument.method") and its optional 'setup' attribute, e.g. the
+        waveforms loaded in an AWG. Returns None for nodes that use no
+        instruments and have no 'setup' attribute.
+
+        Switching to the configuration of a node is expected to take its
+        'setup_cost' attribute in seconds (default 0), which is included
+        in the expected durations used for deadlines. Unhashable 'setup'
+        values, e.g. dicts, are converted to equivalent hashable values.
+        """
+        node_attrs = self.nodes[node]
+        instruments = tuple(sorted(node_instruments(node_attrs)))
+        setup = _hashable(node_attrs.get('setup', None))
+        if not instruments and setup is None:
+            return None
+        return instruments, setup
+
+    def _setup_cost(self, node: str) -> float:
+        """ Expected time to switch to the configuration of a node """
+        setup = self.node_setup(node)
+        run = getattr(self._local, 'run', None)
+        if setup is None or (run is not None and run['setup'] == setup):
+            return 0.
+        return self.nodes[node].get('setup_cost', 0.)
+
+    def _switch_setup(self, node: str):
+        """ Track the instrument configuration used in a run """
+        run = getattr(self._local, 'run', None)
+        if run is None:
+            return
+        setup = self.node_setup(node)
+        run['setups'].append((node, setup))
+        if setup is not None and setup != run['setup']:
+            report = run['report']
+            report['setup_switches'] += 1
+            report['setup_time'] += self._setup_cost(node)
+            run['setup'] = setup
 
     def calibrate_node(self, node: str, verbose: bool = False):
         """ Calibrate specified node
@@ -288,44 +1866,101 @@ class AutoDepGraph_DAG(nx.DiGraph):
         Returns:
             Returns True if the calibration was succesfull, otherwise False
         """
+        self._check_no_transaction('calibrate_node')
+        with self._node_locks[node]:
+            return self._calibrate_node(node, verbose=verbose)
+
+    def _calibrate_node(self, node: str, verbose: bool = False):
         if verbose:
             print('\tCalibrating node {}.'.format(node))
+        self._calib_cnt += 1
         self.set_node_state(node, 'active')
+        success, duration = self._run_calibration(node)
+        return self._apply_calibration(node, success, duration, verbose)
 
-        func = _get_function(self.nodes[node]['calibrate_function'])
+    def _run_calibration(self, node: str):
+        """
+        Call the calibration function of a node, returns whether it
+        succeeded and its duration. Exceptions count as failures.
+        """
+        t0 = time.perf_counter()
         try:
-            result = func()
+            result, duration = self._call_node_function(
+                node, 'calibrate', self.nodes[node]['calibrate_function'])
+            return bool(result), duration
         except Exception as e:
-            self.set_node_state(node, 'bad')
             logging.warning(e)
-            return False
-        if result:
+            return False, time.perf_counter() - t0
+
+    def _apply_calibration(self, node: str, success: bool, duration: float,
+                           verbose: bool = False) -> bool:
+        """ Update the state and history of a node after a calibration """
+        if success:
             self.set_node_state(node, 'good')
             if verbose:
                 print('\tCalibration of node {} successful.'.format(node))
-
-            return True
         else:
             self.set_node_state(node, 'bad')
             if verbose:
                 print('\tCalibration of node {} failed.'.format(node))
 
-            return False
+        self._update_check_stats(node, duration, failed=not success,
+                                 attribute='calibration_stats')
+        self._record_action(node, 'calibrate')
+        run = getattr(self._local, 'run', None)
+        if run is not None and run['batch_results']:
+            # batch check results of nodes depending on this node are stale
+            for ancestor in nx.ancestors(self, node) | {node}:
+                run['batch_results'].pop(ancestor, None)
+        if self.history is not None:
+            self.history.record_calibration(
+                node, success, self.nodes[node]['state'], duration)
+        if success and self._uses_adaptive_timeout(node):
+            self._set_adaptive_timeout(node, self.estimate_timeout(node))
+        return success
 
     def set_all_node_states(self, state):
         for node_dat in self.nodes.values():
             node_dat['state'] = state
+        if self._indexes and 'state' in self._indexes:
+            self._indexes['state'].rebuild(self)
+        if self._state_listeners:
+            for node_name in self.nodes():
+                self._notify_state_listeners(node_name)
+
+    def _request_monitor_update(self):
+        """
+        Update the monitor, or once the current thread released its node
+        locks. Drawing waits for the monitor lock and reads the states of
+        all nodes, doing so while holding node locks could deadlock.
+        """
+        if self._node_locks.held():
+            self._local.monitor_pending = True
+        else:
+            self.update_monitor()
+
+    def _update_pending_monitor(self):
+        if getattr(self._local, 'monitor_pending', False):
+            self._local.monitor_pending = False
+            self.update_monitor()
 
     def update_monitor(self):
-        if self.cfg_plot_mode == 'matplotlib':
-            self.update_monitor_mpl()
-        elif self.cfg_plot_mode == 'svg':
-            self.draw_svg()
-        elif self.cfg_plot_mode is None or self.cfg_plot_mode == 'None':
+        if self.cfg_plot_mode is None or self.cfg_plot_mode == 'None':
             return
-        else:
-            raise ValueError('cfg_plot_mode should be in ["matplotlib",'
-                             ' "svg", "None" ]')
+        with self._monitor_lock:
+            if self.cfg_plot_mode == 'matplotlib':
+                self.update_monitor_mpl()
+            elif self.cfg_plot_mode == 'svg':
+                self.draw_svg()
+            elif self.cfg_plot_mode == 'live':
+                # the viewer pushes state changes itself
+                if getattr(self, '_live_viewer', None) is None:
+                    url = self.open_live_viewer(open_browser=False)
+                    logging.info('Live viewer of {} at {}'.format(
+                        self.name, url))
+            else:
+                raise ValueError('cfg_plot_mode should be in ["matplotlib",'
+                                 ' "svg", "live", "None" ]')
 
     def update_monitor_mpl(self):
         """
@@ -359,38 +1994,100 @@ class AutoDepGraph_DAG(nx.DiGraph):
                     for node in nodes])
         return pos
 
-    def draw_mpl(self, ax=None):
+    def draw_mpl(self, ax=None, cluster_by: Optional[str] = None,
+                 expand=None):
+        """
+        Draw the graph using matplotlib.
+
+        Args:
+            ax: axis to draw on, if None a new figure is created
+            cluster_by, expand: node attribute used to aggregate nodes and
+                the clusters to draw expanded, see cluster_graph. Default
+                to the 'cluster_by' and 'expand' items of
+                cfg_plot_mode_args.
+        """
         if ax is None:
             f, ax = plt.subplots()
             ax.axis('off')
         ax.set_title(self.name)
+        if cluster_by is None:
+            cluster_by = self.cfg_plot_mode_args.get('cluster_by', None)
+        graph = self._graph_to_draw(cluster_by, expand)
         colors_list = [state_cmap[node_dat['state']] for node_dat in
-                       self.nodes.values()]
+                       graph.nodes.values()]
         node_positions = getattr(self, 'node_positions', None)
-        if node_positions is None:
-            pos = nx.nx_agraph.graphviz_layout(self, prog='dot')
+        if node_positions is None or cluster_by is not None:
+            pos = nx.nx_agraph.graphviz_layout(graph, prog='dot')
         else:
             pos = self._generate_node_positions(node_positions)
-        nx.draw_networkx_nodes(self, pos, ax=ax, node_color=colors_list)
-        nx.draw_networkx_edges(self, pos, ax=ax, arrows=True,
+        nx.draw_networkx_nodes(graph, pos, ax=ax, node_color=colors_list)
+        nx.draw_networkx_edges(graph, pos, ax=ax, arrows=True,
                                **self.matplotlib_edge_properties)
+        labels = {n: d.get('label', n) for n, d in graph.nodes(data=True)}
         nx.draw_networkx_labels(
-            self, pos, ax=ax, **self.matplotlib_label_properties)
+            graph, pos, ax=ax, labels=labels,
+            **self.matplotlib_label_properties)
         self._format_mpl_plot(ax)
 
+    def cluster_graph(self, cluster_by: str, expand=()) -> nx.DiGraph:
+        """
+        Return a graph in which nodes with the same value for the
+        cluster_by attribute (e.g. 'qubit') are aggregated into a single
+        node colored by the worst state of its members. Layout of the
+        clustered graph scales with the number of clusters instead of the
+        number of nodes.
+
+        Args:
+            cluster_by: node attribute used to group nodes
+            expand: values of cluster_by for which the individual nodes are
+                shown
+        """
+        return vis.cluster_graph(self, cluster_by, expand,
+                                 node_attrs=self._drawing_attrs)
+
+    def expand_cluster(self, value, expand: bool = True):
+        """
+        Show the individual nodes of a cluster in the monitor, or aggregate
+        them again if expand is False.
+        """
+        expanded = set(self.cfg_plot_mode_args.get('expand', ()))
+        if expand:
+            expanded.add(value)
+        else:
+            expanded.discard(value)
+        self.cfg_plot_mode_args['expand'] = expanded
+        self.update_monitor()
+
+    def _graph_to_draw(self, cluster_by=None, expand=None):
+        if cluster_by is None:
+            cluster_by = self.cfg_plot_mode_args.get('cluster_by', None)
+        if cluster_by is None:
+            return self._drawing_graph()
+        if expand is None:
+            expand = self.cfg_plot_mode_args.get('expand', ())
+        return self.cluster_graph(cluster_by, expand)
+
     @staticmethod
     def _format_mpl_plot(ax):
         """ Method to format the generated matplotlib figure """
         ax.set_xticks([])
         ax.set_yticks([])
 
-    def draw_svg(self, filename: str = None):
+    def draw_svg(self, filename: str = None, cluster_by: Optional[str] = None,
+                 expand=None):
         """
+        Draw the graph to an svg file using graphviz.
+
+        Args:
+            filename: file to write, defaults to cfg_svg_filename
+            cluster_by, expand: node attribute used to aggregate nodes and
+                the clusters to draw expanded, see cluster_graph. Default
+                to the 'cluster_by' and 'expand' items of
+                cfg_plot_mode_args.
         """
         if filename is None:
             filename = self.cfg_svg_filename
-        self._update_drawing_attrs()
-        vis.draw_graph_svg(self, filename)
+        vis.draw_graph_svg(self._graph_to_draw(cluster_by, expand), filename)
 
     def open_html_viewer(self):
         """ Open html viewer for the file specified by the svg backend """
@@ -408,6 +2105,28 @@ class AutoDepGraph_DAG(nx.DiGraph):
         webbrowser.open_new_tab(tfile)
         return tfile
 
+    def open_live_viewer(self, port: int = 0,
+                         open_browser: bool = True) -> str:
+        """
+        Serve a live view of the graph, see autodepgraph.live_viewer.
+
+        Unlike the svg backend no files are written, the layout is sent
+        once and state changes are pushed to the browsers. The server is
+        started once and keeps running until the process exits.
+
+        Args:
+            port: port to listen on, 0 picks a free port
+            open_browser: open the viewer in a new browser tab
+        Returns:
+            url of the viewer
+        """
+        if getattr(self, '_live_viewer', None) is None:
+            self._live_viewer = LiveViewer(self, port=port)
+            self._live_viewer.start()
+        if open_browser:
+            webbrowser.open_new_tab(self._live_viewer.url)
+        return self._live_viewer.url
+
     def set_node_attribute(self, node, attribute, value):
         """ Set the attribute of the specified node
 
@@ -418,7 +2137,15 @@ class AutoDepGraph_DAG(nx.DiGraph):
         """
         if attribute in ['state']:
             raise Exception('please use set_state directly')
+        transaction = self._active_transaction()
+        if transaction is not None:
+            if node in self.nodes:
+                transaction.setdefault(node, {})[attribute] = value
+            return
         nx.set_node_attributes(self, {node: {attribute: value}})
+        self._update_indexes(node, attribute)
+        if attribute in hashed_attributes:
+            self._invalidate_hashes(node)
 
     def get_node_attribute(self, node, attribute):
         """ Return the attribute of the specified node
@@ -431,6 +2158,9 @@ class AutoDepGraph_DAG(nx.DiGraph):
         """
         if attribute in ['state']:
             raise Exception('please use get_state directly')
+        changes = self._transaction_changes(node)
+        if attribute in changes:
+            return changes[attribute]
         return self.nodes[node][attribute]
 
     def set_node_description(self, node, description):
@@ -440,26 +2170,151 @@ class AutoDepGraph_DAG(nx.DiGraph):
             node (str): name of the node
             description (str): description to set
         """
-        nx.set_node_attributes(self, {node: {'description': description}})
+        self.set_node_attribute(node, 'description', description)
 
     def calibration_state(self):
         """ Return dictionary with current calibration state """
         return dict(self.nodes)
 
-    def _update_drawing_attrs(self):
-        for node_name, node_attrs in self.nodes(True):
+    def _drawing_graph(self) -> nx.DiGraph:
+        """
+        Return a graph with the drawing attributes of the nodes. These are
+        computed when drawing instead of being stored in the nodes.
+        """
+        graph = nx.DiGraph(name=self.name)
+        graph.add_nodes_from((n, self._drawing_attrs(n)) for n in self)
+        graph.add_edges_from(self.edges())
+        return graph
+
+    def _drawing_attrs(self, node_name):
+        state = self._current_state(node_name)
+        color = vis.state_cmap[state]
+        shape = 'hexagon' if self.is_manual_node(node_name) else 'ellipse'
+        return {'state': state,
+                'shape': shape,
+                'style': 'filled',
+                'color': color,
+                # 'fixedsize':'shape',
+                # 'fixedsize' : b"true",
+                'fixedsize': "false",
+                'fillcolor': color}
+
+
+def new_run_report(node: Optional[str] = None) -> dict:
+    """
+    Return an empty report of a maintenance run.
+
+    Keys:
+        node: node maintained in the run
+        state: state of the node after the run
+        duration: duration of the run in seconds
+        done: (node, action) of the checks and calibrations performed
+        skipped: (node, action, reason) of the actions that were skipped
+            because of the deadline of the run
+        confidence: estimated probability that a node is good for all
+            nodes required by the node, see AutoDepGraph_DAG._confidence
+        speculative_calibrations: number of speculative calibrations
+        committed, discarded: number of speculative calibrations that were
+            used or discarded
+        time_saved: time in seconds saved by running committed calibrations
+            at the same time as the check of the node
+        time_wasted: time in seconds spent on discarded calibrations
+        setup_switches: number of times the instrument configuration was
+            switched, see AutoDepGraph_DAG.node_setup
+        setup_switches_saved: number of switches saved by grouping nodes
+            by their configuration, for the checks and calibrations made
+            in the run
+        setup_time: expected time in seconds spent on switching
+    """
+    return {'node': node, 'state': None, 'duration': 0., 'done': [],
+            'skipped': [], 'confidence': {}, 'speculative_calibrations': 0,
+            'committed': 0, 'discarded': 0, 'time_saved': 0.,
+            'time_wasted': 0., 'setup_switches': 0,
+            'setup_switches_saved': 0, 'setup_time': 0.}
+
+
+def _setup_switches(setups, current=None) -> int:
+    """ Number of configuration switches when visiting nodes in order """
+    switches = 0
+    for setup in setups:
+        if setup is not None and setup != current:
+            switches += 1
+            current = setup
+    return switches
+
+
+def _hashable(value):
+    """ Hashable value that is equal for equal values """
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        pass
+    if isinstance(value, dict):
+        return tuple(sorted(((_hashable(k), _hashable(v))
+                             for k, v in value.items()), key=repr))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_hashable(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return repr(value)
+
+
+def _method_suffix(node_name):
+    return node_name.replace(' ', '_').replace('-', '_')
 
-            state = self.get_node_state(node_name)
-            color = vis.state_cmap[state]
-            shape = 'hexagon' if self.is_manual_node(node_name) else 'ellipse'
-            attr_dict = {'shape': shape,
-                         'style': 'filled',
-                         'color': color,
-                         # 'fixedsize':'shape',
-                         # 'fixedsize' : b"true",
-                         'fixedsize': "false",
-                         'fillcolor': color}
-            node_attrs.update(attr_dict)
+
+def _equals_default(value, default):
+    return type(value) is type(default) and value == default
+
+
+# attributes of the graph that views replace by their own, see subgraph
+_graph_structure = ('_node', '_adj', '_succ', '_pred', 'graph',
+                    '__networkx_cache__', '_DiGraphWindow')
+
+
+def _cached_view(cls, attr: str) -> bool:
+    """
+    Whether attr is a view that networkx (3 and later) caches in the
+    instance dict using functools.cached_property, i.e. a non-data
+    descriptor that is not a method
+    """
+    descriptor = getattr(cls, attr, None)
+    return (hasattr(descriptor, '__get__') and
+            not hasattr(descriptor, '__set__') and not callable(descriptor))
+
+
+class _EdgeDataCopier:
+    """
+    Copies rows of the adjacency dicts of a graph, copying every edge data
+    dict once so that _succ[u][v] is _pred[v][u] in the copy. Every copy
+    needs its own copier.
+
+    Args:
+        snapshot: the snapshot the copy reads the graph at, None if the
+            graph does not change while copying
+    """
+
+    def __init__(self, snapshot: Optional[Snapshot] = None):
+        self.snapshot = snapshot
+        # the copied dicts are kept alive, so their ids are not reused
+        self._copies: Dict[int, tuple] = {}
+
+    def __call__(self, nbrs: dict) -> VersionedDict:
+        row = VersionedDict()
+        for n, data in nbrs.items():
+            if self.snapshot is not None:
+                data = as_of(data, self.snapshot)
+            copy = self._copies.get(id(data))
+            if copy is None:
+                copy = self._copies[id(data)] = (data, VersionedDict(data))
+            row[n] = copy[1]
+        return row
+
+
+def _copy_node_attrs(node_attrs):
+    # keeps the defaults of NodeAttributes
+    return type(node_attrs)(node_attrs)
 
 
 def _construct_maintenance_method():
@@ -486,18 +2341,47 @@ def _get_function(funcStr):
     return f
 
 
+# functions resolved by get_function_from_module, None disables caching.
+# Only the workers of autodepgraph.parallel cache functions, elsewhere
+# patching or reloading a module has to take effect.
+_function_cache: Optional[Dict[str, Callable]] = None
+
+
 def get_function_from_module(funcStr):
     """
+    Return the function "module.function", see enable_function_cache.
     """
+    if _function_cache is not None and funcStr in _function_cache:
+        return _function_cache[funcStr]
     split_idx = funcStr.rfind('.')
     module_name = funcStr[:split_idx]
     mod = import_module(module_name)
     f = getattr(mod, funcStr[(split_idx+1):])
+    if _function_cache is not None:
+        _function_cache[funcStr] = f
     return f
 
 
+def enable_function_cache(enable: bool = True):
+    """
+    Cache the functions resolved by get_function_from_module in this
+    process, or stop caching them. Changes to the modules, e.g. patching or
+    reloading them, are not seen while caching.
+    """
+    global _function_cache
+    _function_cache = {} if enable else None
+
+
+def clear_function_cache():
+    """ Forget the functions resolved by get_function_from_module """
+    if _function_cache is not None:
+        _function_cache.clear()
+
+
 def update_node_state(graph_to_update, graph_to_update_from):
     for node_name, attrs in graph_to_update_from.nodes(True):
         if node_name in graph_to_update.nodes():
             graph_to_update.nodes[node_name]['state'] = attrs['state']
             graph_to_update.nodes[node_name]['last_update'] = attrs['last_update']
+            graph_to_update._update_indexes(node_name, 'state')
+            graph_to_update._notify_state_listeners(node_name)
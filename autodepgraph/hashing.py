@@ -0,0 +1,131 @@
+"""
+Merkle hashes of the sub-DAGs of a calibration graph.
+
+The hash of a node combines the attributes that determine how the node is
+maintained (its functions, tolerance and timeout) with the hashes of its
+dependencies. Nodes with the same hash therefore have identical
+dependency structures, e.g. the per-qubit sub-DAGs of a chip, and derived
+artifacts can be cached per hash (see HashCache). Node names are excluded
+from the hash unless requested, see AutoDepGraph_DAG.node_hash.
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set
+
+# node attributes included in the hash of a node
+hashed_attributes = ('calibrate_function', 'check_function',
+                     'batch_check_function', 'tolerance', 'timeout')
+
+
+def _encode(value) -> str:
+    if callable(value):
+        return '{}.{}'.format(getattr(value, '__module__', ''),
+                              getattr(value, '__qualname__', repr(value)))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(float(value))
+    return repr(value)
+
+
+def content_hash(node_attrs: dict) -> str:
+    """ Hash of the hashed attributes of a single node """
+    content = '\0'.join(_encode(node_attrs.get(attr))
+                        for attr in hashed_attributes)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def merkle_hash(node_attrs: dict, dependency_hashes: Iterable[str],
+                name: Optional[Hashable] = None) -> str:
+    """
+    Hash of a node given the hashes of its dependencies. The order of the
+    dependencies does not matter.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(content_hash(node_attrs).encode())
+    if name is not None:
+        h.update(b'\0name\0' + str(name).encode())
+    for dependency_hash in sorted(dependency_hashes):
+        h.update(b'\0' + dependency_hash.encode())
+    return h.hexdigest()
+
+
+def diff_graphs(old, new) -> Dict[str, Set[Hashable]]:
+    """
+    Compare two versions of a graph.
+
+    Starting at the nodes no other node depends on, only the sub-DAGs whose
+    hashes (including node names) differ are visited, so the time spent
+    is proportional to the size of the change once the hashes are known.
+
+    Returns:
+        dict with the 'added' and 'removed' nodes and the 'changed' nodes,
+        whose hashed attributes or dependencies changed
+    """
+    diff = {'added': set(), 'removed': set(), 'changed': set()}
+    if old.graph_hash(names=True) == new.graph_hash(names=True):
+        return diff
+    stack = [n for n in new if new.in_degree(n) == 0]
+    stack += [n for n in old if old.in_degree(n) == 0]
+    visited = set()
+    while stack:
+        node = stack.pop()
+        if node in visited:
+            continue
+        visited.add(node)
+        if node not in old:
+            diff['added'].add(node)
+            stack.extend(new.adj[node])
+        elif node not in new:
+            diff['removed'].add(node)
+            stack.extend(old.adj[node])
+        elif (old.node_hash(node, names=True) !=
+              new.node_hash(node, names=True)):
+            if (content_hash(old.nodes[node]) !=
+                    content_hash(new.nodes[node]) or
+                    set(old.adj[node]) != set(new.adj[node])):
+                diff['changed'].add(node)
+            stack.extend(old.adj[node])
+            stack.extend(new.adj[node])
+    return diff
+
+
+class HashCache:
+    """
+    Least recently used cache of artifacts derived from sub-DAGs, such as
+    layouts, plans or validation results, keyed by the hash of the node.
+
+    Example:
+        layouts = HashCache()
+        layout = layouts.get(dag, 'Q2 T1', lambda: compute_layout(...))
+
+    Args:
+        maxsize: maximum number of cached artifacts
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items: 'OrderedDict[tuple, Any]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, dag, node: Hashable, compute: Callable[[], Any],
+            kind: str = '', names: bool = False):
+        """
+        Return the artifact of kind for the sub-DAG of node, computing it
+        if no sub-DAG with the same hash was cached.
+        """
+        key = (kind, dag.node_hash(node, names=names))
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+        self.misses += 1
+        value = self._items[key] = compute()
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._items.clear()
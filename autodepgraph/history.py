@@ -0,0 +1,286 @@
+"""
+Fixed size history of check results and calibration outcomes of the nodes
+in a graph.
+
+Every node gets a row in a NumPy backed ring buffer, so the memory used
+by the history does not grow with the number of maintenance runs and
+queries over many nodes can be vectorized.
+"""
+import threading
+import time
+import numpy as np
+from typing import Dict, Hashable, Iterable, List, Optional
+
+from autodepgraph.copy_on_write import Snapshot, VersionedDict, copy_on_write
+
+# Fields stored for every check or calibration
+record_dtype = np.dtype([('timestamp', 'f8'),     # seconds since epoch
+                         ('value', 'f8'),         # check value or success
+                         ('state', 'i1'),         # index in node_states
+                         ('duration', 'f8')])     # duration in seconds
+
+
+class RingBuffer:
+    """
+    Two dimensional ring buffer with a row per node and the last `length`
+    records of that node in the columns.
+    """
+    # the arrays are shared with a copy and copied before writing
+    _shared = False
+
+    def __init__(self, length: int, rows: int = 16):
+        self.length = length
+        self.data = np.zeros((rows, length), dtype=record_dtype)
+        self.data['timestamp'] = np.nan
+        # total number of records written per row
+        self.count = np.zeros(rows, dtype=np.int64)
+
+    def _grow(self, rows: int):
+        data = np.zeros((rows, self.length), dtype=record_dtype)
+        data['timestamp'] = np.nan
+        data[:len(self.data)] = self.data
+        count = np.zeros(rows, dtype=np.int64)
+        count[:len(self.count)] = self.count
+        self.data, self.count = data, count
+        self._shared = False
+
+    def copy(self) -> 'RingBuffer':
+        """ Return a copy sharing the records until either is written """
+        other = RingBuffer.__new__(RingBuffer)
+        other.length, other.data, other.count = (
+            self.length, self.data, self.count)
+        self._shared = other._shared = True
+        return other
+
+    def append(self, row: int, timestamp: float, value: float, state: int,
+               duration: float):
+        if row >= len(self.data):
+            self._grow(max(2*len(self.data), row+1))
+        elif self._shared:
+            self.data, self.count = self.data.copy(), self.count.copy()
+            self._shared = False
+        self.data[row, self.count[row] % self.length] = (
+            timestamp, value, state, duration)
+        self.count[row] += 1
+
+    def last(self, rows, n: Optional[int] = None) -> np.ndarray:
+        """
+        Return the last n records of the rows in chronological order.
+        Rows with less than n records are padded at the start with records
+        with NaN values and a state of -1.
+        """
+        n = self.length if n is None else min(n, self.length)
+        rows = np.asarray(rows, dtype=np.int64)
+        count = np.zeros(len(rows), dtype=np.int64)
+        valid_rows = rows < len(self.count)
+        count[valid_rows] = self.count[rows[valid_rows]]
+        # column index of the n last records, oldest first
+        cols = (count[:, None] - n + np.arange(n)[None, :]) % self.length
+        result = self.data[np.minimum(rows, len(self.data)-1)[:, None], cols]
+        missing = ((np.arange(n)[None, :] < (n - count[:, None])) |
+                   ~valid_rows[:, None])
+        result[missing] = (np.nan, np.nan, -1, np.nan)
+        return result
+
+
+class GraphHistory:
+    """
+    History of the checks and calibrations of the nodes of a graph. The
+    history can be recorded and read from several threads at once.
+
+    Args:
+        length: number of checks and calibrations remembered per node
+        node_states: states used to encode the state field of the records
+    """
+
+    def __init__(self, length: int = 100,
+                 node_states: Iterable[str] = ('good', 'needs calibration',
+                                               'bad', 'unknown', 'active')):
+        self.node_states = list(node_states)
+        self.checks = RingBuffer(length)
+        self.calibrations = RingBuffer(length)
+        self._rows: Dict[Hashable, int] = VersionedDict()
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def copy(self) -> 'GraphHistory':
+        """ Return a copy sharing the records until either is written """
+        other = GraphHistory.__new__(GraphHistory)
+        other.node_states = list(self.node_states)
+        other._lock = threading.RLock()
+        with self._lock:
+            other.checks = self.checks.copy()
+            other.calibrations = self.calibrations.copy()
+            other._rows = copy_on_write(self._rows, Snapshot())
+        return other
+
+    @property
+    def length(self) -> int:
+        return self.checks.length
+
+    @property
+    def nodes(self) -> List[Hashable]:
+        """ Nodes for which a history is recorded """
+        with self._lock:
+            return list(self._rows)
+
+    def _row(self, node) -> int:
+        if node not in self._rows:
+            self._rows[node] = len(self._rows)
+        return self._rows[node]
+
+    def _rows_of(self, nodes) -> np.ndarray:
+        # nodes without history map to a row beyond the buffers
+        unknown = np.iinfo(np.int64).max
+        return np.array([self._rows.get(n, unknown) for n in nodes],
+                        dtype=np.int64)
+
+    def record_check(self, node, value: float, state: str,
+                     duration: float, timestamp: Optional[float] = None):
+        """
+        Add the result of a check to the history of a node. A check that
+        returned False is stored with a NaN value.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        value = np.nan if value is False else float(value)
+        with self._lock:
+            self.checks.append(self._row(node), timestamp, value,
+                               self.node_states.index(state), duration)
+
+    def record_calibration(self, node, success: bool, state: str,
+                           duration: float, timestamp: Optional[float] = None):
+        """ Add the outcome of a calibration to the history of a node """
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            self.calibrations.append(self._row(node), timestamp,
+                                     float(success),
+                                     self.node_states.index(state), duration)
+
+    def node_checks(self, node, n: Optional[int] = None) -> np.ndarray:
+        """ Return the last n checks of a node, oldest first """
+        records = self._last(self.checks, [node], n)[0]
+        return records[~np.isnan(records['timestamp'])]
+
+    def node_calibrations(self, node, n: Optional[int] = None) -> np.ndarray:
+        """ Return the last n calibrations of a node, oldest first """
+        records = self._last(self.calibrations, [node], n)[0]
+        return records[~np.isnan(records['timestamp'])]
+
+    def _last(self, buffer: RingBuffer, nodes,
+              n: Optional[int] = None) -> np.ndarray:
+        with self._lock:
+            return buffer.last(self._rows_of(nodes), n)
+
+    def check_values(self, nodes=None, n: int = 10) -> np.ndarray:
+        """
+        Return the last n check values of the nodes as an array of shape
+        (len(nodes), n), oldest first. Missing values are NaN.
+        """
+        nodes = self.nodes if nodes is None else list(nodes)
+        return self._last(self.checks, nodes, n)['value']
+
+    def check_slopes(self, nodes=None, n: int = 10) -> np.ndarray:
+        """
+        Return the least squares slope (change of the check value per
+        second) of the last n checks of the nodes. Nodes with less than n
+        checks with a value get a NaN slope.
+        """
+        nodes = self.nodes if nodes is None else list(nodes)
+        records = self._last(self.checks, nodes, n)
+        t, x = records['timestamp'], records['value']
+        complete = ~np.isnan(x).any(axis=1) & ~np.isnan(t).any(axis=1)
+        slopes = np.full(len(nodes), np.nan)
+        if n < 2 or not complete.any():
+            return slopes
+        t = t[complete] - t[complete].mean(axis=1, keepdims=True)
+        x = x[complete] - x[complete].mean(axis=1, keepdims=True)
+        var = (t*t).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes[complete] = np.where(var > 0, (t*x).sum(axis=1)/var,
+                                        np.nan)
+        return slopes
+
+    def drift_rate(self, node, n: int = 10, sigma: float = 0) -> float:
+        """
+        Estimate the drift of the check value of a node in units per second
+        from the last n checks since the last successful calibration.
+
+        Args:
+            node: name of the node
+            n: maximum number of checks used
+            sigma: number of standard errors added to the estimate, a
+                positive sigma gives a conservative (upper bound) estimate
+        Returns:
+            the least squares slope plus sigma standard errors or NaN if
+            there are not enough checks (two, or three if sigma is nonzero)
+        """
+        checks = self.node_checks(node, n)
+        calibrations = self.node_calibrations(node)
+        calibrations = calibrations[calibrations['value'] > 0]
+        if len(calibrations):
+            checks = checks[checks['timestamp'] >
+                            calibrations['timestamp'][-1]]
+        checks = checks[~np.isnan(checks['value'])]
+        if len(checks) < (3 if sigma else 2):
+            return np.nan
+        t = checks['timestamp'] - checks['timestamp'].mean()
+        x = checks['value'] - checks['value'].mean()
+        var = (t*t).sum()
+        if var == 0:
+            return np.nan
+        slope = (t*x).sum()/var
+        if sigma:
+            residuals = x - slope*t
+            stderr = np.sqrt((residuals**2).sum()/(len(t)-2)/var)
+            slope += sigma*stderr
+        return slope
+
+    def trending_up(self, n: int = 10, nodes=None) -> List[Hashable]:
+        """ Return the nodes whose last n check values trend upward """
+        nodes = self.nodes if nodes is None else list(nodes)
+        slopes = self.check_slopes(nodes, n)
+        return [node for node, slope in zip(nodes, slopes) if slope > 0]
+
+    def to_records(self, kind: str = 'check') -> Dict[Hashable, np.ndarray]:
+        """ Return the history of all nodes, oldest records first """
+        getter = self.node_checks if kind == 'check' else \
+            self.node_calibrations
+        return {node: getter(node) for node in self._rows}
+
+    def save(self, filename: str):
+        """ Export the history to a compressed numpy .npz file """
+        with self._lock:
+            self._save(filename)
+
+    def _save(self, filename: str):
+        np.savez_compressed(
+            filename, nodes=np.array([str(n) for n in self._rows]),
+            node_states=np.array(self.node_states),
+            checks=self.checks.data[:len(self._rows)],
+            checks_count=self.checks.count[:len(self._rows)],
+            calibrations=self.calibrations.data[:len(self._rows)],
+            calibrations_count=self.calibrations.count[:len(self._rows)])
+
+    @classmethod
+    def load(cls, filename: str) -> 'GraphHistory':
+        """ Load a history exported using save """
+        with np.load(filename) as f:
+            history = cls(f['checks'].shape[1], list(f['node_states']))
+            history._rows = VersionedDict(
+                (str(n), i) for i, n in enumerate(f['nodes']))
+            for name in ['checks', 'calibrations']:
+                buffer = getattr(history, name)
+                buffer._grow(max(len(history._rows), len(buffer.data)))
+                buffer.data[:len(f[name])] = f[name]
+                buffer.count[:len(f[name])] = f[name + '_count']
+        return history
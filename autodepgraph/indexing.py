@@ -0,0 +1,224 @@
+"""
+Secondary indexes on node attributes, used by AutoDepGraph_DAG.query to
+find nodes without scanning all node attributes.
+"""
+import heapq
+from datetime import datetime
+from typing import (Callable, Dict, Hashable, Iterable, List, Optional, Set,
+                    Tuple)
+
+import numpy as np
+
+
+def function_instrument(func) -> Optional[str]:
+    """
+    Return the instrument used by a node function.
+
+    Function strings of the form "instrument.method" refer to a method of
+    an instrument (see graph._get_function), for these the instrument name
+    is returned. Module functions and callables return None.
+    """
+    if isinstance(func, str) and func.count('.') == 1:
+        return func.split('.')[0]
+    return None
+
+
+def node_instruments(node_attrs: dict) -> Set[str]:
+    """ Return the instruments used by the functions of a node """
+    instruments = {function_instrument(node_attrs.get(f)) for f in
+                   ['calibrate_function', 'check_function']}
+    instruments.discard(None)
+    return instruments
+
+
+class _AttributeKey:
+    """ Key of an index on a single node attribute, can be pickled """
+
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+
+    def __call__(self, node_attrs: dict) -> Tuple[Hashable, ...]:
+        value = node_attrs.get(self.attribute, None)
+        if value is None:
+            return ()
+        try:
+            hash(value)
+        except TypeError:
+            return ()
+        return (value, )
+
+
+_epoch = datetime(1970, 1, 1)
+
+
+def timestamp(time: datetime) -> float:
+    """ Seconds since 1970 of a naive local time, as used for deadlines """
+    return (time - _epoch).total_seconds()
+
+
+class _StateKey:
+    """ Key of an index on the node states, see NodeIndex.for_state """
+
+    def __call__(self, node_attrs: dict) -> Tuple[Hashable, ...]:
+        return (node_attrs.get('state', 'unknown'), )
+
+    @staticmethod
+    def deadline(node_attrs: dict) -> Optional[float]:
+        """
+        Time (see timestamp) after which the state of a node can expire,
+        None if it can not expire. The shorter of the 'timeout' and the
+        adaptive timeout is used, since the graph decides which applies.
+        """
+        if node_attrs.get('state', 'unknown') == 'unknown':
+            return None
+        timeout = node_attrs.get('timeout', np.inf)
+        adaptive_timeout = node_attrs.get('adaptive_timeout_value')
+        if adaptive_timeout is not None:
+            timeout = min(timeout, adaptive_timeout)
+        if timeout == np.inf or 'last_update' not in node_attrs:
+            return None
+        return timestamp(node_attrs['last_update']) + timeout
+
+
+class NodeIndex:
+    """
+    Index mapping keys derived from the node attributes to the nodes
+    having that key.
+
+    Args:
+        name: name of the index
+        key: function returning the keys of a node given its attribute
+            dict
+        attributes: node attributes the keys depend on, used to skip
+            updates after changes to other attributes. None means the keys
+            can depend on any attribute.
+    """
+
+    def __init__(self, name: str,
+                 key: Callable[[dict], Iterable[Hashable]],
+                 attributes: Optional[Tuple[str, ...]] = None):
+        self.name = name
+        self.key = key
+        self.attributes = attributes
+        self._nodes: Dict[Hashable, Set[Hashable]] = {}
+        self._keys: Dict[Hashable, Tuple[Hashable, ...]] = {}
+        # deadlines of the nodes whose state can expire and a heap of
+        # (deadline, sequence number, node), only for state indexes. The
+        # heap can contain outdated entries, these are not in _deadlines.
+        self._deadlines: Optional[Dict[Hashable, float]] = (
+            {} if isinstance(key, _StateKey) else None)
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._pushed = 0
+
+    @classmethod
+    def for_attribute(cls, attribute: str) -> 'NodeIndex':
+        """ Index on the value of a single node attribute """
+        return cls(attribute, _AttributeKey(attribute), (attribute, ))
+
+    @classmethod
+    def for_state(cls) -> 'NodeIndex':
+        """
+        Index on the node states that also tracks when the states can
+        expire, see expired
+        """
+        return cls('state', _StateKey(),
+                   ('state', 'last_update', 'timeout',
+                    'adaptive_timeout_value'))
+
+    @classmethod
+    def for_instruments(cls) -> 'NodeIndex':
+        """ Index on the instruments used by the node functions """
+        return cls('instrument', node_instruments,
+                   ('calibrate_function', 'check_function'))
+
+    def copy(self) -> 'NodeIndex':
+        """ Return a copy of the index """
+        other = NodeIndex(self.name, self.key, self.attributes)
+        other._nodes = {key: set(nodes) for key, nodes in self._nodes.items()}
+        other._keys = dict(self._keys)
+        if self._deadlines is not None:
+            other._deadlines = dict(self._deadlines)
+            other._heap = list(self._heap)
+            other._pushed = self._pushed
+        return other
+
+    def depends_on(self, attribute: Optional[str]) -> bool:
+        return (attribute is None or self.attributes is None or
+                attribute in self.attributes)
+
+    def update(self, node, node_attrs: dict):
+        """ (Re)index a node """
+        keys = tuple(self.key(node_attrs))
+        old_keys = self._keys.get(node, ())
+        if keys != old_keys:
+            self.remove(node)
+            for key in keys:
+                self._nodes.setdefault(key, set()).add(node)
+            self._keys[node] = keys
+        if self._deadlines is not None:
+            self.postpone(node, self.key.deadline(node_attrs))
+
+    def remove(self, node):
+        """ Remove a node from the index """
+        if self._deadlines is not None:
+            self._deadlines.pop(node, None)
+        for key in self._keys.pop(node, ()):
+            nodes = self._nodes[key]
+            nodes.discard(node)
+            if not nodes:
+                del self._nodes[key]
+
+    def rebuild(self, graph):
+        """ Index all nodes of a graph """
+        self._nodes.clear()
+        self._keys.clear()
+        if self._deadlines is not None:
+            self._deadlines.clear()
+            self._heap.clear()
+        for node, node_attrs in graph.nodes(data=True):
+            self.update(node, node_attrs)
+
+    def lookup(self, key) -> Set[Hashable]:
+        """
+        Return the nodes with the specified key. The returned set is owned
+        by the index and should not be modified.
+        """
+        return self._nodes.get(key, set())
+
+    def postpone(self, node, deadline: Optional[float]):
+        """
+        Set the time (see timestamp) after which the state of a node in a
+        state index can expire, None if it can not expire
+        """
+        if deadline is None:
+            self._deadlines.pop(node, None)
+            return
+        if self._deadlines.get(node) == deadline:
+            return
+        self._deadlines[node] = deadline
+        self._pushed += 1
+        heapq.heappush(self._heap, (deadline, self._pushed, node))
+        if len(self._heap) > 2*len(self._deadlines) + 64:
+            # drop the outdated entries
+            self._heap = [entry for entry in self._heap
+                          if self._deadlines.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+
+    def expired(self, now: float) -> List[Hashable]:
+        """
+        Remove and return the nodes of a state index (see for_state) whose
+        deadline passed before now (see timestamp). Their states can be
+        indexed under a state that expired. Takes time proportional to the
+        number of nodes returned.
+        """
+        nodes = []
+        heap, deadlines = self._heap, self._deadlines
+        while heap and heap[0][0] < now:
+            deadline, _, node = heapq.heappop(heap)
+            if deadlines.get(node) == deadline:
+                del deadlines[node]
+                nodes.append(node)
+        return nodes
+
+    def keys(self):
+        return self._nodes.keys()
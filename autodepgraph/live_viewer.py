@@ -0,0 +1,208 @@
+"""
+Local HTTP server showing a live view of a graph in the browser.
+
+The server lays out the graph once and pushes the colors of the nodes
+whose state changed to the connected browsers using server-sent events.
+Nothing is written to disk and any number of browsers can be connected.
+The layout is recomputed when nodes or edges are added or removed, or
+when a node becomes a manual node or stops being one, which changes its
+shape.
+
+Example:
+    viewer = LiveViewer(dag)
+    viewer.start()
+    webbrowser.open(viewer.url)
+
+or use AutoDepGraph_DAG.open_live_viewer, or cfg_plot_mode = 'live'.
+
+Endpoints:
+    /: the viewer page
+    /layout.svg: the layout of the graph
+    /states: the colors of all nodes as JSON object
+    /events: stream of 'states' events with the colors of changed nodes
+        and 'layout' events after the layout changed
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set
+from urllib.parse import urlparse
+
+from autodepgraph import visualization as vis
+
+_page = os.path.join(os.path.dirname(__file__), 'svg_viewer',
+                     'live_viewer.html')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Handles the requests of a browser """
+
+    def do_GET(self):
+        viewer = self.server.viewer
+        path = urlparse(self.path).path
+        try:
+            if path in ['/', '/index.html']:
+                with open(_page, 'rb') as f:
+                    self._send(f.read(), 'text/html; charset=utf-8')
+            elif path == '/layout.svg':
+                self._send(viewer.layout(), 'image/svg+xml')
+            elif path == '/states':
+                self._send(json.dumps(viewer.colors()).encode(),
+                           'application/json')
+            elif path == '/events':
+                viewer._stream(self)
+            else:
+                self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_event(self, event: str, data):
+        self.wfile.write('event: {}\ndata: {}\n\n'.format(
+            event, json.dumps(data)).encode())
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        logging.debug('Live viewer: ' + format, *args)
+
+
+class LiveViewer:
+    """
+    Serves a live view of a graph, see the module documentation.
+
+    Args:
+        dag: the graph
+        host, port: address to listen on, port 0 picks a free port
+        keepalive: interval in seconds at which idle connections are kept
+            alive and checked for layout changes
+    """
+
+    def __init__(self, dag, host: str = '127.0.0.1', port: int = 0,
+                 keepalive: float = 1.):
+        self.dag = dag
+        self.keepalive = keepalive
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.viewer = self
+        self._thread: Optional[threading.Thread] = None
+        self._clients: Set[queue.SimpleQueue] = set()
+        self._lock = threading.Lock()
+        self._layout_lock = threading.Lock()
+        self._layout_key: Optional[tuple] = None
+        self._svg = b''
+        self._stopped = False
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def start(self):
+        """ Start serving in a background thread """
+        if self._thread is None:
+            self.dag.add_state_listener(self._on_state)
+            self._thread = threading.Thread(
+                target=self._server.serve_forever, daemon=True,
+                name='LiveViewer')
+            self._thread.start()
+
+    def stop(self):
+        """ Stop serving and close the connections """
+        self._stopped = True
+        self.dag.remove_state_listener(self._on_state)
+        with self._lock:
+            for client in self._clients:
+                client.put(None)
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def layout(self) -> bytes:
+        """ Return the svg of the graph, laid out again after changes """
+        with self._layout_lock:
+            key = self.layout_key()
+            if key != self._layout_key:
+                self._svg = vis.render_graph_svg(self.dag._drawing_graph())
+                self._layout_key = key
+            return self._svg
+
+    def layout_key(self) -> tuple:
+        """
+        Return what the layout depends on: the nodes, the edges and the
+        shapes of the nodes. Node attributes and states do not change the
+        layout.
+        """
+        dag = self.dag
+        return (frozenset((n, dag.is_manual_node(n)) for n in dag.nodes),
+                frozenset(dag.edges))
+
+    def colors(self) -> Dict[str, str]:
+        """ Return the colors of all nodes """
+        return {str(n): vis.state_cmap[self.dag._current_state(n)]
+                for n in self.dag.nodes}
+
+    def _on_state(self, node, state, last_update):
+        # called holding the lock of the node, the clients send the changes
+        with self._lock:
+            for client in self._clients:
+                client.put((node, state))
+
+    def _stream(self, handler: _Handler):
+        """ Send events to a browser until it disconnects """
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.end_headers()
+        client = queue.SimpleQueue()
+        with self._lock:
+            self._clients.add(client)
+        try:
+            layout_key = self.layout_key()
+            nodes = set(self.dag.nodes)
+            handler.send_event('states', self.colors())
+            while not self._stopped:
+                try:
+                    changes = [client.get(timeout=self.keepalive)]
+                except queue.Empty:
+                    changes = []
+                while True:
+                    try:
+                        changes.append(client.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in changes:
+                    break
+                if ((not changes or not nodes.issuperset(
+                        node for node, _ in changes)) and
+                        self.layout_key() != layout_key):
+                    # the browser loads the layout and all states again
+                    layout_key = self.layout_key()
+                    nodes = set(self.dag.nodes)
+                    handler.send_event('layout', {})
+                elif changes:
+                    # only the last state of a node is sent
+                    colors = {str(node): vis.state_cmap[state]
+                              for node, state in changes}
+                    handler.send_event('states', colors)
+                else:
+                    handler.wfile.write(b': keepalive\n\n')
+                    handler.wfile.flush()
+        finally:
+            with self._lock:
+                self._clients.discard(client)
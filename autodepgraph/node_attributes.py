@@ -0,0 +1,124 @@
+"""
+Compact storage of node attributes.
+
+Attributes that have their default value are not stored in the node
+attribute dict of every node but looked up in a single shared mapping.
+"""
+import sys
+from collections.abc import ItemsView, KeysView, ValuesView
+
+import numpy as np
+
+from autodepgraph.copy_on_write import VersionedDict
+
+# Attributes that are always available for the nodes of an
+# AutoDepGraph_DAG, see AutoDepGraph_DAG.add_node
+default_node_attributes = {
+    'calibrate_function': ('autodepgraph.node_functions.'
+                           'calibration_functions.NotImplementedCalibration'),
+    'check_function': ('autodepgraph.node_functions.check_functions'
+                       '.return_fixed_value'),
+    # zero default tolerance -> always recalibrate
+    'tolerance': 0,
+    'timeout': np.inf,
+    'state': 'unknown',
+}
+
+# String attributes shared by many nodes, these are interned
+interned_attributes = frozenset(['calibrate_function', 'check_function',
+                                 'state'])
+
+
+def intern_value(attribute, value):
+    """ Return the interned value for string attributes shared by nodes """
+    if attribute in interned_attributes and type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+class NodeAttributes(VersionedDict):
+    """
+    Node attribute dict that falls back on default_node_attributes for
+    attributes that are not set explicitly.
+
+    The defaults behave as if they were set: they are included when
+    testing membership, iterating and converting to a dict, e.g. by
+    nx.get_node_attributes and the networkx writers. Only the attributes
+    set explicitly are stored, see explicit. Copies of the graph are
+    isolated from changes, see autodepgraph.copy_on_write.
+    """
+    __slots__ = ()
+    defaults = default_node_attributes
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.update(*args, **kwargs)
+
+    def __missing__(self, key):
+        try:
+            return self.defaults[key]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or key in self.defaults
+
+    def __iter__(self):
+        yield from dict.__iter__(self)
+        for key in self.defaults:
+            if not dict.__contains__(self, key):
+                yield key
+
+    def __len__(self) -> int:
+        return dict.__len__(self) + sum(
+            1 for key in self.defaults if not dict.__contains__(self, key))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, dict):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other) -> bool:
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self) -> str:
+        # shown like the dict of all attributes, including the defaults
+        return repr(dict(self.items()))
+
+    def keys(self):
+        return KeysView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        return self.defaults.get(key, default)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, intern_value(key, value))
+
+    def update(self, *args, **kwargs):
+        if len(args) == 1 and isinstance(args[0], NodeAttributes):
+            args = (args[0].explicit(), )
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def explicit(self) -> dict:
+        """ Return the attributes that are set explicitly """
+        return dict(dict.items(self))
+
+    def items_with_defaults(self):
+        """ Return the default and explicitly set attributes """
+        return self.items()
+
+    def copy(self) -> 'NodeAttributes':
+        return self.__class__(self)
+
+    def __reduce__(self):
+        return (self.__class__, (self.explicit(), ))
@@ -1,6 +1,32 @@
+import time
+
+
 def return_fixed_value():
     '''
     Always return 1.0,
     useful as a default
     '''
     return 1.0
+
+
+def test_check_delayed(delay=.2):
+    '''
+    Dummy check function for test cases. Returns 1.0 after a delay.
+    '''
+    time.sleep(delay)
+    return 1.0
+
+
+def test_check_False():
+    '''
+    Dummy check function for test cases. Always returns False,
+    indicating the node is in a "bad" state.
+    '''
+    return False
+
+
+def test_batch_check(nodes):
+    '''
+    Dummy batch check function for test cases. Returns 0.5 for all nodes.
+    '''
+    return {node: 0.5 for node in nodes}
@@ -0,0 +1,211 @@
+"""
+Maintenance of the independent parts of a graph in worker processes.
+
+The weakly connected components of a graph, e.g. the parts of a chip
+connected to different readout or flux lines, share no nodes and can be
+maintained at the same time. maintain_components sends a copy of every
+component to a pool of worker processes, each of which resolves the node
+functions using its own cache. State changes in the workers are streamed
+back to the graph while the workers run. The other attributes changed by a
+worker (statistics, circuit breakers, ...) and the checks and calibrations
+it recorded in the history are merged when its component is done.
+
+Node attributes, including callables used as node functions, have to be
+picklable.
+
+Example:
+    result = maintain_components(dag, processes=4)
+    result['states']  # {node: state}
+"""
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+
+import networkx as nx
+
+from autodepgraph.graph import AutoDepGraph_DAG, enable_function_cache
+
+# counters of AutoDepGraph_DAG added to the graph after a component is done
+_counters = ('_exec_cnt', '_calib_cnt', '_check_cnt', '_batch_check_cnt')
+
+# queue used by a worker process to send messages to the parent
+_messages = None
+
+
+def components(dag: AutoDepGraph_DAG,
+               nodes: Optional[Iterable[Hashable]] = None) -> List[Set]:
+    """
+    Return the weakly connected components of a graph containing any of
+    nodes (default all components), largest first.
+    """
+    result = list(nx.weakly_connected_components(dag))
+    if nodes is not None:
+        nodes = set(nodes)
+        result = [c for c in result if not c.isdisjoint(nodes)]
+    return sorted(result, key=len, reverse=True)
+
+
+def maintain_components(dag: AutoDepGraph_DAG,
+                        nodes: Optional[Iterable[Hashable]] = None,
+                        processes: Optional[int] = None,
+                        verbose: bool = False,
+                        mp_context=None) -> dict:
+    """
+    Maintain nodes of a graph, maintaining every weakly connected component
+    in a worker process.
+
+    Args:
+        dag: the graph
+        nodes: nodes to maintain, default the nodes no other node depends
+            on. The nodes of a component are maintained in this order.
+        processes: maximum number of worker processes, default the number
+            of CPUs
+        verbose: passed to maintain_node in the workers
+        mp_context: multiprocessing context or start method used to
+            create the workers
+    Returns:
+        dict with the 'states' of the maintained nodes, the 'errors'
+        raised while maintaining nodes, the run 'reports' of the nodes
+        (see new_run_report) and the 'duration' in seconds
+    """
+    t0 = time.perf_counter()
+    if nodes is None:
+        nodes = [n for n in dag if dag.in_degree(n) == 0]
+    nodes = list(nodes)
+    parts = components(dag, nodes)
+    result = {'states': {}, 'errors': {}, 'reports': {}, 'duration': 0.}
+    if not parts:
+        return result
+    if isinstance(mp_context, str) or mp_context is None:
+        mp_context = multiprocessing.get_context(mp_context)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    messages = mp_context.Queue()
+
+    with ProcessPoolExecutor(max_workers=min(processes, len(parts)),
+                             mp_context=mp_context,
+                             initializer=_init_worker,
+                             initargs=(messages, )) as executor:
+        futures = {}
+        for i, part in enumerate(parts):
+            graph = dag.subgraph(part).copy()
+            # the graph is drawn by the parent only
+            graph.cfg_plot_mode = None
+            futures[i] = executor.submit(
+                _maintain_component, i, graph,
+                [n for n in nodes if n in part], verbose)
+        remaining = set(futures)
+        while remaining:
+            try:
+                batch = [messages.get(timeout=.1)]
+            except queue.Empty:
+                for i in list(remaining):
+                    # a worker that fails does not send its result
+                    if futures[i].done() and futures[i].exception():
+                        remaining.discard(i)
+                        error = futures[i].exception()
+                        for node in nodes:
+                            if node in parts[i]:
+                                result['errors'][node] = _describe(error)
+                continue
+            while True:
+                try:
+                    batch.append(messages.get_nowait())
+                except queue.Empty:
+                    break
+            changes: Dict[Hashable, dict] = {}
+            for message in batch:
+                if message[0] == 'state':
+                    _, node, state, last_update = message
+                    changes[node] = {'state': state,
+                                     'last_update': last_update}
+                else:
+                    _, i, component_result = message
+                    remaining.discard(i)
+                    _merge(dag, component_result, changes, result)
+            dag._apply_changes(changes)
+    result['duration'] = time.perf_counter() - t0
+    return result
+
+
+def _merge(dag: AutoDepGraph_DAG, component_result: dict,
+           changes: Dict[Hashable, dict], result: dict):
+    """ Merge the result of a component into the graph and the result """
+    for key in ['states', 'errors', 'reports']:
+        result[key].update(component_result[key])
+    for node, attrs in component_result['changes'].items():
+        changes.setdefault(node, {}).update(attrs)
+    for counter, value in component_result['counters'].items():
+        setattr(dag, counter, getattr(dag, counter) + value)
+    if dag.history is not None:
+        node_states = dag.history.node_states
+        for node, records in component_result['checks'].items():
+            for timestamp, value, state, duration in records:
+                dag.history.record_check(node, value, node_states[state],
+                                         duration, timestamp)
+        for node, records in component_result['calibrations'].items():
+            for timestamp, value, state, duration in records:
+                dag.history.record_calibration(
+                    node, bool(value), node_states[state], duration,
+                    timestamp)
+
+
+def _describe(error: BaseException) -> str:
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def _init_worker(messages):
+    global _messages
+    _messages = messages
+    # workers resolve the node functions once
+    enable_function_cache()
+
+
+def _send_state(node, state, last_update):
+    _messages.put(('state', node, state, last_update))
+
+
+def _maintain_component(component_id: int, graph: AutoDepGraph_DAG,
+                        nodes: List[Hashable], verbose: bool):
+    """ Maintain nodes of a component, runs in a worker process """
+    t0 = time.time()
+    initial = {n: dict(node_attrs) for n, node_attrs in graph.nodes.items()}
+    counters = {counter: getattr(graph, counter) for counter in _counters}
+    result = {'states': {}, 'errors': {}, 'reports': {}}
+    graph.add_state_listener(_send_state)
+    try:
+        for node in nodes:
+            try:
+                result['states'][node] = graph.maintain_node(
+                    node, verbose=verbose)
+            except Exception as e:
+                result['states'][node] = graph.get_node_state(node)
+                result['errors'][node] = _describe(e)
+            result['reports'][node] = graph.last_run_report
+    finally:
+        graph.remove_state_listener(_send_state)
+
+    # attributes are replaced when they change, see AutoDepGraph_DAG.copy
+    missing = object()
+    result['changes'] = {}
+    for n, node_attrs in graph.nodes.items():
+        changed = {attr: value for attr, value in dict(node_attrs).items()
+                   if initial[n].get(attr, missing) is not value}
+        if changed:
+            result['changes'][n] = changed
+    result['counters'] = {counter: getattr(graph, counter) - value
+                          for counter, value in counters.items()}
+    result['checks'], result['calibrations'] = {}, {}
+    if graph.history is not None:
+        for node in graph.history.nodes:
+            for key, records in [
+                    ('checks', graph.history.node_checks(node)),
+                    ('calibrations', graph.history.node_calibrations(node))]:
+                records = records[records['timestamp'] >= t0]
+                if len(records):
+                    result[key][node] = records.tolist()
+    # sent through the queue after the state changes of the component
+    _messages.put(('done', component_id, result))
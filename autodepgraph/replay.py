@@ -0,0 +1,273 @@
+"""
+Record and replay the check and calibration functions called while
+maintaining a graph.
+
+A Recorder captures every call of a check or calibration function (node,
+function, arguments, result, duration and exception) into a trace. A
+ReplayBackend returns the recorded results instead of calling the
+functions, so that a recorded run can be repeated offline and faster than
+real time, e.g. to evaluate a different executor configuration.
+
+Example:
+    with Recorder(dag) as recorder:
+        dag.maintain_node('CZ q0-q1')
+    recorder.save('run.trace.gz')
+
+    replay = ReplayBackend.load('run.trace.gz')
+    with replay.attached(other_dag):
+        other_dag.cfg_check_order = 'insertion'
+        other_dag.maintain_node('CZ q0-q1')
+    print(replay.simulated_time)
+
+Traces are stored as gzip compressed JSON lines, a header followed by a
+line per call.
+"""
+import builtins
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+trace_version = 1
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError('Cannot serialize {!r}'.format(obj))
+
+
+def _function_name(function) -> str:
+    if isinstance(function, str):
+        return function
+    return '{}.{}'.format(getattr(function, '__module__', ''),
+                          getattr(function, '__qualname__', repr(function)))
+
+
+def save_trace(filename: str, events: List[dict], **header):
+    """ Write the events of a trace to a gzip compressed JSON lines file """
+    header = dict(header, version=trace_version)
+    with gzip.open(filename, 'wt') as f:
+        f.write(json.dumps(header, default=_json_default) + '\n')
+        for event in events:
+            f.write(json.dumps(event, default=_json_default) + '\n')
+
+
+def load_trace(filename: str) -> Tuple[dict, List[dict]]:
+    """ Read a trace written by save_trace, returns the header and events """
+    with gzip.open(filename, 'rt') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != trace_version:
+            raise ValueError('Unsupported trace version {}'.format(
+                header.get('version')))
+        events = [json.loads(line) for line in f if line.strip()]
+    return header, events
+
+
+class _Backend:
+    """ Base class of objects that call the node functions of a graph """
+
+    def __init__(self):
+        self.dag = None
+
+    def attach(self, dag):
+        """ Call the node functions of dag through this backend """
+        dag.node_function_backend = self
+        self.dag = dag
+
+    def detach(self):
+        if self.dag is not None:
+            self.dag.node_function_backend = None
+            self.dag = None
+
+    @contextmanager
+    def attached(self, dag):
+        """ Context manager attaching the backend to dag """
+        self.attach(dag)
+        try:
+            yield self
+        finally:
+            self.detach()
+
+    def call(self, node: str, kind: str, function, args: tuple,
+             run: Callable[[], Tuple[object, float]]):
+        """
+        Called by the graph instead of a node function.
+
+        Args:
+            node: name of the node
+            kind: 'check', 'batch_check' or 'calibrate'
+            function: function string or callable of the node
+            args: arguments of the function
+            run: calls the function, returns the result and duration
+        Returns:
+            the result of the function and its duration in seconds
+        """
+        raise NotImplementedError
+
+
+class Recorder(_Backend):
+    """
+    Records the node function calls of a graph.
+
+    Args:
+        dag: graph to record, if given the recorder is attached to it.
+            Using the recorder as a context manager detaches it on exit.
+    """
+
+    def __init__(self, dag=None):
+        super().__init__()
+        self.events: List[dict] = []
+        self._lock = threading.Lock()
+        self._t0 = time.time()
+        self._graph_name = None
+        if dag is not None:
+            self.attach(dag)
+
+    def attach(self, dag):
+        super().attach(dag)
+        self._graph_name = dag.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.detach()
+
+    def call(self, node, kind, function, args, run):
+        event = {'t': time.time() - self._t0, 'node': node, 'kind': kind,
+                 'function': _function_name(function), 'args': list(args)}
+        t0 = time.perf_counter()
+        try:
+            result, duration = run()
+        except Exception as e:
+            event['duration'] = time.perf_counter() - t0
+            event['error'] = {'type': type(e).__name__, 'message': str(e)}
+            self._append(event)
+            raise
+        event['result'] = result
+        event['duration'] = duration
+        self._append(event)
+        return result, duration
+
+    def _append(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def save(self, filename: str):
+        """ Save the recorded calls, see load_trace """
+        with self._lock:
+            events = list(self.events)
+        save_trace(filename, events, graph=self._graph_name,
+                   created=datetime.fromtimestamp(self._t0))
+
+
+class ReplayBackend(_Backend):
+    """
+    Replaces the node functions of a graph by the results recorded in a
+    trace.
+
+    The recorded calls of every node are replayed in their recorded order,
+    independent of the order in which the nodes are visited. Batch checks
+    are replayed per node, so nodes can be batched differently than in the
+    recorded run.
+
+    Args:
+        events: recorded calls, see Recorder.events and load_trace
+        on_missing: what to do when the recorded calls of a node are used
+            up, 'last' repeats the last recorded call, 'raise' raises a
+            KeyError. Nodes without recorded calls always raise a KeyError.
+        speedup: replayed calls take their recorded duration divided by
+            speedup, the default replays without waiting
+
+    Attributes:
+        simulated_time: total recorded duration of the replayed calls
+        replayed: number of replayed calls
+        missing: node and kind of the calls that had no unused recording
+    """
+
+    def __init__(self, events: List[dict], on_missing: str = 'last',
+                 speedup: float = np.inf):
+        super().__init__()
+        if on_missing not in ['last', 'raise']:
+            raise ValueError("on_missing should be 'last' or 'raise'")
+        self.on_missing = on_missing
+        self.speedup = speedup
+        self.simulated_time = 0.
+        self.replayed = 0
+        self.missing: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._queues: Dict[Tuple[str, str], deque] = defaultdict(deque)
+        self._last: Dict[Tuple[str, str], dict] = {}
+        for event in events:
+            if event['kind'] == 'batch_check':
+                for member in event['args'][0]:
+                    member_event = dict(event)
+                    if 'result' in event:
+                        if member not in event['result']:
+                            continue
+                        member_event['result'] = event['result'][member]
+                    self._queues[(member, 'batch_check')].append(member_event)
+            else:
+                self._queues[(event['node'], event['kind'])].append(event)
+
+    @classmethod
+    def load(cls, filename: str, **kwargs) -> 'ReplayBackend':
+        """ Create a replay backend from a trace file """
+        header, events = load_trace(filename)
+        return cls(events, **kwargs)
+
+    def _next(self, node: str, kind: str) -> dict:
+        key = (node, kind)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                event = self._last[key] = queue.popleft()
+            else:
+                self.missing.append(key)
+                if self.on_missing == 'raise' or key not in self._last:
+                    raise KeyError('No recorded {} of node {}'.format(
+                        kind, node))
+                event = self._last[key]
+            self.replayed += 1
+        return event
+
+    def call(self, node, kind, function, args, run):
+        if kind == 'batch_check':
+            events = {member: self._next(member, kind)
+                      for member in args[0]}
+            # the members of a recorded batch were checked at once
+            duration = max(e['duration'] for e in events.values())
+            error = next((e['error'] for e in events.values()
+                          if 'error' in e), None)
+            result = {member: e.get('result') for member, e in
+                      events.items()}
+        else:
+            event = self._next(node, kind)
+            duration, error = event['duration'], event.get('error')
+            result = event.get('result')
+
+        with self._lock:
+            self.simulated_time += duration
+        if np.isfinite(self.speedup):
+            time.sleep(duration / self.speedup)
+        if error is not None:
+            raise _recorded_exception(error)
+        return result, duration
+
+
+def _recorded_exception(error: dict) -> Exception:
+    """ Recreate a recorded exception, using RuntimeError for unknown types """
+    error_type = getattr(builtins, error['type'], None)
+    if not (isinstance(error_type, type) and
+            issubclass(error_type, Exception)):
+        error_type = RuntimeError
+    return error_type(error['message'])
@@ -0,0 +1,430 @@
+"""
+Local service that lets several processes share a single calibration graph.
+
+A GraphServer owns an AutoDepGraph_DAG and serves it over a Unix domain
+socket. A GraphClient is a proxy with the same method names as the DAG.
+
+Example:
+    # in the process owning the graph
+    server = GraphServer(dag, '/tmp/adg.sock')
+    server.start()
+
+    # in any other process
+    client = GraphClient('/tmp/adg.sock')
+    client.maintain_node('CZ q0-q1')
+    client.subscribe(lambda node, state, last_update: print(node, state))
+
+Messages are newline delimited JSON. A request is an object
+{"id": ..., "method": ..., "args": [...], "kwargs": {...}} or a list of
+such objects (a batch), which is answered by a single list of responses.
+Clients can send requests without waiting for earlier responses
+(pipelining), responses are matched to requests by their id. State changes
+of subscribed nodes are pushed as {"event": "state", "node": ...,
+"state": ..., "last_update": ...}.
+
+Every connection sends its messages from a writer thread, so a client that
+stops reading does not block the graph. A client that falls more than
+GraphServer.max_pending messages behind is unsubscribed from state
+changes.
+"""
+import builtins
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+def _encode(message) -> bytes:
+    return (json.dumps(message, default=_json_default) + '\n').encode()
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)
+    raise TypeError('Cannot serialize {!r}'.format(obj))
+
+
+class _Connection(socketserver.StreamRequestHandler):
+    """ Handles the requests of a single client """
+
+    def setup(self):
+        super().setup()
+        self._subscription = None
+        self._subscribed_nodes = None
+        # messages are sent by the writer thread
+        self._outgoing = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+
+    def finish(self):
+        self._outgoing.put(None)
+        # a writer blocked on a client that does not read is stopped by
+        # closing the connection
+        self._writer.join(1)
+        super().finish()
+
+    def _write(self):
+        try:
+            while True:
+                message = self._outgoing.get()
+                if message is None:
+                    return
+                self.wfile.write(_encode(message))
+                self.wfile.flush()
+        except (OSError, ValueError) as e:
+            logging.debug('Graph service connection closed: {}'.format(e))
+        finally:
+            self._closed = True
+
+    def send(self, message):
+        """ Queue a message for the writer thread """
+        if not self._closed:
+            self._outgoing.put(message)
+
+    def handle(self):
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                if isinstance(request, list):
+                    self.send([self.server.execute(self, r) for r in request])
+                else:
+                    self.send(self.server.execute(self, request))
+        except (ConnectionError, ValueError) as e:
+            logging.debug('Closing graph service connection: {}'.format(e))
+        finally:
+            self.unsubscribe()
+
+    def subscribe(self, nodes=None):
+        """
+        Push the state changes of the nodes (all nodes if None), replacing
+        the nodes of an earlier subscription
+        """
+        self._subscribed_nodes = None if nodes is None else set(nodes)
+        if self._subscription is not None:
+            return
+
+        def push(node, state, last_update):
+            # called holding the lock of the node, must not block
+            nodes = self._subscribed_nodes
+            if nodes is None or node in nodes:
+                if self._outgoing.qsize() >= self.server.max_pending:
+                    logging.warning('Graph service client does not read '
+                                    'state changes, unsubscribing it')
+                    self.unsubscribe()
+                    return
+                self.send({'event': 'state', 'node': node,
+                           'state': state, 'last_update': last_update})
+        self._subscription = push
+        self.server.dag.add_state_listener(push)
+
+    def unsubscribe(self):
+        if self._subscription is not None:
+            self.server.dag.remove_state_listener(self._subscription)
+            self._subscription = None
+
+
+class GraphServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    """
+    Serves an AutoDepGraph_DAG over a Unix domain socket.
+
+    Args:
+        dag: the graph to serve
+        address: path of the socket
+    """
+    daemon_threads = True
+    # messages queued for a client after which it is unsubscribed from
+    # state changes
+    max_pending: int = 10000
+    # DAG methods that can be called by clients
+    methods: List[str] = ['maintain_node', 'check_node', 'calibrate_node',
+                          'get_node_state', 'set_node_state',
+                          'get_node_attribute', 'set_node_attribute',
+                          'set_node_description', 'query', 'nodes',
+                          'snapshot']
+
+    def __init__(self, dag, address: str):
+        self.dag = dag
+        if os.path.exists(address):
+            os.remove(address)
+        super().__init__(address, _Connection)
+        self._thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> Dict[str, dict]:
+        """ Return the state and last update of all nodes """
+        return {node: {'state': self.dag.get_node_state(node),
+                       'last_update': attrs['last_update']}
+                for node, attrs in self.dag.nodes(data=True)}
+
+    def execute(self, connection: _Connection, request: dict) -> dict:
+        method = request.get('method')
+        args = request.get('args', [])
+        kwargs = request.get('kwargs', {})
+        try:
+            if method == 'subscribe':
+                result = connection.subscribe(*args, **kwargs)
+            elif method == 'unsubscribe':
+                result = connection.unsubscribe()
+            elif method == 'snapshot':
+                result = self.snapshot()
+            elif method == 'nodes':
+                result = list(self.dag.nodes())
+            elif method in self.methods:
+                result = getattr(self.dag, method)(*args, **kwargs)
+            else:
+                raise AttributeError('Unknown method {}'.format(method))
+            # ensure the result can be sent
+            _encode(result)
+            return {'id': request.get('id'), 'result': result}
+        except Exception as e:
+            return {'id': request.get('id'),
+                    'error': {'type': type(e).__name__, 'message': str(e)}}
+
+    def start(self):
+        """ Serve requests in a background thread """
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop serving and remove the socket """
+        self.shutdown()
+        self.server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def serve(dag, address: str):
+    """ Serve a graph over a Unix domain socket until interrupted """
+    server = GraphServer(dag, address)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class GraphClient:
+    """
+    Proxy for a graph served by a GraphServer, with the same method names
+    as AutoDepGraph_DAG.
+
+    Args:
+        address: path of the socket of the server
+        timeout: time in seconds to wait for a response, None waits
+            indefinitely
+    """
+
+    def __init__(self, address: str, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(address)
+        self._rfile = self._socket.makefile('rb')
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._pending: Dict[int, Future] = {}
+        # callbacks and the nodes they are subscribed to, None for all
+        self._subscribers: List[Tuple[Callable, Optional[Set[str]]]] = []
+        self._subscribe_lock = threading.Lock()
+        self._batch: Optional[list] = None
+        # subscribers are called by the notifier thread, so they can call
+        # the server while the reader thread receives the response
+        self._events = queue.SimpleQueue()
+        self._notifier = threading.Thread(target=self._notify, daemon=True)
+        self._notifier.start()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        try:
+            for line in self._rfile:
+                message = json.loads(line)
+                for response in (message if isinstance(message, list)
+                                 else [message]):
+                    self._dispatch(response)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._events.put(None)
+            error = ConnectionError('Connection to graph service closed')
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(error)
+
+    def _notify(self):
+        while True:
+            message = self._events.get()
+            if message is None:
+                return
+            last_update = datetime.fromisoformat(message['last_update'])
+            node = message['node']
+            for callback, nodes in list(self._subscribers):
+                if nodes is not None and node not in nodes:
+                    continue
+                try:
+                    callback(node, message['state'], last_update)
+                except Exception as e:
+                    logging.warning('Subscriber failed: {}'.format(e))
+
+    def _dispatch(self, message):
+        if message.get('event') == 'state':
+            self._events.put(message)
+            return
+        with self._lock:
+            future = self._pending.pop(message['id'], None)
+        if future is None:
+            return
+        if 'error' in message:
+            error_type = getattr(builtins, message['error']['type'], None)
+            if not (isinstance(error_type, type) and
+                    issubclass(error_type, Exception)):
+                error_type = RuntimeError
+            future.set_exception(error_type(message['error']['message']))
+        else:
+            future.set_result(message['result'])
+
+    def call_async(self, method: str, *args, **kwargs) -> Future:
+        """
+        Send a request without waiting for the response (pipelining).
+
+        Returns:
+            future that resolves to the result of the call
+        """
+        future = Future()
+        with self._lock:
+            self._next_id += 1
+            request = {'id': self._next_id, 'method': method, 'args': args,
+                       'kwargs': kwargs}
+            self._pending[self._next_id] = future
+            if self._batch is not None:
+                self._batch.append(request)
+                return future
+        with self._write_lock:
+            self._socket.sendall(_encode(request))
+        return future
+
+    def call(self, method: str, *args, **kwargs):
+        """ Call a method of the served graph and wait for the result """
+        return self.call_async(method, *args, **kwargs).result(self.timeout)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the requests made in the context and send them as a single
+        message when the context exits.
+
+        Example:
+            with client.batch():
+                states = [client.call_async('get_node_state', n)
+                          for n in nodes]
+            states = [s.result() for s in states]
+        """
+        with self._lock:
+            self._batch = []
+        try:
+            yield self
+        finally:
+            with self._lock:
+                batch, self._batch = self._batch, None
+            if batch:
+                with self._write_lock:
+                    self._socket.sendall(_encode(batch))
+
+    def maintain_node(self, node: str, verbose: bool = False, **kwargs):
+        """ See AutoDepGraph_DAG.maintain_node, deadlines are in seconds """
+        return self.call('maintain_node', node, verbose=verbose, **kwargs)
+
+    def check_node(self, node: str, verbose: bool = False) -> str:
+        return self.call('check_node', node, verbose=verbose)
+
+    def calibrate_node(self, node: str, verbose: bool = False) -> bool:
+        return self.call('calibrate_node', node, verbose=verbose)
+
+    def get_node_state(self, node: str) -> str:
+        return self.call('get_node_state', node)
+
+    def set_node_state(self, node: str, state: str):
+        return self.call('set_node_state', node, state)
+
+    def get_node_attribute(self, node: str, attribute: str):
+        return self.call('get_node_attribute', node, attribute)
+
+    def set_node_attribute(self, node: str, attribute: str, value):
+        return self.call('set_node_attribute', node, attribute, value)
+
+    def set_node_description(self, node: str, description: str):
+        return self.call('set_node_description', node, description)
+
+    def query(self, **criteria) -> set:
+        return set(self.call('query', **criteria))
+
+    def nodes(self) -> list:
+        return self.call('nodes')
+
+    def snapshot(self) -> Dict[str, dict]:
+        """ Return the state and last update of all nodes """
+        snapshot = self.call('snapshot')
+        for node_data in snapshot.values():
+            node_data['last_update'] = datetime.fromisoformat(
+                node_data['last_update'])
+        return snapshot
+
+    def subscribe(self, callback: Callable, nodes=None):
+        """
+        Call callback(node, state, last_update) on every state change of
+        the nodes (all nodes if None). Callbacks are called in order by a
+        separate thread and can call the methods of the client.
+        """
+        with self._subscribe_lock:
+            self._subscribers.append(
+                (callback, None if nodes is None else set(nodes)))
+            self._update_subscription()
+
+    def unsubscribe(self, callback: Optional[Callable] = None):
+        """
+        Stop calling a callback on state changes, all callbacks if None
+        """
+        with self._subscribe_lock:
+            self._subscribers = [
+                (c, nodes) for c, nodes in self._subscribers
+                if callback is not None and c is not callback]
+            self._update_subscription()
+
+    def _update_subscription(self):
+        """ Subscribe to the nodes of all callbacks at the server """
+        if not self._subscribers:
+            self.call('unsubscribe')
+            return
+        nodes: Optional[Set[str]] = set()
+        for _, callback_nodes in self._subscribers:
+            if callback_nodes is None:
+                nodes = None
+                break
+            nodes |= callback_nodes
+        self.call('subscribe', None if nodes is None else list(nodes))
+
+    def close(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
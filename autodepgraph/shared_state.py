@@ -0,0 +1,246 @@
+"""
+Node states published in shared memory, for dashboards and other local
+processes that need the state of a graph without reading files.
+
+A SharedStateWriter copies the state and last update of every node into a
+shared memory segment and updates it from a state listener, which costs a
+few array stores per state change. Any number of SharedStateReaders in
+other processes can then read the states without copying or locking.
+
+Example:
+    # in the process owning the graph
+    writer = SharedStateWriter(dag, 'adg_states')
+
+    # in any other process
+    reader = SharedStateReader('adg_states')
+    reader.states()  # {node: (state, last_update)}
+
+Layout: an 8 byte magic string, the length of the JSON header as unsigned
+64 bit integer, the JSON header with the graph name, the node states and
+the node names, and the sections listed in the header: the version
+counter, the state of every node (index in node_states) and its last
+update (seconds since the epoch). Nodes keep the index they had when the
+writer was created, nodes added to the graph later are not published.
+
+The version counter is a seqlock: the writer makes it odd before and even
+after changing a node, readers retry reads during which it was odd or
+changed.
+
+Shared memory requires Python 3.8 or later.
+"""
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # Python 3.7
+    resource_tracker = shared_memory = None
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+magic = b'ADGSTAT1'
+# segments created by writers in this process
+_created = set()
+
+
+def _section_size(size: int) -> int:
+    return size + (-size % 8)
+
+
+class SharedStateWriter:
+    """
+    Publishes the node states of a graph in shared memory.
+
+    Args:
+        dag: the graph, its node names have to be strings
+        name: name of the shared memory segment, generated if None
+    """
+
+    def __init__(self, dag, name: Optional[str] = None):
+        _check_shared_memory()
+        self.dag = dag
+        self.node_names: List[str] = list(dag.nodes)
+        self.node_states: List[str] = list(dag.node_states)
+        self._ids: Dict[Hashable, int] = {
+            n: i for i, n in enumerate(self.node_names)}
+        self._codes = {state: i for i, state in enumerate(self.node_states)}
+        self._lock = threading.Lock()
+
+        n_nodes = len(self.node_names)
+        layout = {}
+        position = 0
+        for section, size in [('version', 8), ('states', n_nodes),
+                              ('last_update', 8*n_nodes)]:
+            layout[section] = [position, size]
+            position += _section_size(size)
+        header = json.dumps({'name': dag.name, 'n_nodes': n_nodes,
+                             'node_states': self.node_states,
+                             'nodes': self.node_names,
+                             'sections': layout}).encode()
+        header += b' ' * (-len(header) % 8)
+        start = len(magic) + 8 + len(header)
+
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True, size=max(start + position, 1))
+        self.name: str = self._shm.name
+        _created.add(self._shm._name)
+        buf = self._shm.buf
+        buf[:len(magic)] = magic
+        buf[len(magic):len(magic)+8] = np.uint64(len(header)).tobytes()
+        buf[len(magic)+8:start] = header
+        self._version, self._states, self._last_update = _arrays(
+            buf, start, layout)
+
+        with self._lock:
+            self._version[0] += 1
+            for node in self.node_names:
+                node_attrs = dag.nodes[node]
+                self._write(node, node_attrs['state'],
+                            node_attrs['last_update'])
+            self._version[0] += 1
+        dag.add_state_listener(self._on_state)
+
+    def _write(self, node, state: str, last_update: datetime):
+        node_id = self._ids.get(node)
+        if node_id is not None:
+            self._states[node_id] = self._codes[state]
+            self._last_update[node_id] = last_update.timestamp()
+
+    def _on_state(self, node, state, last_update):
+        # state listeners of different nodes can be called at the same time
+        with self._lock:
+            self._version[0] += 1
+            self._write(node, state, last_update)
+            self._version[0] += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Stop publishing and remove the shared memory segment """
+        self.dag.remove_state_listener(self._on_state)
+        # the arrays refer to the shared memory and have to be released
+        self._version = self._states = self._last_update = None
+        self._shm.close()
+        self._shm.unlink()
+        _created.discard(self._shm._name)
+
+
+class SharedStateReader:
+    """
+    Reads the node states published by a SharedStateWriter.
+
+    Args:
+        name: name of the shared memory segment
+    """
+
+    def __init__(self, name: str):
+        _check_shared_memory()
+        # the segment is owned by the writer, if it is tracked it is
+        # removed when this process exits
+        if sys.version_info >= (3, 13):
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            if self._shm._name not in _created:
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+        buf = self._shm.buf
+        if bytes(buf[:len(magic)]) != magic:
+            self._shm.close()
+            raise ValueError('{} does not contain node states'.format(name))
+        header_length = int(np.frombuffer(buf, dtype='<u8', count=1,
+                                          offset=len(magic))[0])
+        start = len(magic) + 8
+        header = json.loads(bytes(buf[start:start+header_length]))
+        self.name = name
+        self.graph_name: str = header['name']
+        self.node_names: List[str] = header['nodes']
+        self.node_states: List[str] = header['node_states']
+        self._ids = {n: i for i, n in enumerate(self.node_names)}
+        self._version, self._states, self._last_update = _arrays(
+            buf, start + header_length, header['sections'], readonly=True)
+
+    @property
+    def version(self) -> int:
+        """
+        Number of state changes times two, can be polled to detect changes
+        """
+        return int(self._version[0])
+
+    @property
+    def state_codes(self) -> np.ndarray:
+        """
+        Read-only view of the states of all nodes as indices in
+        node_states. Not consistent while the writer changes a state, see
+        read.
+        """
+        return self._states
+
+    @property
+    def last_updates(self) -> np.ndarray:
+        """ Read-only view of the last updates of all nodes, see read """
+        return self._last_update
+
+    def read(self, timeout: float = 1.) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        Return a consistent copy of the version, state codes and last
+        updates of all nodes.
+        """
+        t_stop = time.perf_counter() + timeout
+        while True:
+            version = self._version[0]
+            if not version % 2:
+                states = self._states.copy()
+                last_update = self._last_update.copy()
+                if self._version[0] == version:
+                    return int(version), states, last_update
+            if time.perf_counter() > t_stop:
+                raise TimeoutError('The node states are being written')
+
+    def states(self) -> Dict[str, Tuple[str, datetime]]:
+        """ Return the state and last update of every node """
+        _, states, last_update = self.read()
+        return {node: (self.node_states[state],
+                       datetime.fromtimestamp(timestamp))
+                for node, state, timestamp in zip(
+                    self.node_names, states, last_update)}
+
+    def get_state(self, node: str) -> str:
+        return self.node_states[self._states[self._ids[node]]]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._version = self._states = self._last_update = None
+        self._shm.close()
+
+
+def _check_shared_memory():
+    if shared_memory is None:
+        raise RuntimeError('Publishing node states in shared memory '
+                           'requires Python 3.8 or later')
+
+
+def _arrays(buf, start: int, layout: dict, readonly: bool = False):
+    """ Version counter, states and last updates in a buffer """
+    def array(section, dtype):
+        offset, size = layout[section]
+        dtype = np.dtype(dtype)
+        result = np.frombuffer(buf, dtype=dtype,
+                               count=size // dtype.itemsize,
+                               offset=start + offset)
+        result.flags.writeable = not readonly
+        return result
+    return array('version', '<u8'), array('states', 'u1'), array(
+        'last_update', '<f8')
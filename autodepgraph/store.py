@@ -0,0 +1,383 @@
+"""
+Memory-mapped on-disk storage of calibration graphs.
+
+A graph written using write_store can be opened without reading the whole
+file. Node names are stored sorted, so a node is found by binary search,
+the dependencies of the nodes are stored as adjacency lists and the state
+and last update of every node are stored in fixed size fields that are
+updated in place.
+
+Example:
+    write_store(dag, 'graph.adg')
+
+    lazy_dag = open_graph('graph.adg')
+    # only loads the node and its (transitive) dependencies
+    lazy_dag.maintain_node('CZ q0-q1')
+
+File layout: an 8 byte magic string, the length of the JSON header as
+unsigned 64 bit integer, the JSON header and the sections listed in the
+header. Every section starts at a multiple of 8 bytes.
+"""
+import json
+import mmap
+import pickle
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from autodepgraph.graph import AutoDepGraph_DAG
+
+magic = b'ADGSTOR1'
+# attributes stored in the fixed size fields of the nodes
+_fixed_attributes = ('state', 'last_update')
+
+
+def _padding(size: int) -> bytes:
+    return b'\0' * (-size % 8)
+
+
+def write_store(dag: AutoDepGraph_DAG, filename: str):
+    """
+    Write a graph to a store that can be opened using GraphStore or
+    open_graph. Node names have to be strings and node attributes have to
+    be picklable.
+    """
+    names = sorted(dag.nodes, key=lambda n: n.encode())
+    ids = {name: i for i, name in enumerate(names)}
+    node_states = list(dag.node_states)
+
+    encoded_names = [name.encode() for name in names]
+    dependencies = [[ids[d] for d in dag.adj[name]] for name in names]
+    attributes = [pickle.dumps(
+        {k: v for k, v in dag.nodes[name].explicit().items()
+         if k not in _fixed_attributes}, protocol=pickle.HIGHEST_PROTOCOL)
+        for name in names]
+
+    def offsets(sizes):
+        result = np.zeros(len(names)+1, dtype='<u8')
+        np.cumsum(sizes, out=result[1:])
+        return result
+
+    sections = [
+        ('name_offsets', offsets([len(n) for n in encoded_names])),
+        ('names', b''.join(encoded_names)),
+        ('states', np.array([node_states.index(dag.nodes[n]['state'])
+                             for n in names], dtype='u1')),
+        ('last_update', np.array(
+            [dag.nodes[n]['last_update'].timestamp() for n in names],
+            dtype='<f8')),
+        ('dependency_offsets', offsets([len(d) for d in dependencies])),
+        ('dependencies', np.array([d for deps in dependencies for d in deps],
+                                  dtype='<u8')),
+        ('attribute_offsets', offsets([len(a) for a in attributes])),
+        ('attributes', b''.join(attributes)),
+    ]
+
+    layout = {}
+    position = 0
+    for section, data in sections:
+        data = data if isinstance(data, bytes) else data.tobytes()
+        layout[section] = [position, len(data)]
+        position += len(data) + len(_padding(len(data)))
+    header = json.dumps({'name': dag.name, 'n_nodes': len(names),
+                         'node_states': node_states,
+                         'sections': layout}).encode()
+    header += b' ' * (-len(header) % 8)
+
+    with open(filename, 'wb') as f:
+        f.write(magic)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for section, data in sections:
+            data = data if isinstance(data, bytes) else data.tobytes()
+            f.write(data)
+            f.write(_padding(len(data)))
+
+
+class GraphStore:
+    """
+    Graph store opened using a memory map.
+
+    Opening a store only reads the header, nodes are read when they are
+    accessed.
+
+    Args:
+        filename: file written using write_store
+        mode: 'r' to open the store read only, 'r+' to allow writing the
+            states of the nodes
+    """
+
+    def __init__(self, filename: str, mode: str = 'r+'):
+        if mode not in ['r', 'r+']:
+            raise ValueError("mode should be 'r' or 'r+'")
+        self.filename = filename
+        self.writable = mode == 'r+'
+        self._file = open(filename, 'r+b' if self.writable else 'rb')
+        self._mmap = mmap.mmap(
+            self._file.fileno(), 0,
+            access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+        if self._mmap[:len(magic)] != magic:
+            self.close()
+            raise ValueError('{} is not a graph store'.format(filename))
+        header_length = int(np.frombuffer(self._mmap, dtype='<u8', count=1,
+                                          offset=len(magic))[0])
+        start = len(magic) + 8
+        header = json.loads(self._mmap[start:start+header_length])
+        self.name: str = header['name']
+        self.node_states: List[str] = header['node_states']
+        self._n_nodes: int = header['n_nodes']
+        self._start = start + header_length
+        self._sections = header['sections']
+
+        self._name_offsets = self._array('name_offsets', '<u8')
+        self._states = self._array('states', 'u1')
+        self._last_update = self._array('last_update', '<f8')
+        self._dependency_offsets = self._array('dependency_offsets', '<u8')
+        self._dependencies = self._array('dependencies', '<u8')
+        self._attribute_offsets = self._array('attribute_offsets', '<u8')
+        self._lock = threading.Lock()
+
+    def _array(self, section: str, dtype: str) -> np.ndarray:
+        offset, size = self._sections[section]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mmap, dtype=dtype,
+                             count=size // dtype.itemsize,
+                             offset=self._start + offset)
+
+    def _bytes(self, section: str, start: int, stop: int) -> bytes:
+        offset = self._start + self._sections[section][0]
+        return self._mmap[offset+start:offset+stop]
+
+    def __len__(self) -> int:
+        return self._n_nodes
+
+    def __contains__(self, name) -> bool:
+        return self.node_id(name) is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Write pending changes and close the file """
+        # the arrays refer to the memory map and have to be released first
+        for attr in ['_name_offsets', '_states', '_last_update',
+                     '_dependency_offsets', '_dependencies',
+                     '_attribute_offsets']:
+            setattr(self, attr, None)
+        if not self._mmap.closed:
+            if self.writable:
+                self._mmap.flush()
+            self._mmap.close()
+        self._file.close()
+
+    def flush(self):
+        """ Write changed states to disk """
+        self._mmap.flush()
+
+    def node_name(self, node_id: int) -> str:
+        return self._bytes('names', int(self._name_offsets[node_id]),
+                           int(self._name_offsets[node_id+1])).decode()
+
+    def node_id(self, name: str) -> Optional[int]:
+        """ Return the id of a node by binary search or None if unknown """
+        key = name.encode()
+        low, high = 0, self._n_nodes
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = self._bytes('names',
+                                     int(self._name_offsets[middle]),
+                                     int(self._name_offsets[middle+1]))
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._n_nodes and self._bytes(
+                'names', int(self._name_offsets[low]),
+                int(self._name_offsets[low+1])) == key:
+            return low
+        return None
+
+    def _id(self, name: str) -> int:
+        node_id = self.node_id(name)
+        if node_id is None:
+            raise KeyError(name)
+        return node_id
+
+    def dependencies(self, node_id: int) -> np.ndarray:
+        """ Ids of the nodes required by a node """
+        return self._dependencies[int(self._dependency_offsets[node_id]):
+                                  int(self._dependency_offsets[node_id+1])]
+
+    def closure(self, names: Iterable[str]) -> Set[int]:
+        """ Ids of the nodes and their transitive dependencies """
+        ids = {self._id(name) for name in names}
+        queue = deque(ids)
+        while queue:
+            for dependency in self.dependencies(queue.popleft()):
+                dependency = int(dependency)
+                if dependency not in ids:
+                    ids.add(dependency)
+                    queue.append(dependency)
+        return ids
+
+    def node_attributes(self, node_id: int) -> dict:
+        """ Attributes of a node, including its state and last update """
+        attributes = pickle.loads(self._bytes(
+            'attributes', int(self._attribute_offsets[node_id]),
+            int(self._attribute_offsets[node_id+1])))
+        attributes['state'] = self.node_states[self._states[node_id]]
+        attributes['last_update'] = datetime.fromtimestamp(
+            self._last_update[node_id])
+        return attributes
+
+    def get_state(self, name: str) -> str:
+        return self.node_states[self._states[self._id(name)]]
+
+    def set_state(self, node_id: int, state: str, last_update: datetime):
+        """ Write the state of a node in place """
+        if not self.writable:
+            raise PermissionError('Store {} is opened read only'.format(
+                self.filename))
+        with self._lock:
+            self._states[node_id] = self.node_states.index(state)
+            self._last_update[node_id] = last_update.timestamp()
+
+
+class LazyAutoDepGraph_DAG(AutoDepGraph_DAG):
+    """
+    AutoDepGraph_DAG backed by a GraphStore that only contains the nodes
+    that have been used.
+
+    Maintaining, checking or calibrating a node, or getting or setting its
+    state or attributes, loads the node and its transitive dependencies
+    from the store. State changes of loaded nodes are written back to the
+    store in place, other attribute changes are only kept in memory (use
+    write_store to save them). Other methods, like iterating over the
+    nodes, only see the nodes loaded so far, except query, which loads
+    all nodes first (see load_all).
+
+    A copy of the graph (see copy) is an AutoDepGraph_DAG of the loaded
+    nodes that is not backed by the store, so its state changes are not
+    written to the store. The graph itself can not be pickled.
+
+    Args:
+        store: the store containing the graph
+        cfg_plot_mode: see AutoDepGraph_DAG
+    """
+
+    def __init__(self, store: GraphStore, cfg_plot_mode=None, **attr):
+        self.store = store
+        self._store_ids: Dict[str, int] = {}
+        self._loading = False
+        self._store_lock = threading.RLock()
+        super().__init__(store.name, cfg_plot_mode=cfg_plot_mode, **attr)
+        self.node_states = list(store.node_states)
+        self.add_state_listener(self._write_state)
+
+    def load(self, nodes: Iterable[str]):
+        """ Load nodes and their transitive dependencies from the store """
+        graph = self._root_graph()
+        if graph is not self:
+            # nodes can not be added to a view
+            return graph.load(nodes)
+        nodes = [n for n in nodes if n not in self._node]
+        if not nodes:
+            return
+        with self._store_lock:
+            ids = self.store.closure(nodes)
+            new_ids = [i for i in ids if self.store.node_name(i)
+                       not in self._node]
+            self._loading = True
+            try:
+                for node_id in new_ids:
+                    name = self.store.node_name(node_id)
+                    attributes = self.store.node_attributes(node_id)
+                    last_update = attributes.pop('last_update')
+                    self.add_node(name, **attributes)
+                    self.nodes[name]['last_update'] = last_update
+                    self._update_indexes(name, 'last_update')
+                    self._store_ids[name] = node_id
+                for node_id in new_ids:
+                    name = self.store.node_name(node_id)
+                    for dependency in self.store.dependencies(node_id):
+                        self.add_edge(name,
+                                      self.store.node_name(int(dependency)))
+            finally:
+                self._loading = False
+
+    def load_all(self):
+        """ Load all nodes from the store """
+        graph = self._root_graph()
+        if len(graph._store_ids) < len(self.store):
+            graph.load(self.store.node_name(i)
+                       for i in range(len(self.store)))
+
+    def _load_node(self, node):
+        if node not in self._node:
+            self.load([node])
+
+    def _write_state(self, node, state, last_update):
+        if not self._loading and self.store.writable:
+            self.store.set_state(self._store_ids[node], state, last_update)
+
+    def maintain_node(self, node: str, verbose=True, **kwargs):
+        self.load([node])
+        return super().maintain_node(node, verbose=verbose, **kwargs)
+
+    def check_node(self, node, verbose=False):
+        self.load([node])
+        return super().check_node(node, verbose=verbose)
+
+    def calibrate_node(self, node: str, verbose: bool = False):
+        self.load([node])
+        return super().calibrate_node(node, verbose=verbose)
+
+    def get_node_state(self, node_name):
+        self._load_node(node_name)
+        return super().get_node_state(node_name)
+
+    def set_node_state(self, node_name, state, update_monitor=True):
+        self._load_node(node_name)
+        return super().set_node_state(node_name, state,
+                                      update_monitor=update_monitor)
+
+    def get_node_attribute(self, node, attribute):
+        self._load_node(node)
+        return super().get_node_attribute(node, attribute)
+
+    def set_node_attribute(self, node, attribute, value):
+        self._load_node(node)
+        return super().set_node_attribute(node, attribute, value)
+
+    def set_node_description(self, node, description):
+        self._load_node(node)
+        return super().set_node_description(node, description)
+
+    def query(self, **criteria) -> set:
+        """ See AutoDepGraph_DAG.query, loads all nodes first """
+        self.load_all()
+        return super().query(**criteria)
+
+    def _copy_state(self):
+        # copies are not backed by the store
+        state = AutoDepGraph_DAG.__getstate__(self)
+        for attr in ['store', '_store_ids', '_loading', '_store_lock']:
+            state.pop(attr, None)
+        return AutoDepGraph_DAG, state
+
+    def __getstate__(self):
+        raise TypeError('A graph backed by a store can not be pickled, use '
+                        'write_store or copy instead')
+
+
+def open_graph(filename: str, mode: str = 'r+',
+               cfg_plot_mode=None) -> LazyAutoDepGraph_DAG:
+    """ Open a graph written using write_store, loading nodes lazily """
+    return LazyAutoDepGraph_DAG(GraphStore(filename, mode),
+                                cfg_plot_mode=cfg_plot_mode)
@@ -0,0 +1,210 @@
+from unittest import TestCase
+import pickle
+import threading
+import time
+from collections import Counter
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.concurrency import SingleFlight
+
+
+class Test_Concurrency(TestCase):
+
+    def test_single_flight(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(.1)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(flight.do('A', slow)))
+        leader.start()
+        started.wait()
+        self.assertTrue(flight.in_flight('A'))
+        results.append(flight.do('A', slow))
+        leader.join()
+        self.assertEqual(results, ['result', 'result'])
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(flight.in_flight('A'))
+
+    def test_single_flight_exception(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(.05)
+            raise ValueError('failed')
+
+        leader = threading.Thread(target=lambda: self.assertRaises(
+            ValueError, flight.do, 'A', failing))
+        leader.start()
+        started.wait()
+        with self.assertRaises(ValueError):
+            flight.do('A', failing)
+        leader.join()
+
+    def test_concurrent_maintain_node(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        cal = ('autodepgraph.node_functions.calibration_functions'
+               '.test_calibration_True_delayed')
+        layers = [['A{}'.format(i) for i in range(4)],
+                  ['B{}'.format(i) for i in range(4)],
+                  ['C{}'.format(i) for i in range(2)]]
+        for layer in layers:
+            for node in layer:
+                # tolerance 2 makes the default check pass
+                test_graph.add_node(node, calibrate_function=cal,
+                                    tolerance=2)
+        for upper, lower in zip(layers[1:], layers[:-1]):
+            for u in upper:
+                for v in lower:
+                    test_graph.add_edge(u, v)
+        test_graph.set_all_node_states('needs calibration')
+
+        calibrated = Counter()
+        calibrate_node = test_graph._calibrate_node
+
+        def counting_calibrate_node(node, verbose=False):
+            calibrated[node] += 1
+            return calibrate_node(node, verbose=verbose)
+        test_graph._calibrate_node = counting_calibrate_node
+
+        errors = []
+
+        def maintain(node):
+            try:
+                test_graph.maintain_node(node, verbose=False)
+            except Exception as e:
+                errors.append(e)
+
+        targets = layers[2]*8 + layers[1]*4
+        threads = [threading.Thread(target=maintain, args=(n, ))
+                   for n in targets]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        for node in test_graph.nodes():
+            self.assertEqual(test_graph.get_node_state(node), 'good')
+            # every node is calibrated exactly once
+            self.assertEqual(calibrated[node], 1, node)
+            self.assertEqual(
+                len(test_graph.history.node_calibrations(node)), 1, node)
+
+    def test_concurrent_check_node(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        nodes = ['N{}'.format(i) for i in range(400)]
+        for node in nodes:
+            test_graph.add_node(node)
+        checks_per_node = 3
+
+        def check(thread):
+            # every thread checks its own nodes
+            for _ in range(checks_per_node):
+                for node in nodes[thread::16]:
+                    test_graph.check_node(node, verbose=False)
+
+        threads = [threading.Thread(target=check, args=(i, ))
+                   for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sorted(test_graph.history.nodes), sorted(nodes))
+        for node in nodes:
+            self.assertEqual(len(test_graph.history.node_checks(node)),
+                             checks_per_node, node)
+
+    def test_copy_while_setting_states(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        nodes = ['N{}'.format(i) for i in range(50)]
+        for node in nodes:
+            test_graph.add_node(node)
+        test_graph.add_index('state')
+        stop = threading.Event()
+
+        def set_states():
+            while not stop.is_set():
+                for node in nodes:
+                    test_graph.set_node_state(node, 'good')
+                for node in nodes:
+                    test_graph.set_node_state(node, 'bad')
+
+        threads = [threading.Thread(target=set_states) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(200):
+                copied_graph = test_graph.copy()
+                states = {n: copied_graph.nodes[n]['state'] for n in nodes}
+                # the index of a copy matches its node states
+                for state in ['good', 'bad']:
+                    self.assertEqual(
+                        copied_graph.query(state=state),
+                        {n for n in nodes if states[n] == state})
+                snapshot = dict(states)
+                time.sleep(.001)
+                self.assertEqual(
+                    {n: copied_graph.nodes[n]['state'] for n in nodes},
+                    snapshot)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def test_locked(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node in 'ABC':
+            test_graph.add_node(node)
+        test_graph.add_edge('C', 'B')
+        test_graph.add_edge('B', 'A')
+        with test_graph.locked(['A', 'C']):
+            test_graph.set_node_state('A', 'good')
+            acquired = []
+            t = threading.Thread(target=lambda: acquired.append(
+                test_graph._node_locks['A'].acquire(timeout=.01)))
+            t.start()
+            t.join()
+            self.assertEqual(acquired, [False])
+
+    def test_pickle(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.add_node('A', state='good')
+        copy = pickle.loads(pickle.dumps(test_graph))
+        self.assertEqual(copy.get_node_state('A'), 'good')
+        copy.set_node_state('A', 'bad')
+        self.assertEqual(test_graph.get_node_state('A'), 'good')
+        self.assertTrue(callable(copy.maintain_A))
+
+    def test_monitor_while_calibrating(self):
+        # the monitor draws while a slow calibration holds the lock of a
+        # node whose 'active' state already expired
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode='svg')
+        cal = ('autodepgraph.node_functions.calibration_functions'
+               '.test_calibration_True_delayed')
+        test_graph.add_node('X', calibrate_function=cal, timeout=.01)
+        test_graph.add_node('Y')
+        calibration = threading.Thread(
+            target=test_graph.calibrate_node, args=('X', ), daemon=True)
+        calibration.start()
+        while test_graph.nodes['X']['state'] != 'active':
+            time.sleep(.01)
+
+        def redraw():
+            while calibration.is_alive():
+                test_graph.set_node_state('Y', 'good')
+        drawing = threading.Thread(target=redraw, daemon=True)
+        drawing.start()
+        calibration.join(10)
+        drawing.join(10)
+        self.assertFalse(calibration.is_alive())
+        self.assertFalse(drawing.is_alive())
@@ -0,0 +1,67 @@
+from unittest import TestCase
+import gc
+import pickle
+from autodepgraph import copy_on_write
+from autodepgraph.copy_on_write import (CopyOnWriteDict, Snapshot,
+                                        VersionedDict, as_of, copy_on_write
+                                        as copy_on_write_dict, is_shared)
+
+
+class Test_CopyOnWrite(TestCase):
+
+    def test_copy_on_write(self):
+        base = VersionedDict(x=VersionedDict(v=1), y=VersionedDict(v=2))
+        a = copy_on_write_dict(base, Snapshot(), VersionedDict)
+        self.assertTrue(is_shared(a, 'x'))
+        a['x']['v'] = 3
+        a['z'] = VersionedDict(v=4)
+        del a['y']
+        self.assertFalse(is_shared(a, 'x'))
+        self.assertEqual(dict(a), {'x': {'v': 3}, 'z': {'v': 4}})
+        self.assertEqual(dict(base), {'x': {'v': 1}, 'y': {'v': 2}})
+        self.assertEqual(len(a), 2)
+        with self.assertRaises(KeyError):
+            del a['y']
+
+        # changes of the base are not visible in the copy
+        b = copy_on_write_dict(base, Snapshot(), VersionedDict)
+        x = base['x']
+        x['v'] = 5
+        base['w'] = VersionedDict()
+        self.assertEqual(dict(b), {'x': {'v': 1}, 'y': {'v': 2}})
+        self.assertEqual(len(b), 2)
+        # the base keeps its dicts
+        self.assertIs(base['x'], x)
+        x['v'] = 6
+        self.assertEqual(base['x']['v'], 6)
+        self.assertEqual(b['x']['v'], 1)
+
+        # copies of copies
+        c = copy_on_write_dict(a, Snapshot(), VersionedDict)
+        a['x']['v'] = 7
+        a['y'] = VersionedDict(v=8)
+        self.assertEqual(dict(c), {'x': {'v': 3}, 'z': {'v': 4}})
+        self.assertEqual(pickle.loads(pickle.dumps(a)),
+                         {'x': {'v': 7}, 'y': {'v': 8}, 'z': {'v': 4}})
+
+    def test_saved_contents(self):
+        base = VersionedDict(x=1)
+        snapshot = Snapshot()
+        base['x'] = 2
+        self.assertEqual(as_of(base, snapshot), {'x': 1})
+        self.assertEqual(as_of(base, Snapshot()), {'x': 2})
+        # the contents are only saved while the snapshot is in use
+        del snapshot
+        gc.collect()
+        base['x'] = 3
+        self.assertIsNone(base._saved)
+
+    def test_flatten(self):
+        mapping = VersionedDict(x=1)
+        for _ in range(2*copy_on_write.max_depth):
+            other = mapping
+            mapping = copy_on_write_dict(mapping, Snapshot())
+            mapping['y'] = other['x'] + 1
+        self.assertIsInstance(mapping, CopyOnWriteDict)
+        self.assertLessEqual(mapping.depth, copy_on_write.max_depth)
+        self.assertEqual(dict(mapping), {'x': 1, 'y': 2})
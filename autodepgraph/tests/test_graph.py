@@ -2,12 +2,45 @@ from unittest import TestCase, expectedFailure
 from autodepgraph import visualization as vis
 import autodepgraph as adg
 import networkx as nx
-from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.graph import (AutoDepGraph_DAG, enable_function_cache,
+                                get_function_from_module)
+from unittest import mock
 import yaml
 import os
+import numpy as np
+import pickle
+import tempfile
+import threading
+from autodepgraph.checkpoint import read_checkpoint
+from autodepgraph.replay import Recorder
 test_dir = os.path.join(adg.__path__[0], 'tests', 'test_data')
 
 
+class _SpeculationBackend:
+    """
+    Node function backend for nodes whose calibration reports a duration
+    of .5 s and whose check returns 1.0. The check waits until the
+    speculative calibration of the node has started, so it is not
+    cancelled.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.calls = []
+        self.calibrating = threading.Event()
+
+    def call(self, node, kind, function, args, run):
+        if node not in self.nodes:
+            return run()
+        self.calls.append((node, kind))
+        if kind == 'calibrate':
+            self.calibrating.set()
+            return True, .5
+        self.calibrating.wait(10)
+        self.calibrating.clear()
+        return 1.0, 0.
+
+
 class Test_Graph(TestCase):
 
     @classmethod
@@ -63,6 +96,21 @@ class Test_Graph(TestCase):
         self.test_graph.set_node_description('A', 'explain node A')
         self.assertEqual(self.test_graph.get_node_attribute('A', 'description'), 'explain node A')
 
+    def test_function_cache(self):
+        name = ('autodepgraph.node_functions.calibration_functions'
+                '.test_calibration_True')
+        original = get_function_from_module(name)
+        # patching a module takes effect unless functions are cached
+        with mock.patch(name, lambda: False):
+            self.assertIsNot(get_function_from_module(name), original)
+        enable_function_cache()
+        try:
+            get_function_from_module(name)
+            with mock.patch(name, lambda: False):
+                self.assertIs(get_function_from_module(name), original)
+        finally:
+            enable_function_cache(False)
+
     def test_maintain_node_require_cal(self):
         self.test_graph.set_all_node_states(
             'needs calibration')
@@ -105,6 +153,564 @@ class Test_Graph(TestCase):
         cal_True_delayed = ('autodepgraph.node_functions.calibration_functions'
                             '.test_calibration_True_delayed')
 
+    def test_retry_policy(self):
+        cal_False = ('autodepgraph.node_functions.calibration_functions'
+                     '.test_calibration_False')
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.add_node('A', calibrate_function=cal_False)
+        test_graph.add_node('B', calibrate_function=cal_False,
+                            check_function='autodepgraph.node_functions.'
+                            'check_functions.test_check_False')
+
+        # without a policy a failed calibration is retried once after
+        # maintaining the required nodes, a failed check is followed by a
+        # single calibration
+        with self.assertRaises(ValueError):
+            test_graph.maintain_node('A', verbose=False)
+        self.assertEqual(test_graph._calib_cnt, 2)
+        test_graph._calib_cnt = 0
+        with self.assertRaises(ValueError):
+            test_graph.maintain_node('B', verbose=False)
+        self.assertEqual(test_graph._calib_cnt, 1)
+
+        test_graph._calib_cnt = 0
+        test_graph.set_node_state('A', 'unknown')
+        test_graph.set_retry_policy('A', max_attempts=3)
+        self.assertEqual(test_graph.get_retry_policy('A')['max_attempts'], 3)
+        with self.assertRaises(KeyError):
+            test_graph.set_retry_policy('A', max_retries=3)
+
+        with self.assertRaises(ValueError):
+            test_graph.maintain_node('A', verbose=False)
+        # three attempts in total
+        self.assertEqual(test_graph._calib_cnt, 3)
+
+        # the same number of attempts when the check of the node fails
+        test_graph._calib_cnt = 0
+        test_graph.set_retry_policy('B', max_attempts=3)
+        with self.assertRaises(ValueError):
+            test_graph.maintain_node('B', verbose=False)
+        self.assertEqual(test_graph._calib_cnt, 3)
+
+        # no retries
+        test_graph._calib_cnt = 0
+        test_graph.set_retry_policy('A', max_attempts=1)
+        with self.assertRaises(ValueError):
+            test_graph.maintain_node('A', verbose=False)
+        self.assertEqual(test_graph._calib_cnt, 1)
+
+    def test_circuit_breaker(self):
+        cal_False = ('autodepgraph.node_functions.calibration_functions'
+                     '.test_calibration_False')
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.add_node('A', tolerance=2)
+        test_graph.add_node('B', calibrate_function=cal_False)
+        test_graph.add_edge('B', 'A')
+        test_graph.set_retry_policy('B', failure_threshold=2, cooldown=600)
+
+        for i in range(2):
+            self.assertEqual(test_graph.get_breaker_state('B'), 'closed')
+            with self.assertRaises(ValueError):
+                test_graph.maintain_node('B', verbose=False)
+        self.assertEqual(test_graph.get_breaker_state('B'), 'open')
+        self.assertEqual(len(test_graph.nodes['B']['breaker_failures']), 2)
+
+        calib_cnt = test_graph._calib_cnt
+        self.assertEqual(test_graph.maintain_node('B', verbose=False), 'bad')
+        self.assertEqual(test_graph._calib_cnt, calib_cnt)
+
+        # a node depending on a node with an open breaker fails immediately
+        test_graph.add_node('C')
+        test_graph.add_edge('C', 'B')
+        test_graph.set_node_state('B', 'needs calibration')
+        with self.assertRaises(ValueError):
+            test_graph.maintain_node('C', verbose=False)
+        self.assertEqual(test_graph._calib_cnt, calib_cnt)
+
+        test_graph.set_retry_policy('B', cooldown=0)
+        self.assertEqual(test_graph.get_breaker_state('B'), 'half-open')
+        test_graph.reset_breaker('B')
+        self.assertEqual(test_graph.get_breaker_state('B'), 'closed')
+
+    def test_locate_fault(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        # the default check returns 1.0, the tolerance determines which
+        # nodes fail their check
+        for node, tol in zip('ABCDEFG', [2, 2, 0, 0, 0, 0, 2]):
+            test_graph.add_node(node, tolerance=tol,
+                                calibrate_function=cal_True)
+        for u, v in ['BA', 'CB', 'DC', 'ED', 'FE', 'EG']:
+            test_graph.add_edge(u, v)
+
+        self.assertEqual(test_graph.locate_fault('F'), 'C')
+        self.assertLess(test_graph._check_cnt, 5)
+        self.assertEqual(test_graph.locate_fault('B'), None)
+
+        test_graph.set_all_node_states('good')
+        test_graph.set_node_attribute(
+            'F', 'check_function',
+            'autodepgraph.node_functions.check_functions.test_check_False')
+        test_graph.cfg_fault_localisation = 'bisect'
+        test_graph.maintain_node('F', verbose=False)
+        # only the path from the fault up to the target is calibrated
+        self.assertEqual(test_graph._calib_cnt, 4)
+        for node in 'CDEF':
+            self.assertEqual(test_graph.get_node_state(node), 'good')
+
+    def test_fail_fast_check_order(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node in ['A', 'B', 'C', 'D']:
+            test_graph.add_node(node)
+        for dep in ['A', 'B', 'C']:
+            test_graph.add_edge('D', dep)
+        # without statistics the insertion order is kept
+        self.assertEqual(test_graph._ordered_dependencies('D'),
+                         ['A', 'B', 'C'])
+
+        test_graph.check_node('A')
+        stats = test_graph.nodes['A']['check_stats']
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['failures'], 1)
+        self.assertAlmostEqual(test_graph.failure_probability('A'), 2/3)
+        # failure probability per second: A 2/3, B 5/6, C 5
+        stats['duration'] = 1.
+
+        test_graph.nodes['B']['check_stats'] = {
+            'count': 10, 'failures': 0, 'duration': .1}
+        test_graph.nodes['C']['check_stats'] = {
+            'count': 10, 'failures': 5, 'duration': .1}
+        self.assertEqual(test_graph._ordered_dependencies('D'),
+                         ['C', 'B', 'A'])
+        test_graph.cfg_check_order = 'insertion'
+        self.assertEqual(test_graph._ordered_dependencies('D'),
+                         ['A', 'B', 'C'])
+
+    def test_adaptive_timeout(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.add_node('A', tolerance=2, timeout_min=10,
+                            timeout_max=1000)
+        test_graph.add_node('B', tolerance=2, adaptive_timeout=True)
+        # without drift estimate the minimum timeout is used
+        self.assertEqual(test_graph.estimate_timeout('A', .5), 10)
+        for i in range(5):
+            test_graph.history.record_check('A', .5 + .01*i, 'good', 0,
+                                            timestamp=i)
+        self.assertAlmostEqual(test_graph.nodes['A']['timeout'], np.inf)
+        # tolerance is reached after (2-.54)/.01 s
+        test_graph.cfg_timeout_safety = .5
+        self.assertAlmostEqual(test_graph.estimate_timeout('A', .54), 73)
+        self.assertEqual(test_graph.estimate_timeout('A', 1.99), 10)
+        self.assertEqual(test_graph.estimate_timeout('A', -100), 1000)
+
+        # the default check always returns 1.0, no drift
+        node_hash = test_graph.node_hash('B')
+        test_graph.check_node('B')
+        self.assertEqual(test_graph.node_timeout('B'),
+                         test_graph.cfg_timeout_min)
+        for i in range(3):
+            test_graph.check_node('B')
+        self.assertEqual(test_graph.node_timeout('B'),
+                         test_graph.cfg_timeout_max)
+        # the configured timeout is kept
+        self.assertEqual(test_graph.nodes['B']['timeout'], np.inf)
+        self.assertEqual(test_graph.node_hash('B'), node_hash)
+        test_graph.set_node_attribute('B', 'adaptive_timeout', False)
+        self.assertEqual(test_graph.node_timeout('B'), np.inf)
+
+    def test_transaction(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node in 'ABC':
+            test_graph.add_node(node)
+        test_graph.add_index('state')
+        monitor_updates = []
+        test_graph.update_monitor = lambda: monitor_updates.append(1)
+        changes = []
+        test_graph.add_state_listener(
+            lambda node, state, last_update: changes.append((node, state)))
+
+        with test_graph.transaction():
+            for node in 'ABC':
+                test_graph.set_node_state(node, 'needs calibration')
+            test_graph.set_node_attribute('A', 'qubit', 'q0')
+            with test_graph.transaction():
+                test_graph.set_node_description('B', 'explain node B')
+            # changes are visible to the thread making them
+            self.assertEqual(test_graph.get_node_state('A'),
+                             'needs calibration')
+            self.assertEqual(test_graph.get_node_attribute('A', 'qubit'),
+                             'q0')
+            # but are not applied until the transaction ends
+            self.assertEqual(test_graph.nodes['A']['state'], 'unknown')
+            self.assertEqual(monitor_updates, [])
+            with self.assertRaises(RuntimeError):
+                test_graph.maintain_node('A')
+            with self.assertRaises(RuntimeError):
+                test_graph.add_node('D')
+            with self.assertRaises(RuntimeError):
+                test_graph.add_edge('A', 'B')
+        self.assertNotIn('D', test_graph)
+        self.assertEqual(len(monitor_updates), 1)
+        self.assertEqual(len(changes), 3)
+        self.assertEqual(test_graph.query(state='needs calibration'),
+                         {'A', 'B', 'C'})
+        self.assertEqual(test_graph.nodes['A']['qubit'], 'q0')
+        self.assertEqual(test_graph.nodes['B']['description'],
+                         'explain node B')
+
+        with self.assertRaises(ZeroDivisionError):
+            with test_graph.transaction():
+                test_graph.set_node_state('A', 'good')
+                test_graph.set_node_attribute('A', 'qubit', 'q1')
+                1/0
+        self.assertEqual(test_graph.get_node_state('A'), 'needs calibration')
+        self.assertEqual(test_graph.nodes['A']['qubit'], 'q0')
+        self.assertEqual(len(monitor_updates), 1)
+
+        with self.assertRaises(IndexError):
+            with test_graph.transaction():
+                test_graph.set_node_state('A', 'very good')
+
+    def test_batch_check(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+        batch_check = ('autodepgraph.node_functions.check_functions'
+                       '.test_batch_check')
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.add_node('T', tolerance=2, calibrate_function=cal_True)
+        for i, tol in enumerate([1, 1, 1, 0]):
+            node = 'Q{} frequency'.format(i)
+            test_graph.add_node(node, tolerance=tol,
+                                calibrate_function=cal_True,
+                                batch_check_function=batch_check)
+            test_graph.add_edge('T', node)
+            test_graph.set_node_state(node, 'bad')
+        # not required by T
+        test_graph.add_node('Q4 frequency', batch_check_function=batch_check)
+
+        self.assertEqual(test_graph.maintain_node('T', verbose=False), 'good')
+        self.assertEqual(test_graph._batch_check_cnt, 1)
+        self.assertEqual(test_graph._check_cnt, 5)
+        self.assertEqual(test_graph._calib_cnt, 1)
+        for i in range(4):
+            self.assertEqual(
+                test_graph.get_node_state('Q{} frequency'.format(i)), 'good')
+        self.assertEqual(test_graph.get_node_state('Q4 frequency'),
+                         'unknown')
+
+        # outside of maintenance nodes are checked on their own
+        self.assertEqual(test_graph.check_node('Q3 frequency'),
+                         'needs calibration')
+        self.assertEqual(test_graph._batch_check_cnt, 2)
+
+    def test_speculative_calibration(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+        backend = _SpeculationBackend(['A', 'B'])
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.node_function_backend = backend
+        # the check returns 1.0, A needs calibration and B is good
+        test_graph.add_node('A', tolerance=0, calibrate_function=cal_True)
+        test_graph.add_node('B', tolerance=2, calibrate_function=cal_True)
+        test_graph.add_node('C', tolerance=0)
+        test_graph.cfg_speculation_threshold = .5
+
+        self.assertEqual(test_graph.maintain_node('A', verbose=False), 'good')
+        report = test_graph.last_run_report
+        self.assertEqual(report['node'], 'A')
+        self.assertEqual(report['speculative_calibrations'], 1)
+        self.assertEqual(report['committed'], 1)
+        self.assertEqual(report['discarded'], 0)
+        self.assertGreater(report['time_saved'], 0)
+        self.assertLessEqual(report['time_saved'], .5)
+        self.assertEqual(sorted(backend.calls),
+                         [('A', 'calibrate'), ('A', 'check')])
+        self.assertEqual(test_graph._calib_cnt, 1)
+
+        backend.calls.clear()
+        self.assertEqual(test_graph.maintain_node('B', verbose=False), 'good')
+        report = test_graph.last_run_report
+        self.assertEqual(report['committed'], 0)
+        self.assertEqual(report['discarded'], 1)
+        self.assertEqual(report['time_wasted'], .5)
+        self.assertEqual(sorted(backend.calls),
+                         [('B', 'calibrate'), ('B', 'check')])
+        self.assertEqual(test_graph.history.node_calibrations('B').size, 0)
+
+        # manual nodes are not calibrated speculatively
+        with self.assertRaises(ValueError):
+            test_graph.maintain_node('C', verbose=False)
+        self.assertEqual(
+            test_graph.last_run_report['speculative_calibrations'], 0)
+
+    def test_deadline(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node, calibration_duration in [('A', 10), ('B', 12), ('T', 5)]:
+            test_graph.add_node(node, calibrate_function=cal_True)
+            test_graph.nodes[node]['calibration_stats'] = {
+                'count': 1, 'failures': 0, 'duration': calibration_duration}
+        test_graph.add_edge('T', 'A')
+        test_graph.add_edge('T', 'B')
+
+        # 15 s minus 3.5 s expected for T leaves time for A but not for B
+        test_graph.set_node_state('A', 'needs calibration')
+        test_graph.set_node_state('B', 'needs calibration')
+        state = test_graph.maintain_node('T', verbose=False, deadline=15)
+        self.assertEqual(state, 'needs calibration')
+        report = test_graph.last_run_report
+        self.assertEqual(report['done'], [('A', 'calibrate'), ('T', 'check')])
+        self.assertEqual(report['skipped'], [
+            ('B', 'maintain', 'deadline'),
+            ('T', 'calibrate', 'dependencies deferred')])
+        self.assertEqual(report['state'], 'needs calibration')
+        self.assertEqual(report['confidence'], {'A': 1, 'B': 0, 'T': 0})
+
+        test_graph.set_node_state('A', 'needs calibration')
+        state = test_graph.maintain_node('T', verbose=False,
+                                         priorities={'B': 1})
+        self.assertEqual(state, 'good')
+        report = test_graph.last_run_report
+        self.assertEqual(report['done'], [
+            ('B', 'calibrate'), ('A', 'calibrate'), ('T', 'calibrate')])
+        self.assertEqual(report['state'], 'good')
+
+        # nodes whose calibration would be deferred are not calibrated
+        # speculatively
+        test_graph.cfg_speculation_threshold = .5
+        test_graph.set_node_state('B', 'needs calibration')
+        test_graph.maintain_node('T', verbose=False, deadline=5)
+        report = test_graph.last_run_report
+        self.assertEqual(report['done'], [('T', 'check')])
+        self.assertEqual(report['skipped'], [
+            ('B', 'maintain', 'deadline'),
+            ('T', 'calibrate', 'dependencies deferred')])
+        self.assertEqual(report['speculative_calibrations'], 0)
+        self.assertEqual(report['state'], 'needs calibration')
+
+    def test_checkpoint_resume(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+
+        def interrupted_calibration():
+            raise KeyboardInterrupt
+
+        def build_graph(calibrate_function):
+            test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+            test_graph.add_node('A', tolerance=2)
+            test_graph.add_node('B', calibrate_function=calibrate_function)
+            test_graph.add_node('T', tolerance=2)
+            test_graph.add_edge('T', 'A')
+            test_graph.add_edge('T', 'B')
+            test_graph.set_node_state('A', 'bad')
+            test_graph.set_node_state('B', 'needs calibration')
+            return test_graph
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'checkpoint.json')
+            test_graph = build_graph(interrupted_calibration)
+            test_graph.cfg_checkpoint_file = filename
+            test_graph.cfg_checkpoint_interval = 0
+            with self.assertRaises(KeyboardInterrupt):
+                test_graph.maintain_node('T', verbose=False)
+            checkpoint = read_checkpoint(filename)
+            self.assertFalse(checkpoint['finished'])
+            self.assertEqual([(e['node'], e['action'], e['state'])
+                              for e in checkpoint['completed']],
+                             [('A', 'check', 'good')])
+            self.assertEqual(checkpoint['pending'], ['B', 'T'])
+
+            # a new process starting from the states before the run
+            test_graph = build_graph(cal_True)
+            self.assertEqual(test_graph.resume(filename, verbose=False),
+                             'good')
+            # A is not checked again
+            self.assertEqual(test_graph._check_cnt, 1)
+            self.assertEqual(test_graph.get_node_state('A'), 'good')
+            self.assertTrue(read_checkpoint(filename)['finished'])
+
+    def test_compact_node_attributes(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.add_node('A')
+        test_graph.add_node('B', tolerance=.1,
+                            check_function=''.join(['test_', 'check']))
+        attrs = test_graph.nodes['A']
+        # defaults are not stored but still available
+        self.assertNotIn('tolerance', attrs.explicit())
+        self.assertNotIn('calibrate_function', attrs.explicit())
+        self.assertIn('tolerance', attrs)
+        self.assertEqual(nx.get_node_attributes(test_graph, 'tolerance'),
+                         {'A': 0, 'B': .1})
+        self.assertEqual(attrs['tolerance'], 0)
+        self.assertEqual(attrs['timeout'], np.inf)
+        self.assertEqual(attrs.get('calibrate_function'),
+                         test_graph.nodes['B']['calibrate_function'])
+        self.assertIs(test_graph.nodes['B']['check_function'], 'test_check')
+        self.assertEqual(test_graph.nodes['B']['tolerance'], .1)
+        self.assertEqual(repr(attrs), repr(dict(attrs.items())))
+        self.assertIn("'tolerance': 0", repr(attrs))
+        # drawing attributes are not stored in the graph
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            test_graph.draw_svg(os.path.join(tmp_dir, 'graph.svg'))
+        self.assertNotIn('fillcolor', attrs)
+
+        self.assertIn('maintain_A', dir(test_graph))
+        self.assertTrue(callable(test_graph.maintain_A))
+        with self.assertRaises(AttributeError):
+            test_graph.maintain_C
+
+        copied_graph = pickle.loads(pickle.dumps(test_graph))
+        self.assertEqual(copied_graph.nodes['A']['tolerance'], 0)
+        self.assertEqual(copied_graph.nodes['B']['tolerance'], .1)
+
+    def test_copy(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node in ['A', 'B', 'C']:
+            test_graph.add_node(node, calibrate_function=cal_True)
+        test_graph.add_edge('C', 'B')
+        test_graph.add_edge('B', 'A')
+        test_graph.add_index('state')
+        test_graph.set_node_state('A', 'good')
+        last_update = test_graph.nodes['A']['last_update']
+        node_hash = test_graph.node_hash('C')
+
+        copied_graph = test_graph.copy()
+        self.assertEqual(copied_graph.name, 'test graph')
+        self.assertEqual(copied_graph.nodes['A']['last_update'], last_update)
+        self.assertEqual(copied_graph.node_hash('C'), node_hash)
+        self.assertEqual(set(copied_graph.edges), set(test_graph.edges))
+
+        # changes to either graph are not visible in the other
+        copied_graph.set_node_state('A', 'bad')
+        test_graph.add_node('D')
+        test_graph.add_edge('D', 'C')
+        copied_graph.remove_node('B')
+        self.assertEqual(test_graph.get_node_state('A'), 'good')
+        self.assertEqual(test_graph.query(state='bad'), set())
+        self.assertEqual(copied_graph.query(state='bad'), {'A'})
+        self.assertNotIn('D', copied_graph)
+        self.assertTrue(test_graph.has_edge('C', 'B'))
+        self.assertEqual(test_graph.node_hash('C'), node_hash)
+        self.assertNotEqual(copied_graph.node_hash('C'), node_hash)
+
+        self.assertEqual(copied_graph.maintain_node('C', verbose=False),
+                         'good')
+        self.assertEqual(test_graph.get_node_state('C'), 'unknown')
+        self.assertEqual(len(test_graph.history.node_calibrations('A')), 0)
+
+        # node attribute dicts held while copying stay those of the graph
+        node_attrs = test_graph.nodes['A']
+        copied_graph = test_graph.copy()
+        node_attrs['tolerance'] = 5
+        self.assertEqual(copied_graph.nodes['A']['tolerance'], 0)
+        self.assertEqual(test_graph.nodes['A']['tolerance'], 5)
+        node_attrs['tolerance'] = 7
+        self.assertIs(test_graph.nodes['A'], node_attrs)
+        self.assertEqual(test_graph.nodes['A']['tolerance'], 7)
+        self.assertEqual(copied_graph.nodes['A']['tolerance'], 0)
+        copied_graph.nodes['A']['tolerance'] = 6
+        self.assertEqual(test_graph.nodes['A']['tolerance'], 7)
+
+        # edge data is copied once per graph
+        test_graph.add_edge('C', 'A', weight=1)
+        copied_graph = test_graph.copy()
+        copied_graph.edges['C', 'A']['weight'] = 2
+        self.assertEqual(test_graph.edges['C', 'A']['weight'], 1)
+        for graph in [test_graph, copied_graph]:
+            self.assertIs(graph._succ['C']['A'], graph._pred['A']['C'])
+            self.assertIs(graph._adj, graph._succ)
+
+    def test_subgraph_views(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node in ['A', 'B', 'C', 'D']:
+            test_graph.add_node(node, calibrate_function=cal_True,
+                                state='bad')
+        test_graph.add_edge('C', 'B')
+        test_graph.add_edge('B', 'A')
+        test_graph.add_edge('D', 'A')
+        test_graph.add_index('state')
+
+        view = test_graph.dependency_view('B')
+        self.assertEqual(set(view), {'A', 'B'})
+        self.assertEqual(set(view.edges), {('B', 'A')})
+        self.assertEqual(view.query(state='bad'), {'A', 'B'})
+        with self.assertRaises(nx.NetworkXError):
+            view.add_node('E')
+
+        # the view refers to the nodes of the graph, also after copying it
+        copied_graph = test_graph.copy()
+        self.assertEqual(view.maintain_node('B', verbose=False), 'good')
+        self.assertEqual(test_graph.get_node_state('A'), 'good')
+        self.assertEqual(copied_graph.get_node_state('A'), 'bad')
+        self.assertEqual(test_graph.query(state='bad'), {'C', 'D'})
+        self.assertEqual(len(test_graph.history.node_calibrations('A')), 1)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            view.draw_svg(os.path.join(tmp_dir, 'view.svg'))
+
+        copied_view = view.copy()
+        copied_view.add_node('E')
+        self.assertEqual(set(copied_view), {'A', 'B', 'E'})
+        self.assertNotIn('E', test_graph)
+
+    def test_group_by_setup(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.cfg_check_order = 'insertion'
+        test_graph.add_node('R', tolerance=2)
+        for node, setup in [('A1', 'flux'), ('B1', 'readout'), ('C', None),
+                            ('A2', 'flux'), ('B2', 'readout')]:
+            test_graph.add_node(node, setup=setup, tolerance=2, state='bad',
+                                setup_cost=5 if setup == 'flux' else 1)
+            test_graph.add_edge('R', node)
+        self.assertIsNone(test_graph.node_setup('C'))
+        self.assertEqual(test_graph.node_setup('A1'), ((), 'flux'))
+
+        with Recorder(test_graph) as recorder:
+            test_graph.maintain_node('R', verbose=False)
+        report = test_graph.last_run_report
+        self.assertEqual([e['node'] for e in recorder.events],
+                         ['C', 'A1', 'A2', 'B1', 'B2', 'R'])
+        self.assertEqual(report['setup_switches'], 2)
+        self.assertEqual(report['setup_switches_saved'], 2)
+        self.assertEqual(report['setup_time'], 6)
+
+        # priorities take precedence over grouping
+        test_graph.cfg_group_by_setup = False
+        self.assertEqual(test_graph._ordered_dependencies('R'),
+                         ['A1', 'B1', 'C', 'A2', 'B2'])
+        test_graph.cfg_group_by_setup = True
+        for node in ['A1', 'B1', 'C', 'A2', 'B2']:
+            test_graph.set_node_state(node, 'bad')
+        with Recorder(test_graph) as recorder:
+            test_graph.maintain_node('R', verbose=False,
+                                     priorities={'B2': 1})
+        report = test_graph.last_run_report
+        self.assertEqual([e['node'] for e in recorder.events],
+                         ['B2', 'C', 'B1', 'A1', 'A2', 'R'])
+        self.assertEqual(report['setup_switches'], 2)
+
+        # only the checks and calibrations that are made count
+        test_graph.maintain_node('R', verbose=False)
+        report = test_graph.last_run_report
+        self.assertEqual(report['done'], [('R', 'check')])
+        self.assertEqual(report['setup_switches'], 0)
+        self.assertEqual(report['setup_switches_saved'], 0)
+
+        # unhashable setups are compared by value
+        test_graph.set_node_attribute('A1', 'setup', {'awg': 'rabi', 'n': 2})
+        test_graph.set_node_attribute('A2', 'setup', {'n': 2, 'awg': 'rabi'})
+        self.assertEqual(test_graph.node_setup('A1'),
+                         test_graph.node_setup('A2'))
+        hash(test_graph.node_setup('A1'))
+        test_graph.set_node_state('A1', 'bad')
+        self.assertEqual(test_graph.maintain_node('R', verbose=False), 'good')
+
     def test_plotting_mpl(self):
         self.test_graph.draw_mpl()
 
@@ -132,6 +738,41 @@ class Test_Graph(TestCase):
         self.assertEqual(DAG.get_node_state('Chevron q0-q1'), 'good')
         self.assertEqual(DAG.get_node_state('CZ q0-q1'), 'needs calibration')
 
+    def test_clustered_plotting(self):
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for qubit in ['q0', 'q1', 'q2']:
+            for node in ['freq', 'pi pulse', 'T1']:
+                test_graph.add_node('{} {}'.format(node, qubit), qubit=qubit)
+            test_graph.add_edge('pi pulse ' + qubit, 'freq ' + qubit)
+            test_graph.add_edge('T1 ' + qubit, 'pi pulse ' + qubit)
+        test_graph.add_node('CZ', state='good')
+        test_graph.add_edge('CZ', 'T1 q0')
+        test_graph.add_edge('CZ', 'T1 q1')
+        test_graph.set_node_state('T1 q0', 'bad')
+
+        clustered = test_graph.cluster_graph('qubit')
+        self.assertEqual(set(clustered.nodes()),
+                         {'CZ', 'qubit: q0', 'qubit: q1', 'qubit: q2'})
+        self.assertEqual(set(clustered.edges()),
+                         {('CZ', 'qubit: q0'), ('CZ', 'qubit: q1')})
+        self.assertEqual(clustered.nodes['qubit: q0']['state'], 'bad')
+        self.assertEqual(clustered.nodes['qubit: q0']['members'], 3)
+        self.assertEqual(clustered.nodes['qubit: q1']['state'], 'unknown')
+        self.assertEqual(clustered.nodes['CZ']['state'], 'good')
+
+        clustered = test_graph.cluster_graph('qubit', expand=['q1'])
+        self.assertEqual(len(clustered), 6)
+        self.assertIn(('CZ', 'T1 q1'), clustered.edges())
+
+        fn = os.path.join(test_dir, 'clustered_graph.svg')
+        test_graph.draw_svg(fn, cluster_by='qubit')
+        self.assertTrue(os.path.exists(fn))
+        os.remove(fn)
+        test_graph.cfg_plot_mode_args['cluster_by'] = 'qubit'
+        test_graph.expand_cluster('q0')
+        test_graph.draw_mpl()
+        self.assertEqual(len(test_graph._graph_to_draw()), 6)
+
     def test_write_read_yaml(self):
         """
         Mostly an example on how to read and write, but also test for
@@ -0,0 +1,71 @@
+from unittest import TestCase
+import pickle
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.hashing import HashCache, diff_graphs
+
+
+def chip_graph(qubits=('q0', 'q1', 'q2')):
+    dag = AutoDepGraph_DAG('chip', cfg_plot_mode=None)
+    dag.add_node('chip')
+    for qubit in qubits:
+        for step in ['resonator', 'frequency', 'T1']:
+            dag.add_node('{} {}'.format(qubit, step), tolerance=.1)
+        dag.add_edge('{} frequency'.format(qubit),
+                     '{} resonator'.format(qubit))
+        dag.add_edge('{} T1'.format(qubit), '{} frequency'.format(qubit))
+        dag.add_edge('chip', '{} T1'.format(qubit))
+    return dag
+
+
+class Test_Hashing(TestCase):
+
+    def test_identical_subdags(self):
+        dag = chip_graph()
+        self.assertEqual(dag.node_hash('q0 T1'), dag.node_hash('q1 T1'))
+        self.assertNotEqual(dag.node_hash('q0 T1'),
+                            dag.node_hash('q0 frequency'))
+        self.assertNotEqual(dag.node_hash('q0 T1', names=True),
+                            dag.node_hash('q1 T1', names=True))
+
+        # changes invalidate the node and the nodes depending on it only
+        dag.node_hash('chip')
+        dag.set_node_attribute('q0 resonator', 'tolerance', .2)
+        self.assertNotIn('q0 T1', dag._hashes[False])
+        self.assertIn('q1 T1', dag._hashes[False])
+        self.assertNotEqual(dag.node_hash('q0 T1'), dag.node_hash('q1 T1'))
+        dag.set_node_attribute('q0 resonator', 'tolerance', .1)
+        self.assertEqual(dag.node_hash('q0 T1'), dag.node_hash('q1 T1'))
+        # attributes that are not hashed keep the cached hashes
+        dag.set_node_attribute('q0 resonator', 'qubit', 'q0')
+        self.assertIn('q0 T1', dag._hashes[False])
+
+        dag.remove_edge('q0 frequency', 'q0 resonator')
+        self.assertNotEqual(dag.node_hash('q0 T1'), dag.node_hash('q1 T1'))
+
+    def test_hash_cache(self):
+        dag = chip_graph()
+        cache = HashCache(maxsize=2)
+        calls = []
+        for qubit in ['q0', 'q1', 'q2']:
+            cache.get(dag, '{} T1'.format(qubit),
+                      lambda: calls.append(qubit) or len(calls))
+        self.assertEqual(calls, ['q0'])
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_diff_graphs(self):
+        old = chip_graph()
+        new = pickle.loads(pickle.dumps(old))
+        self.assertEqual(old.graph_hash(names=True),
+                         new.graph_hash(names=True))
+        self.assertEqual(diff_graphs(old, new),
+                         {'added': set(), 'removed': set(),
+                          'changed': set()})
+
+        new.set_node_attribute('q1 resonator', 'tolerance', .3)
+        new.remove_node('q2 T1')
+        new.add_node('q2 T2')
+        new.add_edge('q2 T2', 'q2 frequency')
+        new.add_edge('chip', 'q2 T2')
+        self.assertEqual(diff_graphs(old, new),
+                         {'added': {'q2 T2'}, 'removed': {'q2 T1'},
+                          'changed': {'q1 resonator', 'chip'}})
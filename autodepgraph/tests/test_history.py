@@ -0,0 +1,86 @@
+from unittest import TestCase
+import os
+import tempfile
+import numpy as np
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.history import GraphHistory
+
+
+class Test_History(TestCase):
+
+    def test_ring_buffer_wraps(self):
+        history = GraphHistory(length=4)
+        for i in range(10):
+            history.record_check('A', float(i), 'good', .1, timestamp=i)
+        checks = history.node_checks('A')
+        self.assertEqual(len(checks), 4)
+        np.testing.assert_array_equal(checks['value'], [6, 7, 8, 9])
+        np.testing.assert_array_equal(history.node_checks('A', 2)['value'],
+                                      [8, 9])
+        self.assertEqual(history.checks.data.shape[1], 4)
+
+    def test_missing_and_bad_checks(self):
+        history = GraphHistory(length=4)
+        history.record_check('A', 1., 'needs calibration', .1)
+        history.record_check('A', False, 'bad', .1)
+        self.assertEqual(len(history.node_checks('B')), 0)
+        values = history.check_values(['A', 'B'], n=3)
+        self.assertEqual(values.shape, (2, 3))
+        self.assertTrue(np.isnan(values[0, 0]))
+        self.assertEqual(values[0, 1], 1.)
+        self.assertTrue(np.isnan(values[0, 2]))
+        self.assertTrue(np.isnan(values[1]).all())
+        self.assertEqual(history.node_checks('A')['state'][-1],
+                         history.node_states.index('bad'))
+
+    def test_trending_up(self):
+        history = GraphHistory(length=20)
+        for i in range(15):
+            history.record_check('up', .1*i, 'good', .1, timestamp=i)
+            history.record_check('down', -.1*i, 'good', .1, timestamp=i)
+            history.record_check('flat', 1., 'good', .1, timestamp=i)
+        history.record_check('short', 1., 'good', .1, timestamp=0)
+        self.assertEqual(history.trending_up(n=10), ['up'])
+        slopes = history.check_slopes(['up', 'down', 'flat', 'short'])
+        np.testing.assert_allclose(slopes[:3], [.1, -.1, 0], atol=1e-12)
+        self.assertTrue(np.isnan(slopes[3]))
+
+    def test_drift_rate(self):
+        history = GraphHistory(length=10)
+        self.assertTrue(np.isnan(history.drift_rate('A')))
+        for i in range(5):
+            history.record_check('A', .5 + .01*i, 'good', .1, timestamp=i)
+        self.assertAlmostEqual(history.drift_rate('A'), .01)
+        # only checks since the last successful calibration are used
+        history.record_calibration('A', True, 'good', 1., timestamp=5)
+        self.assertTrue(np.isnan(history.drift_rate('A')))
+        for i in range(6, 10):
+            history.record_check('A', .1*i, 'good', .1, timestamp=i)
+        self.assertAlmostEqual(history.drift_rate('A'), .1)
+        self.assertAlmostEqual(history.drift_rate('A', sigma=2), .1)
+
+    def test_save_load(self):
+        history = GraphHistory(length=5)
+        for i in range(7):
+            history.record_check('A', float(i), 'good', .1)
+        history.record_calibration('B', True, 'good', 2.)
+        fn = os.path.join(tempfile.mkdtemp(), 'history.npz')
+        history.save(fn)
+        loaded = GraphHistory.load(fn)
+        np.testing.assert_array_equal(loaded.node_checks('A'),
+                                      history.node_checks('A'))
+        self.assertEqual(loaded.node_calibrations('B')['duration'], [2.])
+
+    def test_graph_records_history(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+        test_graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        test_graph.add_node('A', calibrate_function=cal_True)
+        test_graph.maintain_node('A', verbose=False)
+        checks = test_graph.history.node_checks('A')
+        self.assertEqual(len(checks), 1)
+        self.assertEqual(checks['value'][0], 1.)
+        calibrations = test_graph.history.node_calibrations('A')
+        self.assertEqual(calibrations['value'][0], 1.)
+        self.assertEqual(calibrations['state'][0],
+                         test_graph.node_states.index('good'))
@@ -0,0 +1,87 @@
+from unittest import TestCase
+import time
+from unittest import mock
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.indexing import function_instrument
+
+
+class Test_Indexing(TestCase):
+
+    def setUp(self):
+        self.graph = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for qubit in ['Q1', 'Q2']:
+            self.graph.add_node('freq ' + qubit, qubit=qubit,
+                                calibrate_function='VNA.find_resonator')
+            self.graph.add_node('pulse ' + qubit, qubit=qubit,
+                                calibrate_function='AWG8.calibrate_pulse')
+        self.graph.add_node('CZ')
+        self.graph.add_index('state')
+        self.graph.add_index('qubit')
+        self.graph.add_index('instrument')
+
+    def test_function_instrument(self):
+        self.assertEqual(function_instrument('AWG8.calibrate'), 'AWG8')
+        self.assertIsNone(function_instrument(
+            'autodepgraph.node_functions.check_functions.return_fixed_value'))
+        self.assertIsNone(function_instrument(print))
+
+    def test_query(self):
+        self.assertEqual(self.graph.query(qubit='Q2'),
+                         {'freq Q2', 'pulse Q2'})
+        self.assertEqual(self.graph.query(qubit='Q2', instrument='AWG8'),
+                         {'pulse Q2'})
+        self.assertEqual(self.graph.query(qubit='Q3'), set())
+        self.assertEqual(len(self.graph.query(state='unknown')), 5)
+        # criteria without index are compared to the node attributes
+        self.assertEqual(self.graph.query(qubit='Q1', tolerance=0),
+                         {'freq Q1', 'pulse Q1'})
+
+    def test_indexes_are_updated(self):
+        self.graph.set_node_state('pulse Q2', 'needs calibration')
+        self.assertEqual(
+            self.graph.query(qubit='Q2', state='needs calibration'),
+            {'pulse Q2'})
+        self.graph.set_node_attribute('CZ', 'qubit', 'Q2')
+        self.graph.set_node_attribute('CZ', 'calibrate_function',
+                                      'AWG8.calibrate_cz')
+        self.assertEqual(self.graph.query(qubit='Q2', instrument='AWG8'),
+                         {'pulse Q2', 'CZ'})
+        self.graph.add_node('T1 Q2', qubit='Q2', state='needs calibration')
+        self.assertEqual(
+            self.graph.query(qubit='Q2', state='needs calibration'),
+            {'pulse Q2', 'T1 Q2'})
+        self.graph.remove_node('pulse Q2')
+        self.assertEqual(self.graph.query(instrument='AWG8'),
+                         {'pulse Q1', 'CZ'})
+        self.graph.set_all_node_states('good')
+        self.assertEqual(len(self.graph.query(state='good')), 5)
+
+    def test_expired_state(self):
+        self.graph.set_node_state('CZ', 'good')
+        self.graph.set_node_attribute('CZ', 'timeout', 0)
+        self.assertEqual(self.graph.query(state='good'), set())
+        self.assertIn('CZ', self.graph.query(state='unknown'))
+
+    def test_expired_state_in_index(self):
+        self.graph.add_node('T1', timeout=.01)
+        self.graph.set_node_state('T1', 'good')
+        self.assertEqual(self.graph.query(state='good'), {'T1'})
+        time.sleep(.02)
+        self.assertIn('T1', self.graph.query(state='unknown'))
+        self.assertEqual(self.graph.query(state='good'), set())
+
+    def test_only_expired_states_are_read(self):
+        for node in self.graph.nodes():
+            self.graph.set_node_attribute(node, 'timeout', 3600)
+        self.graph.set_all_node_states('good')
+        # the adaptive timeout is only used with cfg_adaptive_timeouts
+        self.graph.set_node_attribute('CZ', 'adaptive_timeout_value', 0)
+        read = []
+        get_node_state = self.graph.get_node_state
+        with mock.patch.object(self.graph, 'get_node_state',
+                               side_effect=lambda n: read.append(n) or
+                               get_node_state(n)):
+            self.assertEqual(len(self.graph.query(state='good')), 5)
+            self.assertEqual(read, ['CZ'])
+            self.assertEqual(len(self.graph.query(state='good')), 5)
+            self.assertEqual(read, ['CZ'])
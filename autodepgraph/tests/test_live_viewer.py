@@ -0,0 +1,73 @@
+from unittest import TestCase
+import json
+import time
+from urllib.request import urlopen
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.live_viewer import LiveViewer
+from autodepgraph import visualization as vis
+
+
+def read_event(stream):
+    """ Return the name and data of the next event of a stream """
+    event = data = None
+    for line in stream:
+        line = line.decode().rstrip('\n')
+        if line.startswith('event: '):
+            event = line[len('event: '):]
+        elif line.startswith('data: '):
+            data = json.loads(line[len('data: '):])
+        elif not line and event is not None:
+            return event, data
+
+
+class Test_LiveViewer(TestCase):
+
+    def test_live_viewer(self):
+        dag = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node in ['A', 'B']:
+            dag.add_node(node)
+        dag.add_edge('A', 'B')
+        with LiveViewer(dag, keepalive=.1) as viewer:
+            with urlopen(viewer.url, timeout=10) as response:
+                self.assertIn(b'EventSource', response.read())
+            with urlopen(viewer.url + 'layout.svg', timeout=10) as response:
+                layout = response.read()
+            self.assertIn(b'<title>A</title>', layout)
+            self.assertIs(viewer.layout(), viewer.layout())
+            with urlopen(viewer.url + 'states', timeout=10) as response:
+                self.assertEqual(json.load(response),
+                                 {'A': vis.state_cmap['unknown'],
+                                  'B': vis.state_cmap['unknown']})
+
+            with urlopen(viewer.url + 'events', timeout=10) as events:
+                self.assertEqual(read_event(events)[0], 'states')
+                dag.set_node_state('B', 'good')
+                self.assertEqual(read_event(events),
+                                 ('states', {'B': vis.state_cmap['good']}))
+                # attributes that do not change the layout
+                svg = viewer.layout()
+                dag.set_node_attribute('A', 'tolerance', .5)
+                time.sleep(.3)
+                self.assertIs(viewer.layout(), svg)
+                dag.set_node_state('A', 'good')
+                self.assertEqual(read_event(events),
+                                 ('states', {'A': vis.state_cmap['good']}))
+                dag.add_node('C')
+                self.assertEqual(read_event(events)[0], 'layout')
+            # the layout is only computed again after the graph changed
+            self.assertNotEqual(viewer.layout(), layout)
+            self.assertIs(viewer.layout(), viewer.layout())
+
+    def test_live_plot_mode(self):
+        dag = AutoDepGraph_DAG('test graph', cfg_plot_mode='live')
+        dag.add_node('A')
+        url = dag.open_live_viewer(open_browser=False)
+        try:
+            dag.set_node_state('A', 'good')
+            self.assertEqual(dag.open_live_viewer(open_browser=False), url)
+            with urlopen(url + 'states', timeout=10) as response:
+                self.assertEqual(json.load(response),
+                                 {'A': vis.state_cmap['good']})
+            self.assertNotIn('_live_viewer', dag.__getstate__())
+        finally:
+            dag._live_viewer.stop()
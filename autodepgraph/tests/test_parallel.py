@@ -0,0 +1,65 @@
+from unittest import TestCase
+from datetime import datetime
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.parallel import components, maintain_components
+
+cal_True = ('autodepgraph.node_functions.calibration_functions'
+            '.test_calibration_True')
+not_implemented = ('autodepgraph.node_functions.calibration_functions'
+                   '.NotImplementedCalibration')
+
+
+def lines_graph(n_lines=3):
+    """ Graph with a chain of nodes per readout line """
+    dag = AutoDepGraph_DAG('lines', cfg_plot_mode=None)
+    for line in range(n_lines):
+        previous = None
+        for step in ['resonator', 'qubit', 'readout']:
+            node = 'line {} {}'.format(line, step)
+            dag.add_node(node, calibrate_function=cal_True, state='bad',
+                         tolerance=2)
+            if previous is not None:
+                dag.add_edge(node, previous)
+            previous = node
+    return dag
+
+
+class Test_Parallel(TestCase):
+
+    def test_components(self):
+        dag = lines_graph()
+        self.assertEqual(len(components(dag)), 3)
+        self.assertEqual(components(dag, ['line 1 qubit']),
+                         [{'line 1 resonator', 'line 1 qubit',
+                           'line 1 readout'}])
+
+    def test_maintain_components(self):
+        dag = lines_graph()
+        # the last line can not be calibrated
+        dag.add_node('line 2 resonator', calibrate_function=not_implemented,
+                     state='needs calibration')
+        streamed = []
+        dag.add_state_listener(
+            lambda node, state, last_update: streamed.append((node, state)))
+        t0 = datetime.now()
+
+        result = maintain_components(dag, processes=2)
+        self.assertEqual(set(result['states']),
+                         {'line 0 readout', 'line 1 readout',
+                          'line 2 readout'})
+        self.assertEqual(result['states']['line 0 readout'], 'good')
+        self.assertEqual(list(result['errors']), ['line 2 readout'])
+        self.assertIn('ValueError', result['errors']['line 2 readout'])
+        self.assertEqual(result['reports']['line 1 readout']['state'],
+                         'good')
+
+        for line in [0, 1]:
+            for step in ['resonator', 'qubit', 'readout']:
+                node = 'line {} {}'.format(line, step)
+                self.assertEqual(dag.nodes[node]['state'], 'good')
+                self.assertGreater(dag.nodes[node]['last_update'], t0)
+                self.assertEqual(len(dag.history.node_checks(node)), 1)
+                self.assertIn((node, 'good'), streamed)
+        self.assertEqual(dag.nodes['line 2 resonator']['state'], 'bad')
+        self.assertIn('check_stats', dag.nodes['line 0 qubit'])
+        self.assertEqual((dag._calib_cnt, dag._check_cnt), (2, 6))
@@ -0,0 +1,89 @@
+from unittest import TestCase
+import os
+import tempfile
+import time
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.replay import Recorder, ReplayBackend, load_trace
+
+cal_True_delayed = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True_delayed')
+cal_True = ('autodepgraph.node_functions.calibration_functions'
+            '.test_calibration_True')
+batch_check = ('autodepgraph.node_functions.check_functions'
+               '.test_batch_check')
+
+
+def build_graph(calibrate_function):
+    dag = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+    dag.add_node('A', calibrate_function=calibrate_function)
+    dag.add_node('B', calibrate_function=calibrate_function,
+                 batch_check_function=batch_check, tolerance=1)
+    dag.add_node('C', calibrate_function=calibrate_function,
+                 batch_check_function=batch_check, tolerance=1)
+    dag.add_node('D')
+    dag.add_edge('D', 'A')
+    dag.add_edge('D', 'B')
+    dag.add_edge('D', 'C')
+    dag.add_edge('B', 'A')
+    for node in 'BC':
+        dag.set_node_state(node, 'bad')
+    return dag
+
+
+class Test_Replay(TestCase):
+
+    def test_record_and_replay(self):
+        dag = build_graph(cal_True_delayed)
+        with Recorder(dag) as recorder:
+            with self.assertRaises(ValueError):
+                dag.maintain_node('D', verbose=False)
+        self.assertIsNone(dag.node_function_backend)
+        kinds = [(e['node'], e['kind']) for e in recorder.events]
+        self.assertIn(('B', 'batch_check'), kinds)
+        self.assertIn(('A', 'calibrate'), kinds)
+        self.assertEqual(recorder.events[-1]['error']['type'],
+                         'NotImplementedError')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'run.trace.gz')
+            recorder.save(filename)
+            header, events = load_trace(filename)
+            self.assertEqual(header['graph'], 'test graph')
+            self.assertEqual(len(events), len(recorder.events))
+            replay = ReplayBackend.load(filename)
+
+        # the replayed graph has no working calibration functions and
+        # visits the nodes in a different order
+        replay_dag = build_graph(
+            'autodepgraph.node_functions.calibration_functions'
+            '.NotImplementedCalibration')
+        replay_dag.cfg_check_order = 'insertion'
+        t0 = time.perf_counter()
+        with replay.attached(replay_dag):
+            with self.assertRaises(ValueError):
+                replay_dag.maintain_node('D', verbose=False)
+        self.assertLess(time.perf_counter() - t0, .5)
+        self.assertGreater(replay.simulated_time, .5)
+        for node in 'ABC':
+            self.assertEqual(replay_dag.get_node_state(node),
+                             dag.get_node_state(node))
+        self.assertEqual(replay_dag._calib_cnt, dag._calib_cnt)
+
+    def test_missing_recordings(self):
+        dag = build_graph(cal_True)
+        with Recorder(dag) as recorder:
+            dag.calibrate_node('A')
+        replay = ReplayBackend(recorder.events, on_missing='raise')
+        with replay.attached(dag):
+            self.assertTrue(dag.calibrate_node('A'))
+            # the KeyError is handled as a failed calibration
+            self.assertFalse(dag.calibrate_node('A'))
+            with self.assertRaises(KeyError):
+                dag.check_node('D')
+        self.assertEqual(replay.missing, [('A', 'calibrate'),
+                                          ('D', 'check')])
+
+        replay = ReplayBackend(recorder.events)
+        with replay.attached(dag):
+            self.assertTrue(dag.calibrate_node('A'))
+            self.assertTrue(dag.calibrate_node('A'))
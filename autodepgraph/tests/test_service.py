@@ -0,0 +1,133 @@
+from unittest import TestCase
+import os
+import queue
+import socket
+import tempfile
+import threading
+from datetime import datetime
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.service import GraphServer, GraphClient
+
+
+class Test_Service(TestCase):
+
+    def setUp(self):
+        cal_True = ('autodepgraph.node_functions.calibration_functions'
+                    '.test_calibration_True')
+        self.dag = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node in ['A', 'B', 'C']:
+            self.dag.add_node(node, calibrate_function=cal_True)
+        self.dag.add_node('D')
+        self.dag.add_edge('B', 'A')
+        self.dag.add_edge('C', 'B')
+        self.address = os.path.join(tempfile.mkdtemp(), 'adg.sock')
+        self.server = GraphServer(self.dag, self.address)
+        self.server.start()
+        self.client = GraphClient(self.address, timeout=10)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_proxy_methods(self):
+        self.assertEqual(self.client.get_node_state('A'), 'unknown')
+        self.assertEqual(self.client.maintain_node('C'), 'good')
+        self.assertEqual(self.dag.get_node_state('C'), 'good')
+        self.client.set_node_state('A', 'needs calibration')
+        self.assertEqual(self.dag.get_node_state('A'), 'needs calibration')
+        self.client.set_node_attribute('A', 'qubit', 'q0')
+        self.assertEqual(self.client.get_node_attribute('A', 'qubit'), 'q0')
+        self.assertEqual(set(self.client.nodes()), {'A', 'B', 'C', 'D'})
+
+        snapshot = self.client.snapshot()
+        self.assertEqual(snapshot['C']['state'], 'good')
+        self.assertIsInstance(snapshot['C']['last_update'], datetime)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.client.maintain_node('D')
+        with self.assertRaises(IndexError):
+            self.client.set_node_state('A', 'very good')
+        with self.assertRaises(KeyError):
+            self.client.get_node_state('E')
+        with self.assertRaises(AttributeError):
+            self.client.call('remove_node', 'A')
+        # the connection remains usable after errors
+        self.assertEqual(self.client.get_node_state('A'), 'unknown')
+
+    def test_pipelining_and_batches(self):
+        futures = [self.client.call_async('get_node_state', n)
+                   for n in ['A', 'B', 'C', 'D']*100]
+        self.assertEqual({f.result(10) for f in futures}, {'unknown'})
+
+        with self.client.batch():
+            maintained = self.client.call_async('maintain_node', 'B')
+            state = self.client.call_async('get_node_state', 'B')
+        self.assertEqual(maintained.result(10), 'good')
+        self.assertEqual(state.result(10), 'good')
+
+    def test_subscribe(self):
+        events = queue.Queue()
+        self.client.subscribe(
+            lambda node, state, last_update: events.put((node, state)),
+            nodes=['A'])
+        self.dag.set_node_state('B', 'good')
+        self.dag.set_node_state('A', 'bad')
+        self.assertEqual(events.get(timeout=10), ('A', 'bad'))
+        self.client.unsubscribe()
+        self.dag.set_node_state('A', 'good')
+        self.assertEqual(self.client.get_node_state('A'), 'good')
+        self.assertTrue(events.empty())
+
+    def test_several_subscribers(self):
+        a_events, b_events = queue.Queue(), queue.Queue()
+
+        def a_callback(node, state, last_update):
+            a_events.put((node, state))
+
+        self.client.subscribe(a_callback, nodes=['A'])
+        self.client.subscribe(
+            lambda node, state, last_update: b_events.put((node, state)),
+            nodes=['B'])
+        self.dag.set_node_state('A', 'bad')
+        self.dag.set_node_state('B', 'bad')
+        self.assertEqual(a_events.get(timeout=10), ('A', 'bad'))
+        self.assertEqual(b_events.get(timeout=10), ('B', 'bad'))
+        self.client.unsubscribe(a_callback)
+        self.dag.set_node_state('A', 'good')
+        self.dag.set_node_state('B', 'good')
+        self.assertEqual(b_events.get(timeout=10), ('B', 'good'))
+        self.assertTrue(a_events.empty())
+        self.assertTrue(b_events.empty())
+
+    def test_several_clients(self):
+        with GraphClient(self.address, timeout=10) as other:
+            self.client.set_node_state('D', 'good')
+            self.assertEqual(other.get_node_state('D'), 'good')
+
+    def test_subscriber_calls_client(self):
+        states = queue.Queue()
+        self.client.subscribe(
+            lambda node, state, last_update: states.put(
+                self.client.get_node_state(node)), nodes=['A'])
+        self.dag.set_node_state('A', 'bad')
+        self.assertEqual(states.get(timeout=10), 'bad')
+
+    def test_client_not_reading(self):
+        # a subscriber that does not read its state changes
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(self.address)
+            s.sendall(b'{"id": 1, "method": "subscribe"}\n')
+            with s.makefile('rb') as f:
+                self.assertIn(b'"result"', f.readline())
+            self.server.max_pending = 1000
+
+            def set_states():
+                for i in range(20000):
+                    self.dag.set_node_state(
+                        'A', 'good' if i % 2 else 'bad')
+            t = threading.Thread(target=set_states, daemon=True)
+            t.start()
+            t.join(30)
+            self.assertFalse(t.is_alive())
+            self.assertEqual(self.client.get_node_state('A'), 'good')
@@ -0,0 +1,54 @@
+from unittest import TestCase, skipIf
+import multiprocessing
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.shared_state import (SharedStateReader, SharedStateWriter,
+                                       shared_memory)
+
+
+def read_states(name, results):
+    with SharedStateReader(name) as reader:
+        results.put(reader.states())
+
+
+@skipIf(shared_memory is None, 'requires Python 3.8 or later')
+class Test_SharedState(TestCase):
+
+    def test_publish_states(self):
+        dag = AutoDepGraph_DAG('test graph', cfg_plot_mode=None)
+        for node in ['A', 'B']:
+            dag.add_node(node)
+        dag.set_node_state('A', 'good')
+        with SharedStateWriter(dag) as writer:
+            reader = SharedStateReader(writer.name)
+            self.assertEqual(reader.graph_name, 'test graph')
+            self.assertEqual(reader.get_state('A'), 'good')
+            self.assertEqual(reader.states()['B'][0], 'unknown')
+            self.assertEqual(reader.states()['A'][1],
+                             dag.nodes['A']['last_update'])
+            with self.assertRaises(ValueError):
+                reader.state_codes[0] = 0
+
+            version = reader.version
+            dag.set_node_state('B', 'needs calibration')
+            self.assertEqual(reader.version, version + 2)
+            self.assertEqual(reader.get_state('B'), 'needs calibration')
+
+            # nodes added later are not published
+            dag.add_node('C')
+            self.assertNotIn('C', reader.states())
+            reader.close()
+
+            # readers in other processes
+            context = multiprocessing.get_context('spawn')
+            results = context.Queue()
+            process = context.Process(target=read_states,
+                                      args=(writer.name, results))
+            process.start()
+            states = results.get(timeout=30)
+            process.join()
+            self.assertEqual(states['B'][0], 'needs calibration')
+            with SharedStateReader(writer.name) as reader:
+                self.assertEqual(reader.get_state('A'), 'good')
+        with self.assertRaises(FileNotFoundError):
+            SharedStateReader(writer.name)
+        dag.set_node_state('A', 'bad')
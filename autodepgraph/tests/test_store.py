@@ -0,0 +1,100 @@
+from unittest import TestCase
+import os
+import pickle
+import tempfile
+from autodepgraph.graph import AutoDepGraph_DAG
+from autodepgraph.store import GraphStore, open_graph, write_store
+
+cal_True = ('autodepgraph.node_functions.calibration_functions'
+            '.test_calibration_True')
+
+
+class Test_Store(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, 'graph.adg')
+        dag = AutoDepGraph_DAG('stored graph', cfg_plot_mode=None)
+        for node in ['A', 'B', 'C', 'D', 'E', 'F']:
+            dag.add_node(node, calibrate_function=cal_True)
+        dag.set_node_attribute('A', 'qubit', 'q0')
+        dag.set_node_state('F', 'good')
+        for u, v in ['CA', 'CB', 'BA', 'DA', 'ED']:
+            dag.add_edge(u, v)
+        dag.set_node_state('B', 'needs calibration')
+        write_store(dag, self.filename)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_graph_store(self):
+        with GraphStore(self.filename, mode='r') as store:
+            self.assertEqual(len(store), 6)
+            self.assertEqual(store.name, 'stored graph')
+            self.assertIn('E', store)
+            self.assertNotIn('G', store)
+            self.assertEqual(store.get_state('B'), 'needs calibration')
+            self.assertEqual(
+                {store.node_name(i) for i in store.closure(['C'])},
+                {'A', 'B', 'C'})
+            attributes = store.node_attributes(store.node_id('A'))
+            self.assertEqual(attributes['qubit'], 'q0')
+            self.assertEqual(attributes['calibrate_function'], cal_True)
+            with self.assertRaises(PermissionError):
+                store.set_state(0, 'good', attributes['last_update'])
+
+    def test_lazy_graph(self):
+        dag = open_graph(self.filename)
+        self.assertEqual(len(dag), 0)
+        self.assertEqual(dag.maintain_node('C', verbose=False), 'good')
+        self.assertEqual(set(dag.nodes), {'A', 'B', 'C'})
+        self.assertEqual(set(dag.adj['C']), {'A', 'B'})
+        self.assertEqual(dag.nodes['A']['qubit'], 'q0')
+        self.assertEqual(dag.get_node_state('F'), 'good')
+        self.assertEqual(len(dag), 4)
+        with self.assertRaises(TypeError):
+            pickle.dumps(dag)
+        dag.store.close()
+
+        # state changes are written to the store
+        with GraphStore(self.filename, mode='r') as store:
+            self.assertEqual(store.get_state('B'), 'good')
+            self.assertEqual(store.get_state('D'), 'unknown')
+
+    def test_lazy_graph_accessors(self):
+        dag = open_graph(self.filename)
+        dag.set_node_state('E', 'good')
+        self.assertEqual(set(dag.nodes), {'A', 'D', 'E'})
+        self.assertEqual(dag.get_node_attribute('A', 'qubit'), 'q0')
+        dag.set_node_attribute('F', 'qubit', 'q1')
+        self.assertEqual(dag.nodes['F']['qubit'], 'q1')
+        dag.set_node_description('C', 'pulse amplitude')
+        self.assertEqual(dag.nodes['C']['description'], 'pulse amplitude')
+        with self.assertRaises(KeyError):
+            dag.set_node_state('G', 'good')
+        dag.store.close()
+        with GraphStore(self.filename, mode='r') as store:
+            self.assertEqual(store.get_state('E'), 'good')
+
+    def test_lazy_graph_query(self):
+        dag = open_graph(self.filename)
+        dag.add_index('state')
+        self.assertEqual(dag.query(state='unknown'), {'A', 'C', 'D', 'E'})
+        self.assertEqual(len(dag), 6)
+        self.assertEqual(dag.query(qubit='q0'), {'A'})
+        dag.store.close()
+
+    def test_lazy_graph_copy(self):
+        dag = open_graph(self.filename)
+        dag.load(['C'])
+        graph = dag.copy()
+        self.assertIs(type(graph), AutoDepGraph_DAG)
+        self.assertEqual(set(graph.nodes), {'A', 'B', 'C'})
+        # copies are not backed by the store
+        graph.set_node_state('B', 'bad')
+        self.assertEqual(dag.get_node_state('B'), 'needs calibration')
+        self.assertEqual(dag.store.get_state('B'), 'needs calibration')
+        with self.assertRaises(KeyError):
+            graph.get_node_state('D')
+        pickle.loads(pickle.dumps(dag.subgraph(['A', 'B']).copy()))
+        dag.store.close()
@@ -16,6 +16,65 @@ pyqtgraph_symbol_map = {'normal': 'o',              # a circle
 dot_type_symbol_map = {'normal': 'circle',              # a circle
                        'manual_cal': 'hexagon', }        # a hexagon
 
+# States ordered from best to worst, used to color clusters of nodes
+state_severity = ['good', 'unknown', 'active', 'needs calibration', 'bad']
+
+
+def worst_state(states) -> str:
+    """ Return the worst of the states according to state_severity """
+    return max(states, key=state_severity.index, default='unknown')
+
+
+def cluster_graph(nxG, cluster_by: str, expanded=(), node_attrs=None):
+    """
+    Creates a graph in which all nodes that have the same value for the
+    cluster_by attribute are aggregated into a single node.
+
+    Args:
+        nxG: graph to cluster
+        cluster_by: node attribute used to group nodes, nodes without this
+            attribute are not clustered
+        expanded: values of cluster_by for which the nodes are not
+            aggregated
+        node_attrs: function returning the attributes of a node, including
+            its 'state'. Defaults to the node data of nxG.
+    Returns:
+        nx.DiGraph with the individual and aggregated nodes. Aggregated
+        nodes are named "<cluster_by>: <value>" and colored by the worst
+        state of their members.
+    """
+    if node_attrs is None:
+        node_attrs = nxG.nodes.__getitem__
+    expanded = set(expanded)
+
+    cluster_of = {}
+    clusters = {}
+    clustered = nx.DiGraph()
+    for node, data in nxG.nodes(data=True):
+        value = data.get(cluster_by, None)
+        if value is None or value in expanded:
+            cluster_of[node] = node
+            clustered.add_node(node, **node_attrs(node))
+        else:
+            cluster = '{}: {}'.format(cluster_by, value)
+            cluster_of[node] = cluster
+            clusters.setdefault(cluster, []).append(
+                node_attrs(node)['state'])
+
+    for cluster, states in clusters.items():
+        color = state_cmap[worst_state(states)]
+        clustered.add_node(cluster, state=worst_state(states),
+                           members=len(states),
+                           label='{}\n({} nodes)'.format(cluster, len(states)),
+                           shape='box', style='filled', fixedsize='false',
+                           color=color, fillcolor=color)
+
+    for u, v in nxG.edges():
+        cu, cv = cluster_of[u], cluster_of[v]
+        if cu != cv:
+            clustered.add_edge(cu, cv)
+    return clustered
+
 
 def draw_graph_svg(nxG, filename: str):
     """
@@ -26,3 +85,9 @@ def draw_graph_svg(nxG, filename: str):
     """
     gvG = nx.nx_agraph.to_agraph(nxG)
     gvG.draw(filename, prog='dot')
+
+
+def render_graph_svg(nxG) -> bytes:
+    """ Lays out a graph using graphviz and returns the svg """
+    gvG = nx.nx_agraph.to_agraph(nxG)
+    return gvG.draw(format='svg', prog='dot')
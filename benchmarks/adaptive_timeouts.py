@@ -0,0 +1,110 @@
+"""
+Drift simulator comparing static timeouts with adaptive timeouts
+(AutoDepGraph_DAG.cfg_adaptive_timeouts).
+
+Every node drifts linearly (plus noise) away from its calibrated value and
+is checked using check_node whenever its timeout (node_timeout) expires. A
+node that is found out of tolerance is recalibrated using calibrate_node.
+The time a node spent out of tolerance before it was checked is time in
+which it was wrongly considered valid. Checks that find a node within
+tolerance are counted as wasted.
+
+The check and calibration functions are simulated by a node function
+backend and the history is recorded with a simulated clock.
+
+Usage: python benchmarks/adaptive_timeouts.py
+"""
+from unittest import mock
+
+import numpy as np
+from autodepgraph import AutoDepGraph_DAG, history
+
+hour = 3600
+day = 24*hour
+
+
+class Clock:
+    """ Simulated time in seconds, replaces the clock of the history """
+
+    def __init__(self):
+        self.t = 0.
+
+    def time(self) -> float:
+        return self.t
+
+
+class DriftBackend:
+    """
+    Node function backend simulating nodes whose check value drifts away
+    from zero after a calibration, see AutoDepGraph_DAG.node_function_backend
+    """
+
+    def __init__(self, clock: Clock, noise: float, seed: int):
+        self.clock = clock
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.rates = {}
+        self.calibrated = {}
+
+    def call(self, node, kind, function, args, run):
+        t = self.clock.t
+        if kind == 'calibrate':
+            self.calibrated[node] = t
+            return True, 0.
+        value = (self.rates[node]*(t - self.calibrated[node]) +
+                 self.noise*self.rng.standard_normal())
+        return float(value), 0.
+
+
+def simulate(rates, timeout, adaptive, duration=14*day, tolerance=1.,
+             noise=.02, seed=0):
+    clock = Clock()
+    backend = DriftBackend(clock, noise, seed)
+    dag = AutoDepGraph_DAG('drift simulator', cfg_plot_mode=None)
+    dag.cfg_timeout_min = 10*60
+    dag.cfg_timeout_max = 2*day
+    dag.cfg_adaptive_timeouts = adaptive
+    dag.node_function_backend = backend
+    result = {'checks': 0, 'wasted': 0, 'recalibrations': 0,
+              'out of tolerance': 0.}
+    with mock.patch.object(history, 'time', clock):
+        for i, rate in enumerate(rates):
+            node = 'N{}'.format(i)
+            dag.add_node(node, tolerance=tolerance, timeout=timeout)
+            backend.rates[node] = rate
+            clock.t = 0.
+            dag.calibrate_node(node)
+            while True:
+                clock.t += dag.node_timeout(node)
+                if clock.t > duration:
+                    break
+                result['checks'] += 1
+                if dag.check_node(node) == 'good':
+                    result['wasted'] += 1
+                    continue
+                result['recalibrations'] += 1
+                result['out of tolerance'] += clock.t - (
+                    backend.calibrated[node] + tolerance/rate)
+                dag.calibrate_node(node)
+    node_time = len(rates)*duration
+    result['out of tolerance'] = 100*result['out of tolerance']/node_time
+    return result
+
+
+def main():
+    # tolerance crossed after: never, 3 days, 12 hours and 4 hours
+    rates = [0.]*10 + [1/(3*day)]*5 + [1/(12*hour)]*3 + [1/(4*hour)]*2
+    policies = {'static 1 h': (hour, False),
+                'static 12 h': (12*hour, False),
+                'adaptive': (10*60, True)}
+    print('{:<14}{:>10}{:>10}{:>16}{:>20}'.format(
+        'policy', 'checks', 'wasted', 'recalibrations', 'out of tol. (%)'))
+    for name, (timeout, adaptive) in policies.items():
+        r = simulate(rates, timeout, adaptive)
+        print('{:<14}{:>10}{:>10}{:>16}{:>20.2f}'.format(
+            name, r['checks'], r['wasted'], r['recalibrations'],
+            r['out of tolerance']))
+
+
+if __name__ == '__main__':
+    main()
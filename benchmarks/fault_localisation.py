@@ -0,0 +1,84 @@
+"""
+Compares the number of checks needed to repair a single broken dependency
+using the exhaustive strategy of maintain_node with the bisection based
+fault localisation (cfg_fault_localisation = 'bisect').
+
+A check fails if the node or any of its dependencies is broken, a
+calibration repairs the node.
+
+Usage: python benchmarks/fault_localisation.py
+"""
+import random
+import warnings
+import networkx as nx
+from autodepgraph import AutoDepGraph_DAG
+
+
+def chain_graph(n):
+    return [('N{}'.format(i), 'N{}'.format(i+1)) for i in range(n-1)]
+
+
+def layered_graph(layers, width, fan_in=2, seed=0):
+    rng = random.Random(seed)
+    edges = []
+    for layer in range(layers-1):
+        for i in range(width):
+            for j in rng.sample(range(width), fan_in):
+                edges.append(('L{}_{}'.format(layer, i),
+                              'L{}_{}'.format(layer+1, j)))
+    return edges
+
+
+def tree_graph(depth):
+    return [('T{}'.format(i), 'T{}'.format(2*i+k)) for i in
+            range(1, 2**(depth-1)) for k in range(2)]
+
+
+def run(edges, target, broken, strategy):
+    dag = AutoDepGraph_DAG('benchmark', cfg_plot_mode=None)
+    dag.cfg_fault_localisation = strategy
+    nodes = {n for e in edges for n in e}
+    faults = {broken}
+
+    def make_check(node):
+        def check():
+            deps = nx.descendants(dag, node) | {node}
+            return 0.0 if deps.isdisjoint(faults) else 1.0
+        return check
+
+    def make_calibration(node):
+        def calibrate():
+            if (nx.descendants(dag, node) & faults):
+                return False
+            faults.discard(node)
+            return True
+        return calibrate
+
+    for node in sorted(nodes):
+        dag.add_node(node, tolerance=.5, state='good',
+                     check_function=make_check(node),
+                     calibrate_function=make_calibration(node))
+    dag.add_edges_from(edges)
+    # the target was found to be bad, triggering the fault localisation
+    dag.set_node_state(target, 'bad')
+    dag.maintain_node(target, verbose=False)
+    return dag._check_cnt, dag._calib_cnt
+
+
+def main():
+    benchmarks = {'chain 64': (chain_graph(64), 'N0', 'N60'),
+                  'binary tree depth 7': (tree_graph(7), 'T1', 'T100'),
+                  'layered 8x8': (layered_graph(8, 8), 'L0_0', 'L7_3')}
+    print('{:<22}{:>18}{:>18}{:>12}'.format(
+        'graph', 'exhaustive checks', 'bisect checks', 'saved'))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        for name, (edges, target, broken) in benchmarks.items():
+            exhaustive, _ = run(edges, target, broken, 'exhaustive')
+            bisect, _ = run(edges, target, broken, 'bisect')
+            print('{:<22}{:>18}{:>18}{:>12}'.format(
+                name, exhaustive, bisect, exhaustive-bisect))
+
+
+if __name__ == '__main__':
+    main()
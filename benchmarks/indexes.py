@@ -0,0 +1,41 @@
+"""
+Times filtered node queries using secondary indexes (AutoDepGraph_DAG.query)
+on a large graph.
+
+Usage: python benchmarks/indexes.py
+"""
+import random
+import timeit
+from autodepgraph import AutoDepGraph_DAG
+
+
+def main(n_nodes=50000, n_qubits=17, seed=0):
+    rng = random.Random(seed)
+    dag = AutoDepGraph_DAG('benchmark', cfg_plot_mode=None)
+    instruments = ['AWG{}'.format(i) for i in range(8)] + ['VNA', 'UHFQC']
+    for i in range(n_nodes):
+        dag.add_node('N{}'.format(i),
+                     qubit='Q{}'.format(rng.randrange(n_qubits)),
+                     calibrate_function='{}.calibrate'.format(
+                         rng.choice(instruments)),
+                     state=rng.choice(['good', 'needs calibration', 'bad']),
+                     timeout=3600)
+    for name in ['state', 'qubit', 'instrument']:
+        dag.add_index(name)
+
+    queries = {'qubit': dict(qubit='Q2'),
+               'qubit, state': dict(qubit='Q2', state='needs calibration'),
+               'qubit, instrument': dict(qubit='Q2', instrument='VNA'),
+               'qubit, state, instrument': dict(
+                   qubit='Q2', state='bad', instrument='VNA')}
+    print('{} nodes'.format(n_nodes))
+    print('{:<28}{:>10}{:>14}'.format('query', 'results', 'time (ms)'))
+    for name, criteria in queries.items():
+        number = 100
+        t = timeit.timeit(lambda: dag.query(**criteria), number=number)
+        print('{:<28}{:>10}{:>14.3f}'.format(
+            name, len(dag.query(**criteria)), 1e3*t/number))
+
+
+if __name__ == '__main__':
+    main()
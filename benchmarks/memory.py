@@ -0,0 +1,44 @@
+"""
+Reports the memory used per node of an AutoDepGraph_DAG, both directly
+after adding the nodes and after the graph has been drawn.
+
+Usage: python benchmarks/memory.py [number of nodes]
+"""
+import sys
+import gc
+import tracemalloc
+from autodepgraph import AutoDepGraph_DAG
+
+
+def build(n_nodes):
+    dag = AutoDepGraph_DAG('benchmark', cfg_plot_mode=None)
+    for i in range(n_nodes):
+        dag.add_node('node {}'.format(i))
+        if i:
+            dag.add_edge('node {}'.format(i), 'node {}'.format(i // 2))
+    return dag
+
+
+def main(n_nodes=100000):
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    dag = build(n_nodes)
+    gc.collect()
+    added = tracemalloc.get_traced_memory()[0]
+    # drawing used to store the drawing attributes in the nodes
+    if hasattr(dag, '_update_drawing_attrs'):
+        dag._update_drawing_attrs()
+    gc.collect()
+    drawn = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('{} nodes'.format(n_nodes))
+    print('bytes per node after add_node: {:.0f}'.format(
+        (added-start)/n_nodes))
+    print('bytes per node after drawing:  {:.0f}'.format(
+        (drawn-start)/n_nodes))
+    return dag
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,52 @@
+"""
+Times maintaining a graph made of independent components in one process
+and using a worker process per component (autodepgraph.parallel).
+
+Usage: python benchmarks/parallel.py [number of components] [processes]
+"""
+import sys
+import time
+from autodepgraph import AutoDepGraph_DAG
+from autodepgraph.parallel import maintain_components
+
+cal_True = ('autodepgraph.node_functions.calibration_functions'
+            '.test_calibration_True')
+check_delayed = ('autodepgraph.node_functions.check_functions'
+                 '.test_check_delayed')
+
+
+def build(n_components, n_steps=3):
+    dag = AutoDepGraph_DAG('benchmark', cfg_plot_mode=None)
+    for i in range(n_components):
+        for step in range(n_steps):
+            dag.add_node('line {} step {}'.format(i, step),
+                         calibrate_function=cal_True,
+                         check_function=check_delayed, tolerance=2,
+                         state='bad')
+            if step:
+                dag.add_edge('line {} step {}'.format(i, step),
+                             'line {} step {}'.format(i, step-1))
+    return dag
+
+
+def main(n_components=8, processes=4):
+    roots = ['line {} step 2'.format(i) for i in range(n_components)]
+
+    dag = build(n_components)
+    t0 = time.perf_counter()
+    for node in roots:
+        dag.maintain_node(node, verbose=False)
+    t_serial = time.perf_counter() - t0
+
+    dag = build(n_components)
+    result = maintain_components(dag, processes=processes)
+    assert all(state == 'good' for state in result['states'].values())
+
+    print('{} components of 3 nodes, checks take 0.2 s'.format(n_components))
+    print('single process:     {:8.2f} s'.format(t_serial))
+    print('{} worker processes: {:8.2f} s'.format(processes,
+                                                  result['duration']))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
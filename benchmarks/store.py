@@ -0,0 +1,62 @@
+"""
+Times opening a memory-mapped graph store (autodepgraph.store) and
+maintaining a single node of it, compared to unpickling the whole graph.
+
+Usage: python benchmarks/store.py [number of nodes]
+"""
+import os
+import pickle
+import sys
+import tempfile
+import time
+from autodepgraph import AutoDepGraph_DAG
+from autodepgraph.store import open_graph, write_store
+
+cal_True = ('autodepgraph.node_functions.calibration_functions'
+            '.test_calibration_True')
+
+
+def build(n_nodes):
+    dag = AutoDepGraph_DAG('benchmark', cfg_plot_mode=None)
+    for i in range(n_nodes):
+        dag.add_node('node {}'.format(i), calibrate_function=cal_True,
+                     tolerance=2)
+        if i:
+            dag.add_edge('node {}'.format(i), 'node {}'.format(i // 2))
+    return dag
+
+
+def main(n_nodes=1000000):
+    dag = build(n_nodes)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_file = os.path.join(tmp_dir, 'graph.adg')
+        pickle_file = os.path.join(tmp_dir, 'graph.pickle')
+        write_store(dag, store_file)
+        with open(pickle_file, 'wb') as f:
+            pickle.dump(dag, f)
+        del dag
+
+        t0 = time.perf_counter()
+        with open(pickle_file, 'rb') as f:
+            pickle.load(f)
+        t_pickle = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        lazy_dag = open_graph(store_file)
+        t_open = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        lazy_dag.maintain_node('node {}'.format(n_nodes-1), verbose=False)
+        t_maintain = time.perf_counter() - t0
+        loaded = len(lazy_dag)
+        lazy_dag.store.close()
+
+        print('{} nodes, store of {:.1f} MB'.format(
+            n_nodes, os.path.getsize(store_file)/1e6))
+        print('loading the pickled graph:  {:10.3f} s'.format(t_pickle))
+        print('opening the store:          {:10.3f} s'.format(t_open))
+        print('maintaining the last node:  {:10.3f} s ({} nodes '
+              'loaded)'.format(t_maintain, loaded))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
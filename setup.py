@@ -41,7 +41,7 @@ test_requirements = ['pytest>=3',]
 
 setup(name='autodepgraph',
       version=get_version(),
-      python_requires='>=3.6',
+      python_requires='>=3.7',
       description='Framework for automated calibrations based on a directed acyclic graph.',
       long_description=readme + '\n\n' + history,
       long_description_content_type='text/markdown',
@@ -57,7 +57,6 @@ setup(name='autodepgraph',
       keywords=['graph', 'calibration framework'],
       url='https://gitlab.com/AdriaanRol/AutoDepGraph',
       classifiers=['Development Status :: 4 - Beta', 'Intended Audience :: Science/Research',
-                   'Programming Language :: Python :: 3.6',
                    'Programming Language :: Python :: 3.7',
                    'Programming Language :: Python :: 3.8',
                    'License :: OSI Approved :: MIT License',